@@ -1,7 +1,8 @@
 """
 Usage:
     blurr validate [--debug] [<BTS> ...]
-    blurr transform [--debug] [--runner=<runner>] [--streaming-bts=<bts-file>] [--window-bts=<bts-file>] [--data-processor=<data-processor>] (--source=<raw-json-files> | <raw-json-files>)
+    blurr projection [--debug] <BTS> ...
+    blurr transform [--debug] [--runner=<runner>] [--workers=<count>] [--memory-budget=<mb>] [--presorted] [--compiled] [--batch-windows] [--streaming-bts=<bts-file>] [--window-bts=<bts-file>] [--data-processor=<data-processor>] (--source=<raw-json-files> | <raw-json-files>)
     blurr package-spark [--debug] [--source-dir=<dir>] [--target=<zip-file>]
     blurr -h | --help
 
@@ -18,6 +19,10 @@ Commands:
                     3. Both streaming and window BTS are provided - Transform
                     outputs the final result of applying the streaming and window
                     BTS on the raw data file.
+    projection      Prints the source fields that the streaming BTS reads. The
+                    transform command drops all other fields when the raw data
+                    is decoded. Use --debug to print the fields and aggregate
+                    fields read by each expression.
     package-spark   Generates a submittable Spark app with .zip extension. Requires a
                     requirements.txt inside --source-dir. The generated package
                     will contain all the python code inside the provided --source-dir,
@@ -31,6 +36,21 @@ Options:
                                 Possible values:
                                 local - Transforms done in memory. <default>
                                 spark - Transforms done using spark locally.
+    --workers=<count>           Number of processes used by the local runner. Identities
+                                are sharded across the processes. Cannot be combined
+                                with --memory-budget or --presorted. [default: 1]
+    --memory-budget=<mb>        Megabytes of records the local runner holds in memory.
+                                Records beyond the budget are sorted by identity and time
+                                in temporary files and merged during execution.
+    --presorted                 Trust that the source files are grouped by identity and
+                                sorted by time. Each identity is processed and written
+                                out as soon as its records end. Fails if the order is
+                                violated.
+    --compiled                  Evaluate the streaming BTS with Python code generated
+                                from the BTS instead of interpreting each expression.
+    --batch-windows             Evaluate the window BTS for all the anchors of an
+                                identity at once. Requires numpy, installed with
+                                'pip install blurr[numpy]'.
     --streaming-bts=<bts-file>  Streaming BTS file to use.
     --window-bts=<bts-file>     Window BTS file to use.
     --source=<raw-json-files>   List of source files separated by comma
@@ -1,6 +1,7 @@
 from typing import Dict, Any
 
 from blurr.cli.package_spark import package_spark
+from blurr.cli.projection import projection_command
 from blurr.cli.transform import transform
 from blurr.cli.validate import validate_command
 
@@ -15,6 +16,11 @@ def cli(arguments: Dict[str, Any]) -> int:
         elif arguments['<raw-json-files>'] is not None:
             source = arguments['<raw-json-files>'].split(',')
         return transform(arguments['--runner'], arguments['--streaming-bts'],
-                         arguments['--window-bts'], arguments['--data-processor'], source)
+                         arguments['--window-bts'], arguments['--data-processor'], source,
+                         arguments.get('--workers', None), arguments.get('--memory-budget', None),
+                         arguments.get('--presorted', False), arguments.get('--compiled', False),
+                         arguments.get('--batch-windows', False))
+    elif arguments.get('projection', False):
+        return projection_command(arguments['<BTS>'])
     elif arguments['package-spark']:
         return package_spark(arguments['--source-dir'], arguments['--target'])
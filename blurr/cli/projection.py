@@ -0,0 +1,65 @@
+from typing import List, Optional, Set
+
+import yaml
+from smart_open import smart_open
+
+from blurr.cli.util import eprint, is_streaming_bts
+from blurr.core import logging
+from blurr.core.dependency import DependencyGraph
+from blurr.core.schema_loader import SchemaLoader
+
+
+def projection_command(bts_files: List[str]) -> int:
+    all_files_projected = True
+    for bts_file in bts_files:
+        if print_projection(bts_file) == 1:
+            all_files_projected = False
+
+    return 0 if all_files_projected else 1
+
+
+def print_projection(bts_file: str) -> int:
+    try:
+        bts_dict = yaml.safe_load(open(bts_file, 'r', encoding='utf-8'))
+        if not isinstance(bts_dict, dict) or not is_streaming_bts(bts_dict):
+            eprint('{} is not a streaming BTS.'.format(bts_file))
+            return 1
+        dependency_graph = get_dependency_graph(bts_dict)
+    except Exception as err:
+        eprint('There was an error parsing the document. Error:\n' + str(err))
+        return 1
+
+    for name, fields in dependency_graph.field_dependencies.items():
+        logging.debug('{} reads source fields {} and aggregate fields {}'.format(
+            name, sorted(dependency_graph.source_dependencies[name]), sorted(fields)))
+
+    projection = dependency_graph.source_projection
+    if projection is None:
+        print('All source fields are read by {} through {}'.format(
+            bts_file, ', '.join(sorted(dependency_graph.unprojectable_elements))))
+        return 0
+
+    print('Source fields read by {}:'.format(bts_file))
+    for field in sorted(projection):
+        print(field)
+    return 0
+
+
+def get_dependency_graph(bts_dict: dict) -> DependencyGraph:
+    schema_loader = SchemaLoader()
+    bts_name = schema_loader.add_schema_spec(bts_dict)
+    schema_loader.get_schema_object(bts_name)
+    schema_loader.raise_errors()
+    return schema_loader.get_dependency_graph(bts_name)
+
+
+def get_source_projection(stream_bts_file: str) -> Optional[Set[str]]:
+    """
+    Returns the source fields read by the streaming BTS. None if all the fields can be read or the
+    BTS cannot be analyzed, in which case the runner reports the errors in the BTS.
+    """
+    try:
+        return get_dependency_graph(yaml.safe_load(smart_open(stream_bts_file))).source_projection
+    except Exception as err:
+        logging.debug('Source fields are not projected. Error: {}'.format(err))
+        return None
@@ -1,7 +1,10 @@
 from typing import List, Optional
 
+from blurr.cli.projection import get_source_projection
 from blurr.cli.util import get_stream_window_bts_files, get_yml_files, eprint
 from blurr.cli.validate import get_valid_yml_files
+from blurr.core.errors import RecordOrderError
+from blurr.core.window_array import require_numpy
 from blurr.runner.data_processor import IpfixDataProcessor, SimpleJsonDataProcessor, DataProcessor
 from blurr.runner.local_runner import LocalRunner
 from blurr.runner.spark_runner import SparkRunner
@@ -14,8 +17,16 @@ RUNNER_CLASS = {
 DATA_PROCESSOR_CLASS = {'ipfix': IpfixDataProcessor, 'simple': SimpleJsonDataProcessor}
 
 
-def transform(runner: Optional[str], stream_bts_file: Optional[str], window_bts_file: Optional[str],
-              data_processor: Optional[str], raw_json_files: List[str]) -> int:
+def transform(runner: Optional[str],
+              stream_bts_file: Optional[str],
+              window_bts_file: Optional[str],
+              data_processor: Optional[str],
+              raw_json_files: List[str],
+              workers: Optional[str] = None,
+              memory_budget: Optional[str] = None,
+              presorted: bool = False,
+              compiled: bool = False,
+              batch_windows: bool = False) -> int:
     if stream_bts_file is None and window_bts_file is None:
         stream_bts_file, window_bts_file = get_stream_window_bts_files(
             get_valid_yml_files(get_yml_files()))
@@ -40,27 +51,86 @@ def transform(runner: Optional[str], stream_bts_file: Optional[str], window_bts_
             runner, list(DATA_PROCESSOR_CLASS.keys())))
         return 1
 
-    data_processor_obj = DATA_PROCESSOR_CLASS[data_processor]()
+    if workers is None:
+        workers = '1'
+
+    if not workers.isdigit() or int(workers) < 1:
+        eprint('Invalid workers: \'{}\'. Must be a positive integer.'.format(workers))
+        return 1
+
+    if memory_budget is not None and (not memory_budget.isdigit() or int(memory_budget) < 1):
+        eprint('Invalid memory-budget: \'{}\'. Must be a positive integer.'.format(memory_budget))
+        return 1
+
+    # Sorted input is streamed through the current process one identity at a time
+    if int(workers) > 1 and (presorted or memory_budget is not None):
+        eprint('workers cannot be combined with {}. Sorted input is executed in one '
+               'process.'.format('presorted' if presorted else 'memory-budget'))
+        return 1
+
+    if batch_windows:
+        try:
+            require_numpy()
+        except ImportError:
+            eprint('batch-windows requires numpy. Install it with \'pip install blurr[numpy]\'.')
+            return 1
+
+    # Source fields that the streaming BTS does not read are dropped when the data is decoded
+    data_processor_obj = DATA_PROCESSOR_CLASS[data_processor](
+        get_source_projection(stream_bts_file))
     if runner == 'local':
-        return transform_local(stream_bts_file, window_bts_file, raw_json_files, data_processor_obj)
+        return transform_local(stream_bts_file, window_bts_file, raw_json_files, data_processor_obj,
+                               int(workers),
+                               int(memory_budget) if memory_budget is not None else None,
+                               presorted, compiled, batch_windows)
     else:
-        return transform_spark(stream_bts_file, window_bts_file, raw_json_files, data_processor_obj)
+        return transform_spark(stream_bts_file, window_bts_file, raw_json_files, data_processor_obj,
+                               compiled, batch_windows)
 
 
-def transform_spark(stream_bts_file: Optional[str], window_bts_file: Optional[str],
-                    raw_json_files: List[str], data_processor: DataProcessor) -> int:
-    runner = SparkRunner(stream_bts_file, window_bts_file)
+def transform_spark(stream_bts_file: Optional[str],
+                    window_bts_file: Optional[str],
+                    raw_json_files: List[str],
+                    data_processor: DataProcessor,
+                    compiled: bool = False,
+                    batch_windows: bool = False) -> int:
+    runner = SparkRunner(stream_bts_file, window_bts_file, compiled, batch_windows)
     out = runner.execute(runner.get_record_rdd_from_json_files(raw_json_files, data_processor))
     runner.print_output(out)
 
     return 0
 
 
-def transform_local(stream_bts_file: Optional[str], window_bts_file: Optional[str],
-                    raw_json_files: List[str], data_processor: DataProcessor) -> int:
-    runner = LocalRunner(stream_bts_file, window_bts_file)
-    out = runner.execute(
-        runner.get_identity_records_from_json_files(raw_json_files, data_processor))
+def transform_local(stream_bts_file: Optional[str],
+                    window_bts_file: Optional[str],
+                    raw_json_files: List[str],
+                    data_processor: DataProcessor,
+                    workers: int = 1,
+                    memory_budget_mb: Optional[int] = None,
+                    presorted: bool = False,
+                    compiled: bool = False,
+                    batch_windows: bool = False) -> int:
+    runner = LocalRunner(stream_bts_file, window_bts_file, workers, compiled, batch_windows)
+    if presorted:
+        # Each identity is written out as soon as it has been processed.
+        try:
+            for identity, data in runner.iter_execute_sorted(
+                    runner.get_presorted_identity_records_from_json_files(
+                        raw_json_files, data_processor)):
+                runner.print_output({identity: data})
+        except RecordOrderError as err:
+            eprint(str(err))
+            return 1
+        return 0
+
+    if memory_budget_mb:
+        # External sort streams the identities one at a time in the current process.
+        out = runner.execute_sorted(
+            runner.get_sorted_identity_records_from_json_files(
+                raw_json_files, data_processor, memory_budget_mb * 1024 * 1024))
+    else:
+        out = runner.execute(
+            runner.get_identity_records_from_json_files(raw_json_files, data_processor))
     runner.print_output(out)
 
     return 0
@@ -1,10 +1,10 @@
 from abc import ABC, abstractmethod, abstractproperty
-from typing import Dict, Type, Any
+from typing import Dict, Type, Any, Callable, List, Optional
 
 from blurr.core.base import BaseSchemaCollection, BaseItemCollection, BaseItem
 from blurr.core.errors import MissingAttributeError
 from blurr.core.evaluation import EvaluationContext
-from blurr.core.field import Field
+from blurr.core.field import ComplexTypeBase, Field
 from blurr.core.loader import TypeLoader
 from blurr.core.schema_loader import SchemaLoader
 from blurr.core.store import StoreSchema, Store
@@ -76,6 +76,34 @@ class Aggregate(BaseItemCollection, ABC):
         if self._schema.store_schema:
             self._store = self._schema.schema_loader.get_store(
                 self._schema.store_schema.fully_qualified_name)
+        self._compiled_evaluate: Optional[Callable[[], None]] = None
+        self._compiled_evaluate_dimensions: Optional[Callable[[], bool]] = None
+
+        # Snapshot and key of the state last restored from the store. Fields that are the same as
+        # in the restored snapshot are not written to the store again.
+        self._restored_snapshot: Optional[Dict[str, Any]] = None
+        self._restored_key: Optional[Key] = None
+
+    def run_compile(self, compiled_aggregate: 'CompiledAggregate',
+                    aggregates: Dict[str, 'Aggregate']) -> None:
+        """
+        Replaces the interpreted evaluation of the fields with the functions generated for the
+        aggregate schema
+        :param compiled_aggregate: Generated evaluation code of the aggregate
+        :param aggregates: All the aggregates of the transformer by name
+        """
+        self._compiled_evaluate, self._compiled_evaluate_dimensions = compiled_aggregate.bind(
+            self, aggregates)
+
+    def run_evaluate(self) -> None:
+        """
+        Evaluates the fields of the aggregate. The generated evaluation function is used when one
+        has been provided through `run_compile`.
+        """
+        if self._compiled_evaluate is None:
+            super().run_evaluate()
+        else:
+            self._compiled_evaluate()
 
     @property
     def _nested_items(self) -> Dict[str, Field]:
@@ -84,6 +112,35 @@ class Aggregate(BaseItemCollection, ABC):
         """
         return self._fields
 
+    def run_restore(self, snapshot: Dict[str, Any]) -> 'Aggregate':
+        super().run_restore(snapshot)
+        self._restored_snapshot = snapshot
+        self._restored_key = self._key
+        return self
+
+    def run_restore_from(self, aggregate: 'Aggregate', snapshot: Dict[str, Any]) -> 'Aggregate':
+        """
+        Restores the state of the aggregate from a snapshot that another aggregate of the same
+        schema has been restored from, with the values of the other aggregate instead of decoding
+        the snapshot again. Complex values are copied, so that the other aggregate is not changed
+        and the copies can be changed when the values of the other aggregate are read-only.
+        :param aggregate: Aggregate restored from the snapshot.
+        :param snapshot: Snapshot the other aggregate has been restored from.
+        """
+        for name in snapshot:
+            value = aggregate._nested_items[name].value
+            field = self._nested_items[name]
+            field.value = field._schema.type_object(value) if isinstance(
+                value, ComplexTypeBase) else value
+        self._restored_snapshot = snapshot
+        self._restored_key = self._key
+        return self
+
+    def run_reset(self) -> None:
+        super().run_reset()
+        self._restored_snapshot = None
+        self._restored_key = None
+
     def run_finalize(self) -> None:
         """
         Saves the current state of the Aggregate in the store as the final rites
@@ -99,7 +156,27 @@ class Aggregate(BaseItemCollection, ABC):
         Persists the current data group
         """
         if self._store:
-            self._store.save(self._key, self._snapshot)
+            self._save(self._key)
+
+    def _save(self, key: Key) -> None:
+        """
+        Saves the current snapshot under the key. Nothing is written when no field has changed
+        since the snapshot was restored from the store, and only the changed fields are updated
+        otherwise.
+        :param key: Key under which the snapshot is saved
+        """
+        snapshot = self._snapshot
+        if self._restored_snapshot is None or key != self._restored_key:
+            self._store.save(key, snapshot)
+            return
+
+        changed_fields = self._get_changed_fields(snapshot)
+        if changed_fields:
+            self._store.update(key, snapshot, changed_fields)
+
+    def _get_changed_fields(self, snapshot: Dict[str, Any]) -> List[str]:
+        """ Returns the names of the fields whose snapshot differs from the restored snapshot """
+        return self._store.get_changed_fields(self._restored_snapshot, snapshot)
 
     def __getattr__(self, item: str) -> Any:
         """
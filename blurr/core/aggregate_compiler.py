@@ -0,0 +1,298 @@
+import ast
+import builtins
+import sys
+from types import CodeType, FunctionType
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from blurr.core import logging
+from blurr.core.aggregate import Aggregate
+from blurr.core.aggregate_identity import IdentityAggregate
+from blurr.core.dependency import get_bound_names, get_string_constant, is_record_attribute, \
+    SOURCE_NAME
+from blurr.core.evaluation import Expression, handle_evaluation_error
+from blurr.core.record import Record, wrap
+
+# Names that the streaming transformer replaces in the global context for every record.
+RECORD_CONTEXT_NAMES = {SOURCE_NAME, 'time'}
+
+
+def _get_record_attribute(record: Any, name: str) -> Any:
+    """ Returns `record.name`, reading a `Record` directly instead of through `__getattr__` """
+    if type(record) is Record:
+        value = dict.get(record, name)
+        return wrap(value) if isinstance(value, (dict, list)) else value
+    return getattr(record, name)
+
+
+def _get_record_item(record: Any, name: str) -> Any:
+    """ Returns `record[name]`, reading a `Record` directly instead of through `__getitem__` """
+    if type(record) is Record:
+        value = dict.get(record, name)
+        return wrap(value) if isinstance(value, (dict, list)) else value
+    return record[name]
+
+
+def _is_attribute(aggregate: Aggregate, name: str) -> bool:
+    """
+    Returns True if `name` is resolved on the aggregate object itself instead of being delegated to
+    a field by `Aggregate.__getattr__`.
+    """
+    return name in vars(aggregate) or hasattr(type(aggregate), name)
+
+
+class _ExpressionTransformer(ast.NodeTransformer):
+    """
+    Replaces the field reads `aggregate.field` and `aggregate['field']` in an expression with a
+    read of the value of the field object, which the generated code holds in a local variable.
+    Reads of the source record, `source.attribute` and `source['attribute']`, are replaced with
+    calls that bypass the dynamic attribute lookup of `Record`.
+    """
+
+    def __init__(self, aggregates: Dict[str, Aggregate], references: Dict[Tuple[str, str], str],
+                 replace_source: bool) -> None:
+        self._aggregates = aggregates
+        self._references = references
+        self._replace_source = replace_source
+
+    def visit_Attribute(self, node: ast.Attribute) -> ast.AST:
+        self.generic_visit(node)
+        if isinstance(node.value, ast.Name) and isinstance(node.ctx, ast.Load):
+            aggregate = self._aggregates.get(node.value.id, None)
+            if aggregate is not None and node.attr in aggregate._nested_items and not _is_attribute(
+                    aggregate, node.attr):
+                return self._get_field_value(node, node.value.id, node.attr)
+            if self._is_source(node.value) and not is_record_attribute(node.attr):
+                return self._get_record_value(node, '__record_attribute', node.attr)
+        return node
+
+    def visit_Subscript(self, node: ast.Subscript) -> ast.AST:
+        self.generic_visit(node)
+        if isinstance(node.value, ast.Name) and isinstance(node.ctx, ast.Load):
+            aggregate = self._aggregates.get(node.value.id, None)
+            name = get_string_constant(node.slice)
+            if aggregate is not None and name in aggregate._nested_items:
+                return self._get_field_value(node, node.value.id, name)
+            if self._is_source(node.value) and name is not None:
+                return self._get_record_value(node, '__record_item', name)
+        return node
+
+    def _is_source(self, node: ast.Name) -> bool:
+        return self._replace_source and node.id == SOURCE_NAME
+
+    @staticmethod
+    def _get_record_value(node: ast.AST, function: str, name: str) -> ast.AST:
+        call = ast.Call(
+            func=ast.Name(id=function, ctx=ast.Load()),
+            args=[ast.Name(id=SOURCE_NAME, ctx=ast.Load()),
+                  ast.Str(s=name) if sys.version_info < (3, 8) else ast.Constant(value=name)],
+            keywords=[])
+        for child in ast.walk(call):
+            ast.copy_location(child, node)
+        return call
+
+    def _get_field_value(self, node: ast.AST, aggregate_name: str, field_name: str) -> ast.AST:
+        key = (aggregate_name, field_name)
+        if key not in self._references:
+            self._references[key] = '__reference_{}'.format(len(self._references))
+
+        field = ast.copy_location(ast.Name(id=self._references[key], ctx=ast.Load()), node)
+        return ast.copy_location(ast.Attribute(value=field, attr='value', ctx=ast.Load()), node)
+
+
+class _PlaceholderTransformer(ast.NodeTransformer):
+    """ Replaces the placeholder names in the generated code with the expression trees """
+
+    def __init__(self, expressions: Dict[str, ast.AST]) -> None:
+        self._expressions = expressions
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        if node.id not in self._expressions:
+            return node
+
+        expression = self._expressions[node.id]
+        for child in ast.walk(expression):
+            ast.copy_location(child, node)
+        return expression
+
+
+class CompiledAggregate:
+    """
+    Evaluation of an aggregate generated as Python functions.
+
+    The `When` expression of the aggregate and the `When` and `Value` expressions of its fields
+    are inlined into one function, in the order in which the interpreter evaluates them. The
+    dimension fields of an `IdentityAggregate` are inlined into a second function. Reads of
+    aggregate fields in the expressions are replaced by reads of the field objects, which the
+    functions hold as local variables. Evaluation errors and type casting are handled in the same
+    way as `Expression.evaluate` and `Field.run_evaluate`, so the generated functions produce the
+    same field values as the interpreter.
+
+    The code is generated once for the schema and bound to the fields of each aggregate instance
+    using `bind`.
+    """
+
+    def __init__(self, aggregate: Aggregate, aggregates: Dict[str, Aggregate]) -> None:
+        """
+        Generates the evaluation code of an aggregate.
+        :param aggregate: Aggregate instance used to resolve the fields.
+        :param aggregates: All the aggregates of the transformer by name.
+        """
+        self._name = aggregate._name
+        self._field_names: List[str] = list(aggregate._nested_items.keys())
+        self._dimension_names: Optional[List[str]] = list(
+            aggregate._dimension_fields.keys()) if isinstance(aggregate,
+                                                              IdentityAggregate) else None
+
+        # Fields and dimension fields are numbered in one sequence in the generated code
+        self._schemas = [field._schema for field in aggregate._nested_items.values()]
+        if self._dimension_names is not None:
+            self._schemas.extend(aggregate._dimension_fields[name]._schema
+                                 for name in self._dimension_names)
+        self._types = [schema.type_object for schema in self._schemas]
+
+        # Only the aggregates that the expressions resolve from the global context can be replaced
+        global_context = aggregate._evaluation_context.global_context
+        self._aggregates = {
+            name: item
+            for name, item in aggregates.items()
+            if global_context.get(name, None) is item and name not in RECORD_CONTEXT_NAMES
+        }
+        self._references: Dict[Tuple[str, str], str] = {}
+        self._expressions: Dict[str, ast.AST] = {}
+        self._codes: List[str] = []
+
+        self.source_code = self._generate(aggregate._schema.when)
+        self._code = self._compile()
+
+    def _generate(self, when: Optional[Expression]) -> str:
+        """ Generates the code of the factory function with placeholders for the expressions """
+        indent = ' ' * 4
+        lines = ['def __evaluate():']
+        if when:
+            self._add_evaluation(lines, indent, '__when', when)
+            lines.extend([indent + 'if not __when:', indent + '    return'])
+
+        for index in range(len(self._field_names)):
+            schema = self._schemas[index]
+            lines.append(indent + '# {}'.format(schema.fully_qualified_name))
+            self._add_field_evaluation(lines, indent, index)
+            lines.extend(line.format(indent=indent, index=index) for line in [
+                '{indent}if __result is not None:',
+                '{indent}    if isinstance(__result, __type_{index}):',
+                '{indent}        __field_{index}.value = __result',
+                '{indent}    else:',
+                '{indent}        try:',
+                '{indent}            __field_{index}.value = __type_{index}(__result)',
+                '{indent}        except Exception as __error:',
+                '{indent}            __handle_cast_error(__error, __result, {index})',
+            ])
+        lines.append(indent + 'pass')
+
+        if self._dimension_names is None:
+            lines.append('__evaluate_dimensions = None')
+        else:
+            # Evaluation stops at the first dimension that cannot be evaluated
+            lines.append('def __evaluate_dimensions():')
+            for index in range(len(self._field_names), len(self._schemas)):
+                schema = self._schemas[index]
+                lines.append(indent + '# {}'.format(schema.fully_qualified_name))
+                self._add_field_evaluation(lines, indent, index)
+                lines.extend(line.format(indent=indent, index=index) for line in [
+                    '{indent}if __result is None:',
+                    '{indent}    return False',
+                    '{indent}if isinstance(__result, __type_{index}):',
+                    '{indent}    __field_{index}.value = __result',
+                    '{indent}else:',
+                    '{indent}    try:',
+                    '{indent}        __field_{index}.value = __type_{index}(__result)',
+                    '{indent}    except Exception as __error:',
+                    '{indent}        __handle_cast_error(__error, __result, {index})',
+                    '{indent}        return False',
+                ])
+            lines.append(indent + 'return True')
+
+        header = [
+            'def __factory(__fields, __references, __types, __codes, __handle_error, '
+            '__handle_cast_error, __record_attribute, __record_item):'
+        ]
+        for index in range(len(self._schemas)):
+            header.append(indent + '__field_{index} = __fields[{index}]'.format(index=index))
+            header.append(indent + '__type_{index} = __types[{index}]'.format(index=index))
+        for index, variable in enumerate(self._references.values()):
+            header.append(indent + '{} = __references[{}]'.format(variable, index))
+
+        return '\n'.join(header + [indent + line for line in lines] +
+                         [indent + 'return __evaluate, __evaluate_dimensions'])
+
+    def _add_field_evaluation(self, lines: List[str], indent: str, index: int) -> None:
+        """
+        Adds the statements that assign the result of the field `Value` to `__result`. The result
+        is None when the field `When` evaluates to False.
+        """
+        schema = self._schemas[index]
+        if not schema.when:
+            self._add_evaluation(lines, indent, '__result', schema.value)
+            return
+
+        self._add_evaluation(lines, indent, '__when', schema.when)
+        lines.extend([indent + '__result = None', indent + 'if __when:'])
+        self._add_evaluation(lines, indent * 2, '__result', schema.value)
+
+    def _add_evaluation(self, lines: List[str], indent: str, target: str,
+                        expression: Expression) -> None:
+        """ Adds the statements that assign the result of an expression to the target variable """
+        tree = ast.parse(expression.code_string, mode='eval').body
+        bound_names = get_bound_names(tree)
+        tree = _ExpressionTransformer({
+            name: aggregate
+            for name, aggregate in self._aggregates.items() if name not in bound_names
+        }, self._references, SOURCE_NAME not in bound_names).visit(tree)
+
+        placeholder = '__expression_{}'.format(len(self._codes))
+        self._expressions[placeholder] = tree
+        self._codes.append(expression.code_string)
+        lines.extend([
+            indent + 'try:',
+            indent + '    {} = {}'.format(target, placeholder),
+            indent + 'except Exception as __error:',
+            indent + '    {} = __handle_error(__error, __codes[{}])'.format(
+                target, len(self._codes) - 1),
+        ])
+
+    def _compile(self) -> CodeType:
+        """ Compiles the generated code and returns the code object of the factory function """
+        module = _PlaceholderTransformer(self._expressions).visit(ast.parse(self.source_code))
+        ast.fix_missing_locations(module)
+        context = {}
+        exec(compile(module, '<aggregate {}>'.format(self._name), 'exec'), context)
+        return context['__factory'].__code__
+
+    def _handle_cast_error(self, err: Exception, value: Any, index: int) -> None:
+        schema = self._schemas[index]
+        logging.debug('{} in casting {} to {} for field {}. Error: {}'.format(
+            type(err).__name__, value, schema.type, schema.fully_qualified_name, err))
+
+    def bind(self, aggregate: Aggregate, aggregates: Dict[str, Aggregate]
+             ) -> Tuple[Callable[[], None], Optional[Callable[[], bool]]]:
+        """
+        Returns the evaluation functions for an aggregate instance.
+        :param aggregate: Aggregate instance whose fields are evaluated.
+        :param aggregates: All the aggregates of the transformer by name.
+        :return: Function that evaluates the fields and function that evaluates the dimension
+            fields, returning False if a dimension could not be evaluated. The dimension function
+            is None if the aggregate has no dimensions.
+        """
+        global_context = aggregate._evaluation_context.global_context
+        # `eval` adds the builtins to the global context in the same way.
+        global_context.setdefault('__builtins__', builtins.__dict__)
+
+        fields = [aggregate._nested_items[name] for name in self._field_names]
+        if self._dimension_names is not None:
+            fields.extend(aggregate._dimension_fields[name] for name in self._dimension_names)
+
+        factory = FunctionType(self._code, global_context)
+        return factory(fields, [
+            aggregates[aggregate_name]._nested_items[field_name]
+            for aggregate_name, field_name in self._references
+        ], self._types, self._codes, handle_evaluation_error, self._handle_cast_error,
+                       _get_record_attribute, _get_record_item)
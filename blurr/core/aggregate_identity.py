@@ -1,5 +1,5 @@
-from datetime import datetime
-from typing import Dict
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 
 from blurr.core.aggregate import AggregateSchema, Aggregate
 from blurr.core.evaluation import EvaluationContext
@@ -16,6 +16,8 @@ class IdentityAggregateSchema(AggregateSchema):
     Aggregates that handles the block rollup aggregation
     """
     ATTRIBUTE_DIMENSIONS = 'Dimensions'
+    ATTRIBUTE_DIMENSION_CACHE_SIZE = 'DimensionCacheSize'
+    DIMENSION_CACHE_SIZE = 100
 
     def __init__(self, fully_qualified_name: str, schema_loader: SchemaLoader) -> None:
         super().__init__(fully_qualified_name, schema_loader)
@@ -26,10 +28,14 @@ class IdentityAggregateSchema(AggregateSchema):
             for schema_spec in self._spec.get(self.ATTRIBUTE_DIMENSIONS, [])
         }
         self.key_type = KeyType.DIMENSION
+        # Number of dimension states, including the current one, that are kept in memory
+        self.dimension_cache_size = self._spec.get(self.ATTRIBUTE_DIMENSION_CACHE_SIZE,
+                                                   self.DIMENSION_CACHE_SIZE)
 
     def validate_schema_spec(self) -> None:
         super().validate_schema_spec()
         self.validate_required_attributes(self.ATTRIBUTE_STORE)
+        self.validate_number_attribute(self.ATTRIBUTE_DIMENSION_CACHE_SIZE, int, 1)
         for schema_spec in self._spec.get(self.ATTRIBUTE_DIMENSIONS, []):
             self.add_errors(
                 validate_enum_attribute(
@@ -38,7 +44,18 @@ class IdentityAggregateSchema(AggregateSchema):
                     schema_spec, self.ATTRIBUTE_TYPE, {Type.INTEGER.value, Type.STRING.value}))
 
 
+# Field values, restored snapshot, restored key and key of the state of a dimension
+_DimensionState = Tuple[List[Any], Optional[Dict[str, Any]], Optional[Key], Key]
+
+
 class IdentityAggregate(Aggregate):
+    """
+    Aggregates the fields separately for each value of the dimensions. The states of the recently
+    evaluated dimensions are kept in memory, so that switching between them does not read and
+    write the store. The least recently used states are saved to the store when there are more
+    than the dimension cache size, and all the states are saved on finalize.
+    """
+
     def __init__(self, schema: AggregateSchema, identity: str,
                  evaluation_context: EvaluationContext) -> None:
         super().__init__(schema, identity, evaluation_context)
@@ -56,6 +73,8 @@ class IdentityAggregate(Aggregate):
             for name, item_schema in self._schema.dimension_fields.items()
         })
         self._existing_key = None
+        # States of the dimensions other than the current one, least recently used first
+        self._dimension_states: Dict[Tuple[str, ...], _DimensionState] = OrderedDict()
 
     def run_evaluate(self) -> None:
         if not self._needs_evaluation:
@@ -67,14 +86,40 @@ class IdentityAggregate(Aggregate):
         # First time being run. Load state from store.
         if not self._existing_key:
             self._init_state_from_new_key()
-
-        if self._existing_key and not self._compare_dimensions_to_fields():
-            self._persist()
-            self._init_state_from_new_key()
+        elif not self._compare_dimensions_to_fields():
+            self._switch_state()
 
         super().run_evaluate()
         self._existing_key = self._key
 
+    def _switch_state(self) -> None:
+        """
+        Keeps the current state in memory and makes the state of the evaluated dimensions current,
+        from memory or from the store. The least recently used states over the cache size are
+        saved to the store.
+        """
+        self._dimension_states[tuple(self._existing_key.dimensions)] = self._get_state()
+        state = self._dimension_states.pop(
+            tuple(str(item.value) for item in self._dimension_fields.values()), None)
+
+        while len(self._dimension_states) >= self._schema.dimension_cache_size:
+            self._set_state(self._dimension_states.popitem(last=False)[1])
+            self._save(self._existing_key)
+
+        if state:
+            self._set_state(state)
+        else:
+            self._init_state_from_new_key()
+
+    def _get_state(self) -> _DimensionState:
+        return ([field.value for field in self._fields.values()], self._restored_snapshot,
+                self._restored_key, self._existing_key)
+
+    def _set_state(self, state: _DimensionState) -> None:
+        values, self._restored_snapshot, self._restored_key, self._existing_key = state
+        for field, value in zip(self._fields.values(), values):
+            field.value = value
+
     def _init_state_from_new_key(self):
         snapshot = self._store.get(self._key)
         if snapshot:
@@ -86,6 +131,9 @@ class IdentityAggregate(Aggregate):
         """
         Evaluates the dimension fields. Returns False if any of the fields could not be evaluated.
         """
+        if self._compiled_evaluate_dimensions is not None:
+            return self._compiled_evaluate_dimensions()
+
         for _, item in self._dimension_fields.items():
             item.run_evaluate()
             if item.eval_error:
@@ -106,5 +154,15 @@ class IdentityAggregate(Aggregate):
                    [str(item.value) for item in self._dimension_fields.values()])
 
     def _persist(self) -> None:
-        if self._existing_key:
-            self._store.save(self._existing_key, self._snapshot)
+        """ Saves the states of all the dimensions kept in memory """
+        if not self._existing_key:
+            return
+
+        current_state = self._get_state()
+        for state in self._dimension_states.values():
+            self._set_state(state)
+            self._save(self._existing_key)
+        self._dimension_states.clear()
+
+        self._set_state(current_state)
+        self._save(self._existing_key)
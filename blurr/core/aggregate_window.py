@@ -1,15 +1,19 @@
-from datetime import datetime, timedelta
-from typing import Any, List, Tuple
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 from blurr.core.aggregate import Aggregate, AggregateSchema
 from blurr.core.aggregate_block import BlockAggregate, BlockAggregateSchema, TimeAggregate
 from blurr.core.aggregate_time import TimeAggregateSchema
 from blurr.core.errors import PrepareWindowMissingBlocksError
-from blurr.core.evaluation import EvaluationContext
+from blurr.core.evaluation import EvaluationContext, Expression
+from blurr.core.field_complex import read_only
 from blurr.core.loader import TypeLoader
 from blurr.core.schema_loader import SchemaLoader
 from blurr.core.store_key import Key, KeyType
 from blurr.core.type import Type
+from blurr.core.window_array import get_array, numpy, require_numpy
+from blurr.core.window_reduction import ColumnReductions, get_window_expression
 
 
 class WindowAggregateSchema(AggregateSchema):
@@ -17,6 +21,7 @@ class WindowAggregateSchema(AggregateSchema):
     ATTRIBUTE_WINDOW_VALUE = 'WindowValue'
     ATTRIBUTE_WINDOW_TYPE = 'WindowType'
     ATTRIBUTE_SOURCE = 'Source'
+    ATTRIBUTE_VECTORIZED = 'Vectorized'
 
     def __init__(self, fully_qualified_name: str, schema_loader: SchemaLoader) -> None:
         super().__init__(fully_qualified_name, schema_loader)
@@ -28,23 +33,269 @@ class WindowAggregateSchema(AggregateSchema):
             self.ATTRIBUTE_SOURCE in self._spec and schema_loader.has_schema_spec(self._spec[self.ATTRIBUTE_SOURCE]) \
             else None
 
+        # Attributes of the window source are numpy arrays instead of lists when vectorized
+        self.vectorized = self._spec.get(self.ATTRIBUTE_VECTORIZED, False)
+
+        # Reductions of the window source columns, e.g. `sum(source.events)`, are computed by the
+        # window source instead of over a list of the values of the window
+        self.when = get_window_expression(self.when)
+        for field_schema in self.nested_schema.values():
+            field_schema.when = get_window_expression(field_schema.when)
+            field_schema.value = get_window_expression(field_schema.value)
+
+    @property
+    def window_key(self) -> Tuple[str, Type, int, bool]:
+        """
+        Returns the key of the window. Window aggregates with the same key have the same window of
+        blocks for each anchor, which is computed once and shared by the aggregates.
+        """
+        if Type.is_type_equal(self.window_type, Type.DAY) or Type.is_type_equal(
+                self.window_type, Type.HOUR):
+            range_type = Type(self.window_type)
+        else:
+            range_type = Type.COUNT
+        return (self.source.fully_qualified_name if self.source else None, range_type,
+                self.window_value, self.vectorized)
+
     def validate_schema_spec(self) -> None:
         super().validate_schema_spec()
         self.validate_required_attributes(self.ATTRIBUTE_WINDOW_TYPE, self.ATTRIBUTE_WINDOW_VALUE,
                                           self.ATTRIBUTE_SOURCE)
         self.validate_number_attribute(self.ATTRIBUTE_WINDOW_VALUE, int)
+        self.validate_enum_attribute(self.ATTRIBUTE_VECTORIZED, {True, False})
+
+
+class BlockCache:
+    """
+    The blocks of a source aggregate for an identity, restored once per store key and shared, so
+    that each stored block is decoded once per window BTS run. The restored blocks are read-only,
+    blocks that are evaluated are restored from them with `restore`.
+    """
+
+    def __init__(self, source: TimeAggregateSchema, identity: str) -> None:
+        self._source = source
+        self._identity = identity
+        self._blocks: Dict[Key, TimeAggregate] = {}
+
+    def get(self, key: Key, snapshot: Dict[str, Any]) -> TimeAggregate:
+        """
+        Returns the block restored from the snapshot of a key. The snapshot is decoded on the first
+        call for the key.
+        """
+        block = self._blocks.get(key, None)
+        if block is None:
+            block = TypeLoader.load_item(self._source.type)(self._source, self._identity,
+                                                            EvaluationContext()).run_restore(snapshot)
+            # The block is shared by the windows, so that its maps, lists and sets cannot be
+            # changed by the window expressions
+            for field in block._nested_items.values():
+                field.value = read_only(field.value)
+            self._blocks[key] = block
+        return block
+
+    def restore(self, block: TimeAggregate, key: Key, snapshot: Dict[str, Any]) -> TimeAggregate:
+        """
+        Restores a block from the snapshot of a key in the same way as `block.run_restore`, from the
+        values decoded once for the key.
+        :param block: Block aggregate of the source schema to restore.
+        :param key: Key of the snapshot.
+        :param snapshot: Snapshot of the block.
+        """
+        return block.run_restore_from(self.get(key, snapshot), snapshot)
+
+
+class BlockSequence:
+    """
+    The blocks of a source aggregate for an identity, restored once and sorted by time. Windows
+    are sliced from the sequence with bisect and return the same blocks, in the same order, as a
+    range query on the store of the source.
+    """
+
+    def __init__(self,
+                 source: TimeAggregateSchema,
+                 identity: str,
+                 items: Iterable[Tuple[Key, Any]],
+                 block_cache: Optional[BlockCache] = None) -> None:
+        """
+        Restores and sorts the blocks of the source.
+        :param source: Schema of the source aggregate.
+        :param identity: Identity of the blocks.
+        :param items: (Key, block) items of the identity. Items of other groups are ignored.
+        :param block_cache: Cache of the restored blocks of the source, shared with the anchors.
+        """
+        if block_cache is None:
+            block_cache = BlockCache(source, identity)
+        self._source = source
+        self._identity = identity
+        # Blocks are sorted by the time that the store sorts them by in range queries
+        entries = sorted(
+            ((self._get_time(key, block), key, block)
+             for key, block in items
+             if key.group == source.name and key.key_type == source.key_type),
+            key=lambda entry: entry[0])
+
+        self.times: List[Union[datetime, str]] = [time for time, _, _ in entries]
+        self.keys: List[Key] = [key for _, key, _ in entries]
+        self.blocks: List[TimeAggregate] = [
+            block_cache.get(key, block) for _, key, block in entries
+        ]
+        self._columns: Dict[str, List[Any]] = {}
+        self._arrays: Dict[str, Any] = {}
+        self._time_array = None
+        self._column_reductions: Dict[str, ColumnReductions] = {}
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    @staticmethod
+    def _get_time(key: Key, block: Any) -> Union[datetime, str]:
+        if key.key_type == KeyType.TIMESTAMP:
+            return key.timestamp
+        return block.get('_start_time', datetime.min.isoformat()) if isinstance(
+            block, dict) else datetime.min.isoformat()
+
+    def _get_bound(self, time: datetime) -> Union[datetime, str]:
+        if self._source.key_type == KeyType.TIMESTAMP:
+            return time if time.tzinfo else time.replace(tzinfo=timezone.utc)
+        return time.isoformat()
+
+    def get_range_indexes(self, start_time: datetime, end_time: Optional[datetime] = None,
+                          count: int = 0) -> Tuple[int, int]:
+        """
+        Returns the [low, high) indexes of the blocks that `Store.get_range` returns for the same
+        arguments.
+        :param start_time: Start time of the range, exclusive.
+        :param end_time: End time of the range, exclusive. If None count is used.
+        :param count: The number of blocks after the start time, or before it if negative.
+        """
+        if end_time is None:
+            end_time = datetime.min.replace(
+                tzinfo=timezone.utc) if count < 0 else datetime.max.replace(tzinfo=timezone.utc)
+
+        if end_time < start_time:
+            start_time, end_time = end_time, start_time
+
+        low = bisect_right(self.times, self._get_bound(start_time))
+        high = bisect_left(self.times, self._get_bound(end_time))
+        if count > 0:
+            high = min(high, low + count)
+        elif count < 0:
+            low = max(low, high + count)
+        return low, max(low, high)
+
+    def get_range_indexes_batch(self,
+                                start_times: List[datetime],
+                                end_times: Optional[List[datetime]] = None,
+                                count: int = 0) -> Tuple['numpy.ndarray', 'numpy.ndarray']:
+        """
+        Returns the arrays of the [low, high) indexes that `get_range_indexes` returns for each of
+        the start times, computed with numpy for all the ranges at once.
+        :param start_times: Start times of the ranges, exclusive.
+        :param end_times: End times of the ranges, exclusive. If None count is used.
+        :param count: The number of blocks after the start time, or before it if negative.
+        """
+        if end_times is None:
+            end_times = [
+                datetime.min.replace(tzinfo=timezone.utc)
+                if count < 0 else datetime.max.replace(tzinfo=timezone.utc)
+            ] * len(start_times)
+
+        bounds = [(end_time, start_time) if end_time < start_time else (start_time, end_time)
+                  for start_time, end_time in zip(start_times, end_times)]
+        if self._time_array is None:
+            self._time_array = get_array(self.times)
+
+        lows = numpy.searchsorted(
+            self._time_array,
+            get_array([self._get_bound(start_time) for start_time, _ in bounds]),
+            side='right').astype('int64')
+        highs = numpy.searchsorted(
+            self._time_array,
+            get_array([self._get_bound(end_time) for _, end_time in bounds]),
+            side='left').astype('int64')
+        if count > 0:
+            highs = numpy.minimum(highs, lows + count)
+        elif count < 0:
+            lows = numpy.maximum(lows, highs + count)
+        return lows, numpy.maximum(lows, highs)
+
+    def get_range(self, start_time: datetime, end_time: Optional[datetime] = None,
+                  count: int = 0) -> List[TimeAggregate]:
+        """ Returns the blocks that `Store.get_range` returns for the same arguments """
+        low, high = self.get_range_indexes(start_time, end_time, count)
+        return self.blocks[low:high]
+
+    def get_column(self, attribute: str) -> List[Any]:
+        """ Returns the values of an attribute of all the blocks, read once from the blocks """
+        if attribute not in self._columns:
+            self._columns[attribute] = [getattr(block, attribute) for block in self.blocks]
+        return self._columns[attribute]
+
+    def get_array(self, attribute: str) -> 'numpy.ndarray':
+        """
+        Returns the values of an attribute of all the blocks as a numpy array, typed by the type of
+        the source field. The array is built once and windows are views of it.
+        """
+        if attribute not in self._arrays:
+            field_schema = self._source.nested_schema.get(attribute, None)
+            array = get_array(self.get_column(attribute),
+                              field_schema.type if field_schema else None)
+            # Windows share the array, so that it cannot be changed by the window expressions
+            array.flags.writeable = False
+            self._arrays[attribute] = array
+        return self._arrays[attribute]
+
+    def reduce(self, function: Callable[[List[Any]], Any], attribute: str, low: int,
+               high: int) -> Any:
+        """ Returns `function(self.get_column(attribute)[low:high])` """
+        if attribute not in self._column_reductions:
+            self._column_reductions[attribute] = ColumnReductions(self.get_column(attribute))
+        return self._column_reductions[attribute].reduce(function, low, high)
+
+    def reduce_batch(self, function: Callable[[List[Any]], Any], attribute: str,
+                     lows: 'numpy.ndarray', highs: 'numpy.ndarray') -> Optional[List[Any]]:
+        """ Returns the results of `reduce` for each of the ranges, see `ColumnReductions` """
+        if attribute not in self._column_reductions:
+            self._column_reductions[attribute] = ColumnReductions(self.get_column(attribute))
+        return self._column_reductions[attribute].reduce_batch(function, lows, highs)
 
 
 class _WindowSource:
     """
-    Represents a window on the pre-aggregated source data.
+    Represents a window on the pre-aggregated source data. Attributes of the window source are the
+    lists of the attribute values of the blocks in the window, or read-only numpy arrays of the
+    values when vectorized.
     """
 
-    def __init__(self, block_list: List[TimeAggregate]):
-        self.view: List[TimeAggregate] = block_list
+    def __init__(self, block_sequence: BlockSequence, low: int, high: int,
+                 vectorized: bool = False) -> None:
+        self._block_sequence = block_sequence
+        self._low = low
+        self._high = high
+        self._vectorized = vectorized
 
-    def __getattr__(self, item: str) -> List[Any]:
-        return [getattr(block, item) for block in self.view]
+    @property
+    def view(self) -> List[TimeAggregate]:
+        return self._block_sequence.blocks[self._low:self._high]
+
+    def __len__(self) -> int:
+        return self._high - self._low
+
+    def __getattr__(self, item: str) -> Union[List[Any], 'numpy.ndarray']:
+        if self._low == self._high:
+            return get_array([]) if self._vectorized else []
+        if self._vectorized:
+            return self._block_sequence.get_array(item)[self._low:self._high]
+        return self._block_sequence.get_column(item)[self._low:self._high]
+
+    def _reduce(self, function: Callable[[List[Any]], Any], attribute: str) -> Any:
+        """
+        Returns `function(getattr(self, attribute))`. The window expressions call this for the
+        reductions of the window source columns, see `get_window_expression`.
+        """
+        if self._low == self._high:
+            return function([])
+        return self._block_sequence.reduce(function, attribute, self._low, self._high)
 
 
 class WindowAggregate(Aggregate):
@@ -55,42 +306,122 @@ class WindowAggregate(Aggregate):
     def __init__(self, schema: WindowAggregateSchema, identity: str,
                  evaluation_context: EvaluationContext) -> None:
         super().__init__(schema, identity, evaluation_context)
+        if schema.vectorized:
+            require_numpy()
         self._window_source = None
+        self._block_sequence: Optional[BlockSequence] = None
 
-    def _prepare_window(self, start_time: datetime) -> None:
+    def run_reset(self) -> None:
+        super().run_reset()
+        # The blocks are read again from the store, which may have changed since
+        self._block_sequence = None
+
+    def _prepare_window(self, start_time: datetime,
+                        block_sequence: Optional[BlockSequence] = None) -> None:
         """
         Prepares window if any is specified.
         :param start_time: The anchor block start_time from where the window
         should be generated.
+        :param block_sequence: Blocks of the source for the identity. The blocks are read from the
+        store of the source once and kept by the aggregate until it is reset when not provided.
         """
-        # evaluate window first which sets the correct window in the store
-        store = self._schema.schema_loader.get_store(
-            self._schema.source.store_schema.fully_qualified_name)
+        if block_sequence is None:
+            block_sequence = self._get_block_sequence()
+
         if Type.is_type_equal(self._schema.window_type, Type.DAY) or Type.is_type_equal(
                 self._schema.window_type, Type.HOUR):
-            block_list = self._load_blocks(
-                store.get_range(
-                    Key(self._schema.source.key_type, self._identity, self._schema.source.name),
-                    start_time, self._get_end_time(start_time)))
+            low, high = block_sequence.get_range_indexes(start_time,
+                                                         self._get_end_time(start_time))
         else:
-            block_list = self._load_blocks(
-                store.get_range(
-                    Key(self._schema.source.key_type, self._identity, self._schema.source.name),
-                    start_time, None, self._schema.window_value))
+            low, high = block_sequence.get_range_indexes(start_time, None,
+                                                         self._schema.window_value)
 
-        self._window_source = _WindowSource(block_list)
+        self._set_window(self._get_window_source(block_sequence, low, high))
+
+    def _get_window_source(self, block_sequence: BlockSequence, low: int,
+                           high: int) -> _WindowSource:
+        """ Returns the window source of the [low, high) blocks of the sequence """
+        return _WindowSource(block_sequence, low, high, self._schema.vectorized)
+
+    def _set_window(self, window_source: _WindowSource) -> None:
+        """
+        Sets the window, e.g. to the window of another aggregate with the same window key.
+        :param window_source: Window source of the blocks in the window.
+        """
+        self._window_source = window_source
         self._validate_view()
 
+    def _get_window_ranges(self, start_times: List[datetime], block_sequence: BlockSequence
+                           ) -> Tuple['numpy.ndarray', 'numpy.ndarray']:
+        """
+        Returns the arrays of the [low, high) indexes of the windows of all the start times, which
+        `_prepare_window` computes for each start time.
+        :param start_times: Start times of the anchor blocks.
+        :param block_sequence: Blocks of the source for the identity.
+        """
+        if Type.is_type_equal(self._schema.window_type, Type.DAY) or Type.is_type_equal(
+                self._schema.window_type, Type.HOUR):
+            return block_sequence.get_range_indexes_batch(
+                start_times, [self._get_end_time(start_time) for start_time in start_times])
+        return block_sequence.get_range_indexes_batch(start_times, None,
+                                                      self._schema.window_value)
+
+    def _get_batch_reductions(self, block_sequence: BlockSequence, lows: 'numpy.ndarray',
+                              highs: 'numpy.ndarray') -> Dict[str, List[Any]]:
+        """
+        Returns the values of the fields that are only a reduction of a window source column, e.g.
+        `sum(source.events)`, for all the windows at once. Fields that are evaluated conditionally
+        or whose reduction is not computed incrementally are not included.
+        :param block_sequence: Blocks of the source for the identity.
+        :param lows: Indexes of the first block of the windows.
+        :param highs: Indexes after the last block of the windows.
+        """
+        reductions = {}
+        for name, field_schema in self._schema.nested_schema.items():
+            reduction = getattr(field_schema.value, 'reduction', None)
+            if field_schema.when is not None or reduction is None:
+                continue
+
+            function_name, attribute = reduction
+            # The function is resolved in the same way as by the evaluation of the field
+            function = Expression(function_name).evaluate(self._evaluation_context)
+            results = block_sequence.reduce_batch(function, attribute, lows,
+                                                  highs) if function is not None else None
+            if results is not None:
+                reductions[name] = results
+        return reductions
+
+    def _evaluate_with_reductions(self, reductions: Dict[str, Any]) -> None:
+        """
+        Evaluates the fields of the aggregate, with the values of the reductions computed for all
+        the windows at once instead of evaluating the reduction fields.
+        :param reductions: Values of the reduction fields for the current window.
+        """
+        self._evaluation_context.local_context.add('source', self._window_source)
+        if self._needs_evaluation:
+            for name, item in self._nested_items.items():
+                if name in reductions:
+                    item._set_result(reductions[name])
+                else:
+                    item.run_evaluate()
+
+    def _get_block_sequence(self) -> BlockSequence:
+        if self._block_sequence is None:
+            store = self._schema.schema_loader.get_store(
+                self._schema.source.store_schema.fully_qualified_name)
+            self._block_sequence = BlockSequence(self._schema.source, self._identity,
+                                                 store.iterate_all(self._identity))
+        return self._block_sequence
+
     def _validate_view(self):
         if Type.is_type_equal(
                 self._schema.window_type,
-                Type.COUNT) and len(self._window_source.view) != abs(self._schema.window_value):
+                Type.COUNT) and len(self._window_source) != abs(self._schema.window_value):
             raise PrepareWindowMissingBlocksError(
                 '{} WindowAggregate: Expecting {} but found {} blocks'.format(
-                    self._schema.name, abs(self._schema.window_value), len(
-                        self._window_source.view)))
+                    self._schema.name, abs(self._schema.window_value), len(self._window_source)))
 
-        if len(self._window_source.view) == 0:
+        if len(self._window_source) == 0:
             raise PrepareWindowMissingBlocksError(
                 '{} WindowAggregate: No matching blocks found'.format(self._schema.name))
 
@@ -109,18 +440,6 @@ class WindowAggregate(Aggregate):
         elif Type.is_type_equal(self._schema.window_type, Type.HOUR):
             return start_time + timedelta(hours=self._schema.window_value)
 
-    def _load_blocks(self, blocks: List[Tuple[Key, Any]]) -> List[TimeAggregate]:
-        """
-        Converts [(Key, block)] to [BlockAggregate]
-        :param blocks: List of (Key, block) blocks.
-        :return: List of BlockAggregate
-        """
-        return [
-            TypeLoader.load_item(self._schema.source.type)(self._schema.source, self._identity,
-                                                           EvaluationContext()).run_restore(block)
-            for (_, block) in blocks
-        ]
-
     def run_evaluate(self) -> None:
         self._evaluation_context.local_context.add('source', self._window_source)
         super().run_evaluate()
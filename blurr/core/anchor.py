@@ -1,11 +1,14 @@
 from collections import defaultdict
 from datetime import datetime
-from typing import Dict
+from typing import Any, Dict, List, Tuple
 
 from blurr.core.aggregate_block import BlockAggregate, TimeAggregate
+from blurr.core.aggregate_window import BlockCache
 from blurr.core.base import BaseSchema
 from blurr.core.evaluation import EvaluationContext
 from blurr.core.schema_loader import SchemaLoader
+from blurr.core.store_key import Key
+from blurr.core.window_batch import get_batch_condition
 
 
 class AnchorSchema(BaseSchema):
@@ -20,6 +23,8 @@ class AnchorSchema(BaseSchema):
         super().__init__(fully_qualified_name, schema_loader)
 
         self.condition = self.build_expression(self.ATTRIBUTE_CONDITION)
+        # Condition evaluated on the arrays of the fields of all the blocks at once, if possible
+        self.batch_condition = get_batch_condition(self.condition)
         self.max = self._spec[self.ATTRIBUTE_MAX] if self.ATTRIBUTE_MAX in self._spec else None
 
     def validate_schema_spec(self) -> None:
@@ -43,6 +48,37 @@ class Anchor:
 
         return False
 
+    def evaluate_anchor_batch(self, block: TimeAggregate, items: List[Tuple[Key, Dict[str, Any]]],
+                              block_cache: BlockCache, evaluation_context: EvaluationContext
+                              ) -> Tuple[List[bool], List[datetime]]:
+        """
+        Evaluates the anchor condition against all the blocks at once. The maximum number of
+        anchors is not applied, as it depends on the anchors that are evaluated.
+        :param block: Block aggregate that the snapshots are restored into.
+        :param items: (Key, snapshot) of the blocks.
+        :param block_cache: Cache of the restored blocks of the block aggregate.
+        :param evaluation_context: Context the condition is evaluated in.
+        :return: Whether the condition is met and the start time of each block.
+        """
+        columns: Dict[str, List[Any]] = {name: [] for name in block._schema.nested_schema}
+        for key, snapshot in items:
+            restored = block_cache.restore(block, key, snapshot)
+            for name, values in columns.items():
+                values.append(getattr(restored, name))
+
+        conditions = None
+        if self._schema.batch_condition is not None:
+            conditions = self._schema.batch_condition.evaluate_blocks(
+                evaluation_context, block, columns)
+
+        if conditions is None:
+            conditions = []
+            for key, snapshot in items:
+                self.anchor_block = block_cache.restore(block, key, snapshot)
+                conditions.append(bool(self._schema.condition.evaluate(evaluation_context)))
+
+        return conditions, columns['_start_time']
+
     def add_condition_met(self):
         self._condition_met[self.anchor_block._start_time.date()] += 1
 
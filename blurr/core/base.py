@@ -27,6 +27,8 @@ class BaseSchema(ABC):
         self.schema_loader: SchemaLoader = schema_loader
         self.fully_qualified_name: str = fully_qualified_name
         self._spec: Dict[str, Any] = self.schema_loader.get_schema_spec(self.fully_qualified_name)
+        # Expressions built for the schema by attribute name
+        self.expressions: Dict[str, Expression] = {}
 
         self.validate_schema_spec()
 
@@ -44,7 +46,9 @@ class BaseSchema(ABC):
         expression_string = self._spec.get(attribute, None)
         if expression_string:
             try:
-                return Expression(str(expression_string))
+                expression = Expression(str(expression_string))
+                self.expressions[attribute] = expression
+                return expression
             except Exception as err:
                 self.add_errors(
                     InvalidExpressionError(self.fully_qualified_name, self._spec, attribute, err))
@@ -0,0 +1,147 @@
+import ast
+import sys
+from typing import Dict, Optional, Set, Tuple
+
+from blurr.core.record import Record
+
+SOURCE_NAME = 'source'
+
+
+def get_string_constant(node: ast.AST) -> Optional[str]:
+    """ Returns the value of a string literal node. None if the node is not a string literal. """
+    if sys.version_info < (3, 9) and isinstance(node, ast.Index):
+        node = node.value
+    if sys.version_info < (3, 8):
+        return node.s if isinstance(node, ast.Str) else None
+    return node.value if isinstance(node, ast.Constant) and isinstance(node.value, str) else None
+
+
+def get_bound_names(expression: ast.AST) -> Set[str]:
+    """ Returns the names that are bound inside an expression by lambdas and comprehensions """
+    names = set()
+    for node in ast.walk(expression):
+        if isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            names.add(node.id)
+    return names
+
+
+def is_record_attribute(name: str) -> bool:
+    """
+    Returns True if `record.name` resolves to an attribute of the `Record` object instead of a
+    value in the record.
+    """
+    return name.startswith('__') or hasattr(Record, name)
+
+
+class ExpressionDependencies(ast.NodeVisitor):
+    """
+    Determines what an expression reads by walking its syntax tree:
+        1. `names`: Global names, such as aggregates, imports, `source` and `time`.
+        2. `attributes`: (name, attribute) pairs read as `name.attribute` or `name['attribute']`.
+        3. `source_attributes`: Attributes of the source record read as `source.attribute` or
+            `source['attribute']`.
+        4. `reads_source`: True if the source record is used in any other way, e.g. passed to a
+            function, in which case any attribute of the source record can be read.
+    """
+
+    def __init__(self, code_string: str) -> None:
+        self.names: Set[str] = set()
+        self.attributes: Set[Tuple[str, str]] = set()
+        self.source_attributes: Set[str] = set()
+        self.reads_source = False
+
+        tree = ast.parse(code_string, mode='eval')
+        # The source record cannot be tracked when the name is rebound inside the expression
+        self._track_source = SOURCE_NAME not in get_bound_names(tree)
+        self.visit(tree)
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if isinstance(node.ctx, ast.Load):
+            self.names.add(node.id)
+            if node.id == SOURCE_NAME:
+                self.reads_source = True
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        if isinstance(node.value, ast.Name) and isinstance(node.ctx, ast.Load):
+            if node.value.id != SOURCE_NAME or (self._track_source and
+                                                 not is_record_attribute(node.attr)):
+                self._add_attribute(node.value.id, node.attr)
+                return
+        self.generic_visit(node)
+
+    def visit_Subscript(self, node: ast.Subscript) -> None:
+        if isinstance(node.value, ast.Name) and isinstance(node.ctx, ast.Load):
+            key = get_string_constant(node.slice)
+            if key is not None and (node.value.id != SOURCE_NAME or self._track_source):
+                self._add_attribute(node.value.id, key)
+                return
+        self.generic_visit(node)
+
+    def _add_attribute(self, name: str, attribute: str) -> None:
+        self.names.add(name)
+        self.attributes.add((name, attribute))
+        if name == SOURCE_NAME:
+            self.source_attributes.add(attribute)
+
+
+class DependencyGraph:
+    """
+    Dependencies of the schema elements in a transformer, such as the fields, aggregates and the
+    transformer itself, on the aggregate fields and source record attributes that their
+    expressions read. Elements are identified by their fully qualified name.
+    """
+
+    def __init__(self, transformer_name: str, schemas: Dict[str, 'BaseSchema']) -> None:
+        """
+        Analyzes the expressions of the schema elements of a transformer.
+        :param transformer_name: Fully qualified name of the transformer.
+        :param schemas: Schema elements of the transformer by fully qualified name.
+        """
+        self.transformer_name = transformer_name
+
+        # Dependencies of each expression by element and expression attribute, e.g. `Value`
+        self.expressions: Dict[str, Dict[str, ExpressionDependencies]] = {
+            name: {
+                attribute: ExpressionDependencies(expression.code_string)
+                for attribute, expression in schema.expressions.items()
+            }
+            for name, schema in schemas.items() if schema.expressions
+        }
+
+        aggregate_names = set(getattr(schemas.get(transformer_name, None), 'nested_schema', {}))
+        self.field_dependencies: Dict[str, Set[str]] = {}
+        self.source_dependencies: Dict[str, Set[str]] = {}
+        self._reads_source: Set[str] = set()
+        for name, dependencies in self.expressions.items():
+            fields = set()
+            source_attributes = set()
+            for expression_dependencies in dependencies.values():
+                fields.update(
+                    '.'.join([transformer_name, aggregate, field])
+                    for aggregate, field in expression_dependencies.attributes
+                    if aggregate in aggregate_names and
+                    '.'.join([transformer_name, aggregate, field]) in schemas)
+                source_attributes.update(expression_dependencies.source_attributes)
+                if expression_dependencies.reads_source:
+                    self._reads_source.add(name)
+
+            self.field_dependencies[name] = fields
+            self.source_dependencies[name] = source_attributes
+
+    @property
+    def source_projection(self) -> Optional[Set[str]]:
+        """
+        Returns the attributes of the source record that are read by the transformer. None if an
+        expression uses the source record in a way that allows it to read any attribute.
+        """
+        if self._reads_source:
+            return None
+
+        return set().union(*self.source_dependencies.values())
+
+    @property
+    def unprojectable_elements(self) -> Set[str]:
+        """ Returns the elements whose expressions can read any attribute of the source record """
+        return set(self._reads_source)
@@ -358,6 +358,13 @@ class TimeError(Exception):
     pass
 
 
+class RecordOrderError(Exception):
+    """
+    Raised when records that are expected to be grouped by identity and sorted by time are not.
+    """
+    pass
+
+
 class PrepareWindowMissingBlocksError(Exception):
     """
     Raised when the window view generated is insufficient as per the window specification.
@@ -377,3 +384,10 @@ class KeyError(Exception):
     Raised when an issues happens with respect to the store Key.
     """
     pass
+
+
+class StoreWriteError(Exception):
+    """
+    Raised when items cannot be persisted to the store.
+    """
+    pass
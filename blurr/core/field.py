@@ -90,6 +90,13 @@ class Field(BaseItem):
         if self._needs_evaluation:
             result = self._schema.value.evaluate(self._evaluation_context)
 
+        self._set_result(result)
+
+    def _set_result(self, result: Any) -> None:
+        """
+        Sets the value to the result of evaluating the value expression
+        :param result: Result of the evaluation. None if the evaluation failed.
+        """
         self.eval_error = result is None
         if self.eval_error:
             return
@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Dict, Type
 
 from blurr.core.field import FieldSchema, ComplexTypeBase
 
@@ -82,3 +82,49 @@ class SetFieldSchema(FieldSchema):
     @staticmethod
     def decoder(value: Any) -> Set:
         return Set(value)
+
+
+def _read_only(self, *args, **kwargs) -> None:
+    raise TypeError('{} is read-only'.format(type(self).__name__))
+
+
+class ReadOnlyMap(Map):
+    """
+    Map that cannot be changed, for values that are shared, e.g. by the restored blocks that the
+    windows share.
+    """
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    set = increment = clear = pop = popitem = setdefault = update = _read_only
+
+
+class ReadOnlyList(List):
+    """
+    List that cannot be changed, for values that are shared.
+    """
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = insert = extend = pop = remove = clear = sort = reverse = _read_only
+
+
+class ReadOnlySet(Set):
+    """
+    Set that cannot be changed, for values that are shared.
+    """
+    __ior__ = __iand__ = __isub__ = __ixor__ = _read_only
+    add = discard = remove = pop = clear = update = _read_only
+    intersection_update = difference_update = symmetric_difference_update = _read_only
+
+
+_READ_ONLY_TYPES: Dict[Type[ComplexTypeBase], Type[ComplexTypeBase]] = {
+    Map: ReadOnlyMap,
+    List: ReadOnlyList,
+    Set: ReadOnlySet
+}
+
+
+def read_only(value: Any) -> Any:
+    """
+    Returns a read-only copy of a Map, List or Set value. Other values are returned as is.
+    :param value: Value to make read-only.
+    """
+    read_only_type = _READ_ONLY_TYPES.get(type(value), None)
+    return read_only_type(value) if read_only_type else value
@@ -14,6 +14,8 @@ ITEM_MAP = {
     Type.BLURR_AGGREGATE_WINDOW: 'blurr.core.aggregate_window.WindowAggregate',
     Type.BLURR_STORE_MEMORY: 'blurr.store.memory_store.MemoryStore',
     Type.BLURR_STORE_DYNAMO: 'blurr.store.dynamo_store.DynamoStore',
+    Type.BLURR_STORE_SQLITE: 'blurr.store.sqlite_store.SQLiteStore',
+    Type.BLURR_STORE_SEGMENT: 'blurr.store.segment_store.SegmentStore',
     Type.DAY: 'blurr.core.window.Window',
     Type.HOUR: 'blurr.core.window.Window',
     Type.COUNT: 'blurr.core.window.Window',
@@ -37,6 +39,8 @@ SCHEMA_MAP = {
     Type.BLURR_AGGREGATE_WINDOW: 'blurr.core.aggregate_window.WindowAggregateSchema',
     Type.BLURR_STORE_MEMORY: 'blurr.store.memory_store.MemoryStoreSchema',
     Type.BLURR_STORE_DYNAMO: 'blurr.store.dynamo_store.DynamoStoreSchema',
+    Type.BLURR_STORE_SQLITE: 'blurr.store.sqlite_store.SQLiteStoreSchema',
+    Type.BLURR_STORE_SEGMENT: 'blurr.store.segment_store.SegmentStoreSchema',
     Type.ANCHOR: 'blurr.core.anchor.AnchorSchema',
     Type.DAY: 'blurr.core.window.WindowSchema',
     Type.HOUR: 'blurr.core.window.WindowSchema',
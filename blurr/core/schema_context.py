@@ -1,6 +1,6 @@
 from typing import Dict, List
 
-from blurr.core.evaluation import Expression, EvaluationContext, ExpressionType
+from blurr.core.evaluation import Expression, EvaluationContext, ExpressionType, Context
 
 
 class SchemaContext:
@@ -11,7 +11,7 @@ class SchemaContext:
     def __init__(self, import_spec: List[Dict]):
         self.import_spec = import_spec
         self.import_statements = self._generate_import_statements()
-        self._context = None
+        self._import_context: Context = None
 
     def _generate_import_statements(self) -> List[Expression]:
         import_expression_list = []
@@ -30,15 +30,18 @@ class SchemaContext:
 
     @property
     def context(self) -> EvaluationContext:
-        if self._context:
-            return self._context
-        # The eval code adds the python global context to the global context dict being passed and
-        # new context being created is added to the local context. We take the local_context in
-        # temp_eval_context and use that as the global context for the returned EvaluationContext.
-        temp_eval_context = EvaluationContext()
-        for import_statement in self.import_statements:
-            import_statement.evaluate(temp_eval_context)
-
-        eval_context = EvaluationContext(global_context=temp_eval_context.local_context)
-
-        return eval_context
+        """
+        Returns a new EvaluationContext with the imported identifiers in its global context. The
+        import statements are executed only once per schema and the resulting globals are copied
+        into each returned context.
+        """
+        if self._import_context is None:
+            # The eval code adds the python global context to the global context dict being passed
+            # and new context being created is added to the local context. We take the
+            # local_context in temp_eval_context and use that as the global context.
+            temp_eval_context = EvaluationContext()
+            for import_statement in self.import_statements:
+                import_statement.evaluate(temp_eval_context)
+            self._import_context = temp_eval_context.local_context
+
+        return EvaluationContext(global_context=Context(self._import_context))
@@ -1,5 +1,6 @@
 from typing import Dict, Any, List, Optional, Union
 
+from blurr.core.dependency import DependencyGraph
 from blurr.core.errors import BaseSchemaError, InvalidTypeError, TypeLoaderError, SpecNotFoundError
 from blurr.core.errors import SchemaErrorCollection
 from blurr.core.loader import TypeLoader
@@ -127,6 +128,27 @@ class SchemaLoader:
         """
         return list(self._store_cache.values())
 
+    def reset_stores(self) -> None:
+        """
+        Discards the instantiated stores. The next `get_store` call initializes a new store from
+        the cached schema.
+        """
+        self._store_cache.clear()
+
+    def get_dependency_graph(self, transformer_name: str) -> DependencyGraph:
+        """
+        Analyzes the expressions of a transformer to determine the aggregate fields and source
+        record attributes that each schema element reads.
+        :param transformer_name: The fully qualified name of the transformer.
+        :return: Dependency graph of the schema elements in the transformer.
+        """
+        self.get_schema_object(transformer_name)
+        return DependencyGraph(transformer_name, {
+            fq_name: schema
+            for fq_name, schema in self._schema_cache.items()
+            if self.get_transformer_name(fq_name) == transformer_name
+        })
+
     def get_nested_schema_object(self, fully_qualified_parent_name: str,
                                  nested_item_name: str) -> Optional['BaseSchema']:
         """
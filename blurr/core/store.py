@@ -1,6 +1,6 @@
 from abc import abstractmethod, ABC
 from datetime import datetime, timezone
-from typing import Any, List, Tuple, Dict
+from typing import Any, List, Tuple, Dict, Iterator, Union
 
 from blurr.core.base import BaseSchema
 from blurr.core.store_key import Key, KeyType
@@ -39,6 +39,41 @@ class Store(ABC):
         :param end_time: End time of the range query. If None count is used.
         :param count: The number of items to be returned. Used if end_time is not specified.
         """
+        start, end = self._get_range_bounds(base_key, start_time, end_time, count)
+        if base_key.key_type == KeyType.TIMESTAMP:
+            return self._get_range_timestamp_key(start, end, count)
+        else:
+            return self._get_range_dimension_key(base_key, start, end, count)
+
+    def iterate_range(self,
+                      base_key: Key,
+                      start_time: datetime,
+                      end_time: datetime = None,
+                      count: int = 0) -> Iterator[Tuple[Key, Any]]:
+        """
+        Iterates over the items returned by `get_range`, in the same order. Stores that can read
+        the items lazily do so as the iterator is consumed.
+        """
+        start, end = self._get_range_bounds(base_key, start_time, end_time, count)
+        if base_key.key_type == KeyType.TIMESTAMP:
+            return self._iterate_range_timestamp_key(start, end, count)
+        else:
+            return self._iterate_range_dimension_key(base_key, start, end, count)
+
+    def iterate_all(self, identity: str) -> Iterator[Tuple[Key, Any]]:
+        """
+        Iterates over all the items for an identity. Stores that can read the items lazily do so
+        as the iterator is consumed.
+        """
+        return iter(self.get_all(identity).items())
+
+    @staticmethod
+    def _get_range_bounds(base_key: Key, start_time: datetime, end_time: datetime,
+                          count: int) -> Tuple[Union[Key, datetime], Union[Key, datetime]]:
+        """
+        Validates the range query and returns its start and end in time order. The start and end
+        are keys for a TIMESTAMP key and times for a DIMENSION key.
+        """
         if end_time and count:
             raise ValueError('Only one of `end` or `count` can be set')
 
@@ -52,9 +87,9 @@ class Store(ABC):
         if base_key.key_type == KeyType.TIMESTAMP:
             start_key = Key(KeyType.TIMESTAMP, base_key.identity, base_key.group, [], start_time)
             end_key = Key(KeyType.TIMESTAMP, base_key.identity, base_key.group, [], end_time)
-            return self._get_range_timestamp_key(start_key, end_key, count)
-        else:
-            return self._get_range_dimension_key(base_key, start_time, end_time, count)
+            return start_key, end_key
+
+        return start_time, end_time
 
     @abstractmethod
     def _get_range_timestamp_key(self, start: Key, end: Key,
@@ -66,6 +101,13 @@ class Store(ABC):
         """
         raise NotImplementedError()
 
+    def _iterate_range_timestamp_key(self, start: Key, end: Key,
+                                     count: int = 0) -> Iterator[Tuple[Key, Any]]:
+        """
+        Iterator variant of `_get_range_timestamp_key`.
+        """
+        return iter(self._get_range_timestamp_key(start, end, count))
+
     def get_time_range(self, identity, group, start_time, end_time) -> List[Tuple[Key, Any]]:
         raise NotImplementedError()
 
@@ -85,6 +127,16 @@ class Store(ABC):
         """
         raise NotImplementedError()
 
+    def _iterate_range_dimension_key(self,
+                                     base_key: Key,
+                                     start_time: datetime,
+                                     end_time: datetime,
+                                     count: int = 0) -> Iterator[Tuple[Key, Any]]:
+        """
+        Iterator variant of `_get_range_dimension_key`.
+        """
+        return iter(self._get_range_dimension_key(base_key, start_time, end_time, count))
+
     @staticmethod
     def _restrict_items_to_count(items: List[Tuple[Key, Any]], count: int) -> List[Tuple[Key, Any]]:
         """
@@ -109,6 +161,30 @@ class Store(ABC):
         """
         raise NotImplementedError()
 
+    def update(self, key: Key, item: Dict[str, Any], changed_fields: List[str]) -> None:
+        """
+        Saves an item of which only the changed fields differ from the item in the store. Stores
+        that can write some of the fields of an item override this to write only the changed
+        fields.
+        :param key: Key of the item
+        :param item: The complete item
+        :param changed_fields: Names of the fields that changed since the item was read
+        """
+        self.save(key, item)
+
+    def get_changed_fields(self, stored_item: Dict[str, Any], item: Dict[str, Any]) -> List[str]:
+        """
+        Returns the names of the fields of an item that differ from the item read from the store.
+        Stores that change the values when saving override this to compare the values as they are
+        read back.
+        :param stored_item: The item read from the store
+        :param item: The item to save
+        """
+        return [
+            name for name, value in item.items()
+            if name not in stored_item or stored_item[name] != value
+        ]
+
     @abstractmethod
     def delete(self, key: Key) -> None:
         """
@@ -123,6 +199,14 @@ class Store(ABC):
         """
         raise NotImplementedError()
 
+    def finalize_identity(self) -> None:
+        """
+        Finalizes the state of an identity once it has been saved. Stores that buffer the state of
+        many identities override this to persist only when the buffer is full, the rest is
+        persisted by `finalize` at the end of the run.
+        """
+        self.finalize()
+
     @staticmethod
     def _sign(x: int) -> int:
         return (1, -1)[x < 0]
@@ -1,5 +1,4 @@
 from abc import ABC
-from copy import copy
 from typing import Dict
 
 from blurr.core.aggregate import Aggregate
@@ -41,7 +40,7 @@ class Transformer(BaseItemCollection, ABC):
     """
 
     def __init__(self, schema: TransformerSchema, identity: str) -> None:
-        super().__init__(schema, copy(schema.schema_context.context))
+        super().__init__(schema, schema.schema_context.context)
         # Load the nested items into the item
         self._aggregates: Dict[str, Aggregate] = {
             name: TypeLoader.load_item(item_schema.type)(item_schema, identity,
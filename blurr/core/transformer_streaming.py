@@ -1,5 +1,8 @@
 from datetime import datetime
+from typing import Dict
 
+from blurr.core.aggregate import Aggregate
+from blurr.core.aggregate_compiler import CompiledAggregate
 from blurr.core.errors import IdentityError, TimeError
 from blurr.core.record import Record
 from blurr.core.schema_loader import SchemaLoader
@@ -19,6 +22,7 @@ class StreamingTransformerSchema(TransformerSchema):
 
         self.identity = self.build_expression(self.ATTRIBUTE_IDENTITY)
         self.time = self.build_expression(self.ATTRIBUTE_TIME)
+        self._compiled_aggregates: Dict[str, CompiledAggregate] = None
 
     def validate_schema_spec(self) -> None:
         super().validate_schema_spec()
@@ -52,12 +56,39 @@ class StreamingTransformerSchema(TransformerSchema):
         context.remove_record()
         return time
 
+    def get_compiled_aggregates(self,
+                                aggregates: Dict[str, Aggregate]) -> Dict[str, CompiledAggregate]:
+        """
+        Returns the generated evaluation code of the aggregates. The code is generated for the first
+        transformer that requests it and shared by all the transformers of this schema.
+        :param aggregates: Aggregates of the transformer by name.
+        """
+        if self._compiled_aggregates is None:
+            self._compiled_aggregates = {
+                name: CompiledAggregate(aggregate, aggregates)
+                for name, aggregate in aggregates.items()
+            }
+        return self._compiled_aggregates
+
 
 class StreamingTransformer(Transformer):
-    def __init__(self, schema: TransformerSchema, identity: str) -> None:
+    def __init__(self, schema: StreamingTransformerSchema, identity: str,
+                 compiled: bool = False) -> None:
+        """
+        Initializes the transformer for an identity.
+        :param schema: Streaming transformer schema.
+        :param identity: Identity of the records that are evaluated.
+        :param compiled: Evaluate the aggregates with code generated from the BTS instead of
+            interpreting each expression.
+        """
         super().__init__(schema, identity)
         self._evaluation_context.global_add('identity', self._identity)
 
+        if compiled:
+            for name, compiled_aggregate in schema.get_compiled_aggregates(
+                    self._aggregates).items():
+                self._aggregates[name].run_compile(compiled_aggregate, self._aggregates)
+
     def run_evaluate(self, record: Record):
         """
         Evaluates and updates data in the StreamingTransformer.
@@ -75,6 +106,22 @@ class StreamingTransformer(Transformer):
         self._evaluation_context.add_record(record)
         self._evaluation_context.global_add('time',
                                             self._schema.time.evaluate(self._evaluation_context))
+        self._evaluate_record()
+
+    def run_evaluate_trusted(self, record: Record, time: datetime) -> None:
+        """
+        Evaluates and updates data in the StreamingTransformer using the time that the caller
+        has already determined for the record, e.g. through `get_identity` and `get_time` when the
+        records were grouped by identity. Neither the identity nor the time expression is evaluated
+        again, so the caller must ensure that the record belongs to the transformer's identity.
+        :param record: The 'source' record used for the update.
+        :param time: The time of the record.
+        """
+        self._evaluation_context.add_record(record)
+        self._evaluation_context.global_add('time', time)
+        self._evaluate_record()
+
+    def _evaluate_record(self) -> None:
         super().run_evaluate()
 
         # Cleanup source and time form the context
@@ -1,13 +1,20 @@
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+from blurr.core import logging
 from blurr.core.aggregate_block import BlockAggregate, TimeAggregate
-from blurr.core.aggregate_window import WindowAggregate
+from blurr.core.aggregate_time import TimeAggregateSchema
+from blurr.core.aggregate_window import BlockCache, BlockSequence, WindowAggregate
 from blurr.core.anchor import Anchor
-from blurr.core.errors import AnchorBlockNotDefinedError
+from blurr.core.base import BaseSchemaCollection
+from blurr.core.errors import AnchorBlockNotDefinedError, PrepareWindowMissingBlocksError, \
+    SnapshotError
 from blurr.core.evaluation import Context, EvaluationContext
+from blurr.core.field import FieldSchema
 from blurr.core.schema_loader import SchemaLoader
+from blurr.core.store_key import Key
 from blurr.core.transformer import Transformer, TransformerSchema
 from blurr.core.type import Type
+from blurr.core.window_array import require_numpy
 
 
 class WindowTransformerSchema(TransformerSchema):
@@ -23,6 +30,21 @@ class WindowTransformerSchema(TransformerSchema):
 
         self.anchor = self.schema_loader.get_schema_object(
             self.fully_qualified_name + '.anchor') if self.ATTRIBUTE_ANCHOR in self._spec else None
+        # (column, aggregate name, field name) of the flattened snapshot in column order. None when
+        # the columns depend on the field values, e.g. on the keys of map fields.
+        self.flattened_columns = self._get_flattened_columns()
+
+    def _get_flattened_columns(self) -> Optional[List[Tuple[str, str, str]]]:
+        columns = []
+        for aggregate_name, aggregate_schema in self.nested_schema.items():
+            if not isinstance(aggregate_schema, BaseSchemaCollection):
+                return None
+            for field_name, field_schema in aggregate_schema.nested_schema.items():
+                if not isinstance(field_schema, FieldSchema) or issubclass(
+                        field_schema.type_object, dict):
+                    return None
+                columns.append((aggregate_name + '.' + field_name, aggregate_name, field_name))
+        return columns
 
     def validate_schema_spec(self) -> None:
         super().validate_schema_spec()
@@ -43,10 +65,47 @@ class WindowTransformer(Transformer):
     block data.
     """
 
-    def __init__(self, schema: WindowTransformerSchema, identity: str, context: Context) -> None:
+    def __init__(self,
+                 schema: WindowTransformerSchema,
+                 identity: str,
+                 context: Context,
+                 source_items: Optional[Dict[Key, Any]] = None) -> None:
+        """
+        Initializes the transformer for an identity.
+        :param schema: Window transformer schema.
+        :param identity: Identity of the blocks that are evaluated.
+        :param context: Context that contains the streaming transformer.
+        :param source_items: All the items of the identity, e.g. from `Store.get_all`. The blocks
+            of the window sources are read from their stores when not provided.
+        """
         super().__init__(schema, identity)
         self._evaluation_context.merge(EvaluationContext(context))
         self._anchor = Anchor(schema.anchor)
+        self._source_items = source_items
+        # The blocks of each window source, restored once for all the anchors of the identity
+        self._block_sequences: Dict[str, BlockSequence] = {}
+        # The restored blocks of each block aggregate, shared by the anchors and the windows
+        self._block_caches: Dict[str, BlockCache] = {}
+        # Names and (field, encoder) of the columns of the flattened snapshot
+        self._flattened_column_names = [
+            column for column, _, _ in schema.flattened_columns
+        ] if schema.flattened_columns is not None else None
+        self._flattened_fields = [
+            (self._nested_items[aggregate_name]._nested_items[field_name],
+             self._nested_items[aggregate_name]._nested_items[field_name]._schema.encoder)
+            for _, aggregate_name, field_name in schema.flattened_columns
+        ] if schema.flattened_columns is not None else None
+
+    def run_restore_block(self, block: TimeAggregate, key: Key,
+                          snapshot: Dict[str, Any]) -> TimeAggregate:
+        """
+        Restores a block to evaluate the anchor condition against, in the same way as
+        `block.run_restore`. Each stored block is decoded once for the anchors and the windows.
+        :param block: Block aggregate to restore.
+        :param key: Key of the snapshot.
+        :param snapshot: Snapshot of the block.
+        """
+        return self._get_block_cache(block._schema).restore(block, key, snapshot)
 
     def run_evaluate(self, block: TimeAggregate) -> bool:
         """
@@ -74,18 +133,165 @@ class WindowTransformer(Transformer):
         if not self._needs_evaluation:
             return
 
+        # The window of the anchor is found once for the window aggregates with the same window
+        # key, which share the window source
+        window_sources = {}
         for item in self._nested_items.values():
             if isinstance(item, WindowAggregate):
-                item._prepare_window(self._anchor.anchor_block._start_time)
+                window_key = item._schema.window_key
+                if window_key in window_sources:
+                    item._set_window(window_sources[window_key])
+                else:
+                    item._prepare_window(self._anchor.anchor_block._start_time,
+                                         self._get_block_sequence(item._schema.source))
+                    window_sources[window_key] = item._window_source
 
         super().run_evaluate()
 
+    def run_evaluate_batch(self, block: TimeAggregate, items: List[Tuple[Key, Dict[str, Any]]]
+                           ) -> Tuple[List[List[str]], List[Tuple]]:
+        """
+        Evaluates the window BTS for all the blocks at once and returns the feature matrix, with
+        the same rows as `run_evaluate` and `run_flattened_row` for each block:
+            1. The anchor condition is evaluated on the arrays of the fields of all the blocks.
+            2. The windows of all the anchors are found with a binary search of all the start
+               times of the anchors in the block sequence of the window source, once for the
+               window aggregates with the same window key.
+            3. Fields that are only a reduction of a window source column, e.g.
+               `sum(source.events)`, are computed for all the windows at once.
+        The other fields are evaluated for each anchor. Requires numpy.
+        :param block: Block aggregate that the blocks are restored into.
+        :param items: (Key, snapshot) of the blocks.
+        :return: The names of the columns of each row and the rows of the feature matrix. The
+            rows share the same list of names unless the columns depend on the field values, e.g.
+            on the keys of map fields.
+        """
+        require_numpy()
+        block_cache = self._get_block_cache(block._schema)
+        conditions, start_times = self._anchor.evaluate_anchor_batch(
+            block, items, block_cache, self._evaluation_context)
+        anchors = [i for i, condition_met in enumerate(conditions) if condition_met]
+        anchor_start_times = [start_times[i] for i in anchors]
+
+        # (block sequence, lows, highs) of the windows by window key, and the window key of each
+        # window aggregate
+        windows = {}
+        window_keys = {}
+        reductions = {}
+        for name, item in self._nested_items.items():
+            if isinstance(item, WindowAggregate) and anchors:
+                window_key = window_keys[name] = item._schema.window_key
+                if window_key not in windows:
+                    block_sequence = self._get_block_sequence(item._schema.source)
+                    windows[window_key] = (block_sequence, ) + item._get_window_ranges(
+                        anchor_start_times, block_sequence)
+                block_sequence, lows, highs = windows[window_key]
+                reductions[name] = item._get_batch_reductions(block_sequence, lows, highs)
+        windows = {
+            window_key: (block_sequence, lows.tolist(), highs.tolist())
+            for window_key, (block_sequence, lows, highs) in windows.items()
+        }
+
+        columns = []
+        rows = []
+        for position, index in enumerate(anchors):
+            key, snapshot = items[index]
+            self._anchor.anchor_block = block_cache.restore(block, key, snapshot)
+            if self._anchor.max_condition_met(block):
+                continue
+
+            try:
+                self.run_reset()
+                self._evaluation_context.global_add('anchor', block)
+                self._evaluate_batch(position, windows, window_keys, reductions)
+                self._anchor.add_condition_met()
+                if self._flattened_fields is None:
+                    snapshot = self.run_flattened_snapshot
+                    columns.append(list(snapshot))
+                    rows.append(tuple(snapshot.values()))
+                else:
+                    columns.append(self._flattened_column_names)
+                    rows.append(self.run_flattened_row)
+            except PrepareWindowMissingBlocksError as err:
+                logging.debug('{} with {}'.format(err, key))
+            finally:
+                self._evaluation_context.global_remove('anchor')
+
+        return columns, rows
+
+    def _evaluate_batch(self, position: int,
+                        windows: Dict[Tuple, Tuple[BlockSequence, List[int], List[int]]],
+                        window_keys: Dict[str, Tuple],
+                        reductions: Dict[str, Dict[str, List[Any]]]) -> None:
+        """ Evaluates the anchor at a position in the batch in the same way as `_evaluate` """
+        if not self._needs_evaluation:
+            return
+
+        window_sources = {}
+        for name, window_key in window_keys.items():
+            item = self._nested_items[name]
+            if window_key not in window_sources:
+                block_sequence, lows, highs = windows[window_key]
+                window_sources[window_key] = item._get_window_source(
+                    block_sequence, lows[position], highs[position])
+            item._set_window(window_sources[window_key])
+
+        if self._needs_evaluation:
+            for name, item in self._nested_items.items():
+                if name in reductions:
+                    item._evaluate_with_reductions({
+                        field: results[position]
+                        for field, results in reductions[name].items()
+                    })
+                else:
+                    item.run_evaluate()
+
+    def _get_block_sequence(self, source: TimeAggregateSchema) -> BlockSequence:
+        if source.fully_qualified_name not in self._block_sequences:
+            if self._source_items is None:
+                items = self._schema.schema_loader.get_store(
+                    source.store_schema.fully_qualified_name).iterate_all(self._identity)
+            else:
+                items = self._source_items.items()
+            self._block_sequences[source.fully_qualified_name] = BlockSequence(
+                source, self._identity, items, self._get_block_cache(source))
+        return self._block_sequences[source.fully_qualified_name]
+
+    def _get_block_cache(self, source: TimeAggregateSchema) -> BlockCache:
+        if source.fully_qualified_name not in self._block_caches:
+            self._block_caches[source.fully_qualified_name] = BlockCache(source, self._identity)
+        return self._block_caches[source.fully_qualified_name]
+
+    @property
+    def run_flattened_columns(self) -> List[str]:
+        """
+        Returns the names of the columns of the flattened snapshot, <aggregate_name>.<field_name>.
+        """
+        if self._flattened_fields is None:
+            return list(self.run_flattened_snapshot)
+        return list(self._flattened_column_names)
+
+    @property
+    def run_flattened_row(self) -> Tuple:
+        """
+        Returns the values of the flattened snapshot in the order of `run_flattened_columns`.
+        """
+        if self._flattened_fields is None:
+            return tuple(self.run_flattened_snapshot.values())
+        try:
+            return tuple([encoder(field.value) for field, encoder in self._flattened_fields])
+        except Exception as e:
+            raise SnapshotError('Error while creating snapshot for {}'.format(self._name)) from e
+
     @property
     def run_flattened_snapshot(self) -> Dict:
         """
         Generates a flattened snapshot where the final key for a field is <aggregate_name>.<field_name>.
         :return: The flattened snapshot.
         """
+        if self._flattened_fields is not None:
+            return dict(zip(self._flattened_column_names, self.run_flattened_row))
+
         snapshot_dict = super()._snapshot
 
         # Flatten to feature dict
@@ -13,6 +13,8 @@ class Type(Enum):
     BLURR_AGGREGATE_WINDOW = "blurr:aggregate:window"
     BLURR_STORE_MEMORY = "blurr:store:memory"
     BLURR_STORE_DYNAMO = "blurr:store:dynamo"
+    BLURR_STORE_SQLITE = "blurr:store:sqlite"
+    BLURR_STORE_SEGMENT = "blurr:store:segment"
     ANCHOR = "anchor"
     DAY = "day"
     HOUR = "hour"
@@ -42,7 +44,12 @@ class Type(Enum):
 
     @staticmethod
     def is_store_type(store_type: Union[str, 'Type']) -> bool:
-        return Type.is_type_in(store_type, [Type.BLURR_STORE_MEMORY, Type.BLURR_STORE_DYNAMO])
+        return Type.is_type_in(
+            store_type,
+            [
+                Type.BLURR_STORE_MEMORY, Type.BLURR_STORE_DYNAMO, Type.BLURR_STORE_SQLITE,
+                Type.BLURR_STORE_SEGMENT
+            ])
 
     @staticmethod
     def contains(value: Union[str, 'Type']) -> bool:
@@ -0,0 +1,52 @@
+from typing import Any, List, Optional, Union
+
+from blurr.core.type import Type
+
+_numpy_import_err = None
+try:
+    import numpy
+except ImportError as err:
+    # Ignore import error because numpy is only required by vectorized window aggregates
+    _numpy_import_err = err
+    numpy = None
+
+# Types of the values that the columns of the source fields of a type are stored in. Columns of
+# the fields of other types, or with values of other types, are stored in object arrays.
+_FIELD_ARRAY_TYPES = {
+    Type.INTEGER: ('int64', (int, )),
+    Type.FLOAT: ('float64', (int, float)),
+    Type.BOOLEAN: ('bool', (bool, )),
+}
+
+
+def require_numpy() -> None:
+    """ Raises the error from importing numpy if numpy is not installed """
+    if _numpy_import_err:
+        raise _numpy_import_err
+
+
+def get_array(values: List[Any], field_type: Optional[Union[str, Type]] = None) -> 'numpy.ndarray':
+    """
+    Returns the values as a typed numpy array, or as an object array if the values cannot be
+    stored in the array type of the field.
+    :param values: Values of a column.
+    :param field_type: Type of the field of the values. None if the values are not of a field.
+    """
+    require_numpy()
+    array_type = _FIELD_ARRAY_TYPES.get(Type(field_type), None) if field_type and Type.contains(
+        field_type) else None
+    if array_type:
+        dtype, value_types = array_type
+        # Values of other types are not converted, e.g. floats in an integer field are not
+        # truncated and integers beyond 64 bits do not overflow
+        if all(type(value) in value_types for value in values):
+            try:
+                return numpy.array(values, dtype=dtype)
+            except OverflowError:
+                pass
+
+    # Assigned one by one so that lists and tuples are kept as values instead of as dimensions
+    array = numpy.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
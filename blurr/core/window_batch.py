@@ -0,0 +1,191 @@
+import ast
+import sys
+from datetime import date, datetime
+from functools import reduce
+from typing import Any, Dict, List, Optional
+
+from blurr.core.aggregate_block import TimeAggregate
+from blurr.core.evaluation import EvaluationContext, Expression
+from blurr.core.transformer import Transformer
+from blurr.core.window_array import get_array, numpy
+
+# Functions that the operators of a batch condition are replaced with
+BATCH_AND = '_batch_and'
+BATCH_OR = '_batch_or'
+BATCH_NOT = '_batch_not'
+BATCH_OPERAND = '_batch_operand'
+
+_COMPARISON_OPERATORS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+_CONSTANT_NODES = (ast.Constant, ) if sys.version_info >= (3, 8) else (ast.Num, ast.Str,
+                                                                         ast.NameConstant)
+_SUPPORTED_NODES = (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not,
+                    ast.Compare, ast.Name, ast.Attribute, ast.Load
+                    ) + _COMPARISON_OPERATORS + _CONSTANT_NODES
+
+# Values that the operands of a batch condition are compared as, other than the field columns
+_SCALAR_TYPES = (bool, int, float, str, type(None), date, datetime)
+
+
+def _is_supported(tree: ast.AST) -> bool:
+    """
+    Returns True if the expression only compares attributes, e.g. `stream.session.events > 1`,
+    and constants, and combines the comparisons with `and`, `or` and `not`.
+    """
+    for node in ast.walk(tree):
+        if not isinstance(node, _SUPPORTED_NODES):
+            return False
+        if isinstance(node, ast.UnaryOp) and not isinstance(node.op, ast.Not):
+            return False
+        # Only the fields of the aggregates of a transformer are read, e.g. `stream.session.events`
+        if isinstance(node, ast.Attribute) and not (isinstance(node.value, ast.Name) or (
+                isinstance(node.value, ast.Attribute) and isinstance(node.value.value, ast.Name))):
+            return False
+    return True
+
+
+def _get_call(name: str, *args: ast.expr) -> ast.Call:
+    return ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=list(args), keywords=[])
+
+
+class _BatchConditionTransformer(ast.NodeTransformer):
+    """
+    Replaces the boolean operators of a condition with the functions that combine the arrays of the
+    conditions of all the blocks, and checks the operands that the comparisons are evaluated on.
+    """
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> ast.AST:
+        self.generic_visit(node)
+        return _get_call(BATCH_AND if isinstance(node.op, ast.And) else BATCH_OR, *node.values)
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.AST:
+        self.generic_visit(node)
+        return _get_call(BATCH_NOT, node.operand)
+
+    def visit_Compare(self, node: ast.Compare) -> ast.AST:
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+
+        # Chained comparisons are evaluated as the conjunction of the comparisons
+        operands = [node.left] + node.comparators
+        return _get_call(BATCH_AND, *[
+            ast.Compare(left=operands[i], ops=[operator], comparators=[operands[i + 1]])
+            for i, operator in enumerate(node.ops)
+        ])
+
+    def visit_Attribute(self, node: ast.Attribute) -> ast.AST:
+        return _get_call(BATCH_OPERAND, node)
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        return _get_call(BATCH_OPERAND, node)
+
+
+class _BlockColumns:
+    """ Block whose fields are the arrays of the field values of all the blocks """
+
+    def __init__(self, columns: Dict[str, 'numpy.ndarray']) -> None:
+        self._columns = columns
+
+    def __getattr__(self, item: str) -> 'numpy.ndarray':
+        return self._columns[item]
+
+    def __getitem__(self, item: str) -> 'numpy.ndarray':
+        return self._columns[item]
+
+
+class _TransformerColumns:
+    """ Transformer in which the block is replaced by the arrays of the fields of all the blocks """
+
+    def __init__(self, transformer: Transformer, block_name: str,
+                 block_columns: _BlockColumns) -> None:
+        self._transformer = transformer
+        self._block_name = block_name
+        self._block_columns = block_columns
+
+    def __getattr__(self, item: str) -> Any:
+        return self._block_columns if item == self._block_name else getattr(
+            self._transformer, item)
+
+    def __getitem__(self, item: str) -> Any:
+        return self.__getattr__(item)
+
+
+class BatchCondition(Expression):
+    """
+    Condition that is evaluated for all the blocks at once on numpy arrays of the block fields.
+    The operators are evaluated element-wise with the same results as the condition evaluated
+    against each block. Evaluations that cannot be done element-wise, e.g. of values that cannot
+    be compared, return None so that the condition is evaluated against each block instead.
+    """
+
+    def __init__(self, code_string: str, tree: ast.Expression) -> None:
+        super().__init__(code_string)
+        self.code_object = compile(tree, '<string>', self.type.value)
+
+    def evaluate_blocks(self, evaluation_context: EvaluationContext, block: TimeAggregate,
+                        columns: Dict[str, List[Any]]) -> Optional[List[bool]]:
+        """
+        Returns whether the condition is met by each block. None if the condition cannot be
+        evaluated on the arrays of the block fields.
+        :param evaluation_context: Context the condition is evaluated in.
+        :param block: Block aggregate that the condition reads the fields of.
+        :param columns: Values of each field of the block aggregate for all the blocks.
+        """
+        length = len(next(iter(columns.values()), []))
+
+        def truth(value: Any) -> Any:
+            return value.astype(bool) if isinstance(value, numpy.ndarray) else bool(value)
+
+        def check_operand(value: Any) -> Any:
+            if isinstance(value, numpy.ndarray):
+                if value.shape != (length, ):
+                    raise TypeError('Array of shape {} is not a column'.format(value.shape))
+            elif not isinstance(value, _SCALAR_TYPES):
+                raise TypeError('{} values are not compared element-wise'.format(
+                    type(value).__name__))
+            return value
+
+        block_columns = _BlockColumns({
+            name: get_array(values, block._schema.nested_schema[name].type)
+            for name, values in columns.items()
+        })
+        global_context = dict(evaluation_context.global_context)
+        for name, value in global_context.items():
+            if isinstance(value, Transformer) and value._nested_items.get(
+                    block._schema.name, None) is block:
+                global_context[name] = _TransformerColumns(value, block._schema.name,
+                                                           block_columns)
+        global_context.update({
+            BATCH_AND: lambda *values: reduce(numpy.logical_and, map(truth, values)),
+            BATCH_OR: lambda *values: reduce(numpy.logical_or, map(truth, values)),
+            BATCH_NOT: lambda value: numpy.logical_not(truth(value)),
+            BATCH_OPERAND: check_operand,
+        })
+
+        try:
+            result = eval(self.code_object, global_context, evaluation_context.local_context)
+        except Exception:
+            return None
+
+        if isinstance(result, numpy.ndarray):
+            return result.astype(bool).tolist() if result.shape == (length, ) else None
+        if isinstance(result, (bool, numpy.bool_)):
+            return [bool(result)] * length
+        return None
+
+
+def get_batch_condition(expression: Optional[Expression]) -> Optional[BatchCondition]:
+    """
+    Returns the condition to evaluate for all the blocks at once. None if the expression does not
+    only compare attributes and constants.
+    :param expression: Anchor condition.
+    """
+    if expression is None:
+        return None
+
+    tree = ast.parse(expression.code_string, mode='eval')
+    if not _is_supported(tree):
+        return None
+
+    tree = ast.fix_missing_locations(_BatchConditionTransformer().visit(tree))
+    return BatchCondition(expression.code_string, tree)
@@ -0,0 +1,306 @@
+import ast
+import builtins
+import sys
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from blurr.core.dependency import get_bound_names, get_string_constant, SOURCE_NAME
+from blurr.core.evaluation import Expression, ExpressionType
+from blurr.core.window_array import get_array, numpy
+
+# Builtins whose result over a range of a window source column is computed incrementally
+REDUCTION_NAMES = {'sum', 'len', 'min', 'max', 'any', 'all'}
+
+# Method of the window source that the reductions in the window expressions are replaced with
+REDUCE_METHOD = '_reduce'
+
+# Types that are totally ordered, so that a range minimum or maximum can be combined from the
+# minimum or maximum of overlapping sub-ranges
+_ORDERED_TYPES = {int, float, bool, str, datetime}
+
+
+class _ReductionTransformer(ast.NodeTransformer):
+    """
+    Replaces the calls `function(source.attribute)` of the reduction builtins in a window
+    expression with `source._reduce(function, 'attribute')`. The function is still resolved by the
+    expression, so names that shadow the builtins are evaluated as before.
+    """
+
+    def __init__(self) -> None:
+        self.replaced = 0
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        self.generic_visit(node)
+        if not (isinstance(node.func, ast.Name) and node.func.id in REDUCTION_NAMES
+                and len(node.args) == 1 and not node.keywords):
+            return node
+
+        argument = node.args[0]
+        if not (isinstance(argument, ast.Attribute) and isinstance(argument.value, ast.Name)
+                and argument.value.id == SOURCE_NAME):
+            return node
+
+        self.replaced += 1
+        call = ast.Call(
+            func=ast.Attribute(
+                value=ast.Name(id=SOURCE_NAME, ctx=ast.Load()), attr=REDUCE_METHOD,
+                ctx=ast.Load()),
+            args=[
+                node.func,
+                ast.Str(s=argument.attr)
+                if sys.version_info < (3, 8) else ast.Constant(value=argument.attr)
+            ],
+            keywords=[])
+        for child in ast.walk(call):
+            ast.copy_location(child, node)
+        return call
+
+
+class ReductionExpression(Expression):
+    """
+    Window expression in which the reductions of the window source columns are computed by the
+    window source. Keeps the code string of the original expression for the error messages.
+    """
+
+    def __init__(self, code_string: str, tree: ast.Expression) -> None:
+        self.code_string = code_string
+        self.type = ExpressionType.EVAL
+        self.code_object = compile(tree, '<string>', self.type.value)
+        # (function name, attribute) when the expression is only the reduction of a column, e.g.
+        # `sum(source.events)`, which can be computed for many windows at once
+        self.reduction: Optional[Tuple[str, str]] = self._get_reduction(tree)
+
+    @staticmethod
+    def _get_reduction(tree: ast.Expression) -> Optional[Tuple[str, str]]:
+        call = tree.body
+        if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute)
+                and call.func.attr == REDUCE_METHOD and isinstance(call.func.value, ast.Name)
+                and call.func.value.id == SOURCE_NAME and len(call.args) == 2
+                and isinstance(call.args[0], ast.Name)
+                and get_string_constant(call.args[1]) is not None):
+            return None
+        return call.args[0].id, get_string_constant(call.args[1])
+
+
+def get_window_expression(expression: Optional[Expression]) -> Optional[Expression]:
+    """
+    Returns the expression with the reductions of the window source columns replaced, or the
+    expression itself when it has none.
+    :param expression: Expression of a window aggregate or of its fields.
+    """
+    if expression is None or expression.type != ExpressionType.EVAL:
+        return expression
+
+    tree = ast.parse(expression.code_string, mode='eval')
+    # The reductions cannot be replaced when `source` is bound to something else in the expression
+    if SOURCE_NAME in get_bound_names(tree):
+        return expression
+
+    transformer = _ReductionTransformer()
+    tree = ast.fix_missing_locations(transformer.visit(tree))
+    if not transformer.replaced:
+        return expression
+    return ReductionExpression(expression.code_string, tree)
+
+
+class ColumnReductions:
+    """
+    Computes the reduction builtins over ranges of a column in constant time, with structures that
+    are built once for the column when a reduction is first used:
+        1. `sum` of integers and `any` and `all` from prefix sums.
+        2. `min` and `max` of ordered values from sparse tables of the range minimum or maximum.
+    The results are the same as the builtin applied to the values of the range. The builtin is
+    applied to the values of the range when a column does not support the incremental reduction,
+    e.g. for the `sum` of floats which depends on the order of the additions.
+    """
+
+    def __init__(self, values: List[Any]) -> None:
+        self._values = values
+        self._sums: Optional[List[int]] = None
+        self._truths: Optional[List[int]] = None
+        self._minimums: Optional[List[List[Any]]] = None
+        self._maximums: Optional[List[List[Any]]] = None
+        # numpy arrays of the structures, for the reductions of many ranges at once
+        self._arrays: Dict[str, Any] = {}
+        self._reductions = {
+            builtins.sum: self._sum,
+            builtins.len: self._len,
+            builtins.min: self._min,
+            builtins.max: self._max,
+            builtins.any: self._any,
+            builtins.all: self._all,
+        }
+
+    def reduce(self, function: Callable[[List[Any]], Any], low: int, high: int) -> Any:
+        """
+        Returns `function(values[low:high])`.
+        :param function: Reduction applied to the values.
+        :param low: Index of the first value of the range.
+        :param high: Index after the last value of the range.
+        """
+        reduction = self._reductions.get(function, None)
+        if reduction is None or low >= high:
+            return function(self._values[low:high])
+        return reduction(low, high)
+
+    def reduce_batch(self, function: Callable[[List[Any]], Any], lows: 'numpy.ndarray',
+                     highs: 'numpy.ndarray') -> Optional[List[Any]]:
+        """
+        Returns `function(values[low:high])` for each of the ranges, computed with numpy for all the
+        ranges at once. None if the reduction is not computed incrementally for the column. The
+        results of empty ranges are None.
+        :param function: Reduction applied to the values.
+        :param lows: Indexes of the first value of the ranges.
+        :param highs: Indexes after the last value of the ranges.
+        """
+        ranges = numpy.flatnonzero(highs > lows)
+        range_lows = lows[ranges]
+        range_highs = highs[ranges]
+        if function is builtins.len:
+            results = range_highs - range_lows
+        elif function is builtins.sum:
+            if not self._get_sums():
+                return None
+            # Object array of the integer sums, so that the sums are not limited to 64 bits
+            sums = self._get_array('sums', self._get_sums)
+            results = sums[range_highs] - sums[range_lows]
+        elif function is builtins.any or function is builtins.all:
+            truths = self._get_array('truths', self._get_truths)
+            counts = truths[range_highs] - truths[range_lows]
+            results = counts > 0 if function is builtins.any else counts == range_highs - range_lows
+        elif function is builtins.min or function is builtins.max:
+            results = self._query_sparse_table_batch(function is builtins.min, range_lows,
+                                                     range_highs)
+            if results is None:
+                return None
+        else:
+            return None
+
+        batch_results: List[Any] = [None] * len(lows)
+        for index, result in zip(ranges.tolist(), results.tolist()):
+            batch_results[index] = result
+        return batch_results
+
+    def _get_array(self, name: str, get_values: Callable[[], List[Any]]) -> 'numpy.ndarray':
+        if name not in self._arrays:
+            self._arrays[name] = get_array(get_values())
+        return self._arrays[name]
+
+    @staticmethod
+    def _get_prefix_sums(values: List[int]) -> List[int]:
+        sums = [0]
+        for value in values:
+            sums.append(sums[-1] + value)
+        return sums
+
+    def _get_sums(self) -> List[int]:
+        if self._sums is None:
+            # Integer additions are exact, so the sum of a range is the difference of prefix sums
+            self._sums = self._get_prefix_sums(self._values) if all(
+                type(value) in (int, bool) for value in self._values) else []
+        return self._sums
+
+    def _sum(self, low: int, high: int) -> Any:
+        sums = self._get_sums()
+        if not sums:
+            return sum(self._values[low:high])
+        return sums[high] - sums[low]
+
+    def _len(self, low: int, high: int) -> int:
+        return high - low
+
+    def _get_truths(self) -> List[int]:
+        if self._truths is None:
+            self._truths = self._get_prefix_sums([bool(value) for value in self._values])
+        return self._truths
+
+    def _count_truths(self, low: int, high: int) -> int:
+        truths = self._get_truths()
+        return truths[high] - truths[low]
+
+    def _any(self, low: int, high: int) -> bool:
+        return self._count_truths(low, high) > 0
+
+    def _all(self, low: int, high: int) -> bool:
+        return self._count_truths(low, high) == high - low
+
+    def _build_sparse_table(self, choose: Callable[[Any, Any], Any]) -> List[List[Any]]:
+        """
+        Returns the levels of a sparse table, where level k holds the value chosen out of each
+        range of 2^k values. Empty if the values are not totally ordered.
+        """
+        if not all(type(value) in _ORDERED_TYPES for value in self._values) or any(
+                value != value for value in self._values):
+            return []
+
+        table = [self._values]
+        width = 1
+        try:
+            while width * 2 <= len(self._values):
+                level = table[-1]
+                table.append([
+                    choose(level[i], level[i + width])
+                    for i in range(len(self._values) - 2 * width + 1)
+                ])
+                width *= 2
+        except TypeError:
+            # Values of types that cannot be compared with each other, e.g. strings and numbers
+            return []
+        return table
+
+    def _get_sparse_table(self, minimum: bool) -> List[List[Any]]:
+        if minimum:
+            if self._minimums is None:
+                self._minimums = self._build_sparse_table(self._choose_minimum)
+            return self._minimums
+
+        if self._maximums is None:
+            self._maximums = self._build_sparse_table(self._choose_maximum)
+        return self._maximums
+
+    @staticmethod
+    def _query_sparse_table(table: List[List[Any]], choose: Callable[[Any, Any], Any], low: int,
+                            high: int) -> Any:
+        level = (high - low).bit_length() - 1
+        return choose(table[level][low], table[level][high - (1 << level)])
+
+    def _query_sparse_table_batch(self, minimum: bool, lows: 'numpy.ndarray',
+                                  highs: 'numpy.ndarray') -> Optional['numpy.ndarray']:
+        table = self._get_sparse_table(minimum)
+        if not table:
+            return None
+
+        levels = numpy.array([width.bit_length() - 1 for width in (highs - lows).tolist()],
+                             dtype='int64')
+        results = get_array([None] * len(lows))
+        for level in numpy.unique(levels).tolist():
+            ranges = numpy.flatnonzero(levels == level)
+            values = self._get_array('{}{}'.format('minimums' if minimum else 'maximums', level),
+                                     lambda: table[level])
+            first = values[lows[ranges]]
+            second = values[highs[ranges] - (1 << level)]
+            # The first of equal values is kept, in the same way as `_choose_minimum`
+            chosen = (second < first) if minimum else (second > first)
+            results[ranges] = numpy.where(chosen.astype(bool), second, first)
+        return results
+
+    # The first of equal values is kept, in the same way as the builtins
+    @staticmethod
+    def _choose_minimum(first: Any, second: Any) -> Any:
+        return second if second < first else first
+
+    @staticmethod
+    def _choose_maximum(first: Any, second: Any) -> Any:
+        return second if second > first else first
+
+    def _min(self, low: int, high: int) -> Any:
+        table = self._get_sparse_table(True)
+        if not table:
+            return min(self._values[low:high])
+        return self._query_sparse_table(table, self._choose_minimum, low, high)
+
+    def _max(self, low: int, high: int) -> Any:
+        table = self._get_sparse_table(False)
+        if not table:
+            return max(self._values[low:high])
+        return self._query_sparse_table(table, self._choose_maximum, low, high)
@@ -1,24 +1,40 @@
 import json
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import List, Dict, Optional, Iterable
 
 from blurr.core.record import Record
 
 
 class DataProcessor(ABC):
+    def __init__(self, projection: Optional[Iterable[str]] = None) -> None:
+        """
+        Initializes the data processor.
+        :param projection: Attributes to keep in the records, e.g. the `source_projection` of the
+            execution plan. Other attributes are dropped as soon as an event is decoded. All the
+            attributes are kept if None.
+        """
+        self.projection = None if projection is None else frozenset(projection)
+
     @abstractmethod
     def process_data(self, data_string: str) -> List[Record]:
         pass
 
+    def create_record(self, data: Dict) -> Record:
+        """ Creates a record from the decoded event, keeping only the projected attributes """
+        if self.projection is None:
+            return Record(data)
+
+        return Record({key: value for key, value in data.items() if key in self.projection})
+
 
 class SimpleJsonDataProcessor(DataProcessor):
     def process_data(self, data_string: str) -> List[Record]:
-        return [Record(json.loads(data_string))]
+        return [self.create_record(json.loads(data_string))]
 
 
 class SimpleDictionaryDataProcessor(DataProcessor):
     def process_data(self, data_dict: Dict) -> List[Record]:
-        return [Record(data_dict)]
+        return [self.create_record(data_dict)]
 
 
 class IpfixDataProcessor(DataProcessor):
@@ -43,6 +59,6 @@ class IpfixDataProcessor(DataProcessor):
                 i = event_dict.get('I', 0)
                 record[self.IPFIX_EVENT_MAPPER.get(i, i)] = event_dict['V']
             if self.IPFIX_EVENT_MAPPER[56] in record:
-                record_list.append(Record(record))
+                record_list.append(self.create_record(record))
 
         return record_list
@@ -0,0 +1,109 @@
+from copy import deepcopy
+from typing import Any, Dict, Optional, Set
+
+from blurr.core.aggregate_time import TimeAggregateSchema
+from blurr.core.schema_loader import SchemaLoader
+from blurr.core.store import Store
+from blurr.core.transformer_streaming import StreamingTransformerSchema
+from blurr.core.transformer_window import WindowTransformerSchema
+from blurr.core.type import Type
+
+
+class ExecutionPlan:
+    """
+    Compiled form of a streaming BTS and an optional window BTS.
+
+    Building the plan adds the specs to a `SchemaLoader`, validates them and compiles all the
+    expressions exactly once. The resulting schema objects are shared by every identity executed
+    against the plan. Only per-identity state (transformers and the contents of the stores) is
+    created for each identity, using `reset_identity_state()`. The stores are finalized after the
+    state of each identity is saved, using `finalize_identity_state()`, and at the end of the run,
+    using `finalize()`.
+    """
+
+    def __init__(self,
+                 stream_bts: Dict[str, Any],
+                 window_bts: Optional[Dict[str, Any]] = None,
+                 compiled: bool = False):
+        """
+        Builds the plan from the BTS dictionaries. The dictionaries are copied as building the
+        schema extends the spec with internal fields.
+        :param stream_bts: Streaming BTS dictionary.
+        :param window_bts: Window BTS dictionary. None if only the streaming BTS is executed.
+        :param compiled: Evaluate the streaming aggregates with code generated from the BTS
+            instead of interpreting each expression.
+        """
+        self.compiled = compiled
+        self.schema_loader = SchemaLoader()
+
+        stream_bts_name = self.schema_loader.add_schema_spec(deepcopy(stream_bts))
+        self.stream_transformer_schema: StreamingTransformerSchema = \
+            self.schema_loader.get_schema_object(stream_bts_name)
+
+        self.window_transformer_schema: Optional[WindowTransformerSchema] = None
+        if window_bts is not None:
+            window_bts_name = self.schema_loader.add_schema_spec(deepcopy(window_bts))
+            self.window_transformer_schema = self.schema_loader.get_schema_object(window_bts_name)
+
+    @property
+    def block_aggregate_schema(self) -> TimeAggregateSchema:
+        """
+        Returns the schema of the only time aggregate in the streaming BTS which is used as the
+        source of the window BTS anchors.
+        """
+        block_schema = None
+        for aggregate_schema in self.stream_transformer_schema.nested_schema.values():
+            if not isinstance(aggregate_schema, TimeAggregateSchema):
+                continue
+            if block_schema is not None:
+                raise Exception(('Window operation is supported against Streaming ',
+                                 'BTS with only one BlockAggregate'))
+            block_schema = aggregate_schema
+
+        if block_schema is None:
+            raise Exception('No BlockAggregate found in the Streaming BTS file')
+
+        return block_schema
+
+    @property
+    def source_projection(self) -> Optional[Set[str]]:
+        """
+        Returns the attributes of the source records that the streaming BTS reads. None if all the
+        attributes may be read. Data processors use it to drop the unused attributes.
+        """
+        return self.schema_loader.get_dependency_graph(
+            self.stream_transformer_schema.fully_qualified_name).source_projection
+
+    @property
+    def store(self) -> Store:
+        """ Returns the store that holds the streaming BTS state. """
+        stores = self.schema_loader.get_all_stores()
+        if not stores:
+            fq_name_and_schema = self.schema_loader.get_schema_specs_of_type(
+                Type.BLURR_STORE_DYNAMO, Type.BLURR_STORE_MEMORY, Type.BLURR_STORE_SQLITE,
+                Type.BLURR_STORE_SEGMENT)
+            return self.schema_loader.get_store(next(iter(fq_name_and_schema)))
+
+        return stores[0]
+
+    def reset_identity_state(self) -> None:
+        """
+        Discards the store instances used by the previous identity so that the next identity starts
+        with an empty state.
+        """
+        self.schema_loader.reset_stores()
+
+    def finalize_identity_state(self) -> None:
+        """
+        Finalizes the stores once the streaming BTS has saved the state of an identity, so that
+        the state is persisted before the next identity is processed.
+        """
+        for store in self.schema_loader.get_all_stores():
+            store.finalize_identity()
+
+    def finalize(self) -> None:
+        """
+        Finalizes the stores at the end of a run, after the state of the last identity is saved.
+        """
+        for store in self.schema_loader.get_all_stores():
+            store.finalize()
@@ -0,0 +1,104 @@
+import heapq
+import pickle
+import tempfile
+from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
+from typing import IO, Iterator, List, Optional, Tuple, Generator
+
+from blurr.runner.runner import TimeAndRecord
+
+_SortEntry = Tuple[str, datetime, bytes]
+
+_sort_key = itemgetter(0, 1)
+
+
+class ExternalSorter:
+    """
+    Sorts records by (identity, time) using a bounded amount of memory.
+
+    Records are buffered in a serialized form. When the buffer grows beyond the memory budget it is
+    sorted and written to a temporary file as a sorted run. `get_identity_records()` then does a
+    k-way merge of the runs and streams the time ordered records of one identity at a time.
+    """
+
+    # Approximate size in bytes of a buffer entry excluding the serialized record.
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, memory_budget: int, temp_dir: Optional[str] = None) -> None:
+        """
+        Initializes the sorter.
+        :param memory_budget: Approximate number of bytes of records to buffer in memory before
+            spilling a sorted run to disk.
+        :param temp_dir: Directory to write the sorted runs to. The default temporary directory is
+            used if None.
+        """
+        if memory_budget <= 0:
+            raise ValueError('`memory_budget` must be a positive number of bytes.')
+
+        self._memory_budget = memory_budget
+        self._temp_dir = temp_dir
+        self._buffer: List[_SortEntry] = []
+        self._buffer_size = 0
+        self._runs: List[IO] = []
+
+    @property
+    def run_count(self) -> int:
+        """ Number of sorted runs spilled to disk """
+        return len(self._runs)
+
+    def add(self, identity: str, time_and_record: TimeAndRecord) -> None:
+        """
+        Adds a record to the sorter. A sorted run is spilled to disk if the memory budget is
+        exceeded.
+        """
+        time, record = time_and_record
+        serialized_record = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        self._buffer.append((identity, time, serialized_record))
+        self._buffer_size += len(serialized_record) + self.ENTRY_OVERHEAD
+
+        if self._buffer_size >= self._memory_budget:
+            self._spill()
+
+    def _spill(self) -> None:
+        self._buffer.sort(key=_sort_key)
+        run = tempfile.TemporaryFile(dir=self._temp_dir)
+        for entry in self._buffer:
+            pickle.dump(entry, run, pickle.HIGHEST_PROTOCOL)
+        self._runs.append(run)
+
+        self._buffer = []
+        self._buffer_size = 0
+
+    @staticmethod
+    def _read_run(run: IO) -> Iterator[_SortEntry]:
+        run.seek(0)
+        while True:
+            try:
+                yield pickle.load(run)
+            except EOFError:
+                return
+
+    def get_identity_records(self) -> Generator[Tuple[str, Iterator[TimeAndRecord]], None, None]:
+        """
+        Merges the sorted runs and the in-memory buffer. Yields the identities in sorted order along
+        with an iterator over the time ordered records of the identity. The records iterator of an
+        identity must be consumed before advancing to the next identity. The temporary files are
+        deleted once all the identities have been yielded.
+        """
+        self._buffer.sort(key=_sort_key)
+        try:
+            merged = heapq.merge(
+                *[self._read_run(run) for run in self._runs], self._buffer, key=_sort_key)
+            for identity, entries in groupby(merged, key=itemgetter(0)):
+                yield identity, ((time, pickle.loads(record)) for _, time, record in entries)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """ Deletes the sorted runs and clears the buffer """
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._buffer = []
+        self._buffer_size = 0
@@ -5,23 +5,77 @@ Usage:
 """
 import csv
 import json
+import zlib
 from collections import defaultdict
-from typing import List, Optional, Dict, Tuple
+from datetime import datetime
+from itertools import groupby
+from multiprocessing import Pool
+from operator import itemgetter
+from typing import List, Optional, Dict, Tuple, Any, Iterable, Iterator, Generator
 
 from smart_open import smart_open
 
 from blurr.cli.validate import validate
+from blurr.core.errors import RecordOrderError
 from blurr.runner.data_processor import DataProcessor, SimpleJsonDataProcessor
+from blurr.runner.external_sort import ExternalSorter
 from blurr.runner.json_encoder import BlurrJSONEncoder
 from blurr.runner.runner import Runner, TimeAndRecord
 
 
+# Runner used by the worker processes of a LocalRunner. Set once per worker by `_init_worker` so
+# that each worker builds the execution plan only once.
+_worker_runner: 'LocalRunner' = None
+
+
+def _init_worker(runner: 'LocalRunner') -> None:
+    global _worker_runner
+    _worker_runner = runner
+
+
+def _execute_shard(shard: Dict[str, Tuple[List[TimeAndRecord], Optional[Dict]]]
+                   ) -> Dict[str, Tuple[Dict, List]]:
+    per_user_data = {}
+    for identity, (records, old_state) in shard.items():
+        _, data = _worker_runner.execute_per_identity_records(identity, records, old_state)
+        per_user_data[identity] = data
+    _worker_runner.finalize()
+    return per_user_data
+
+
 class LocalRunner(Runner):
-    def __init__(self, stream_bts_file: str, window_bts_file: Optional[str] = None):
-        super().__init__(stream_bts_file, window_bts_file)
+    def __init__(self,
+                 stream_bts_file: str,
+                 window_bts_file: Optional[str] = None,
+                 workers: int = 1,
+                 compiled: bool = False,
+                 batch_windows: bool = False):
+        """
+        Initialize LocalRunner.
+
+        :param stream_bts_file: Streaming BTS to use.
+        :param window_bts_file: Window BTS to use. If none is provided only the streaming BTS output
+            is generated.
+        :param workers: Number of processes used to execute the BTS. Identities are sharded across
+            the processes by the hash of the identity.
+        :param compiled: Evaluate the streaming BTS with code generated from the BTS instead of
+            interpreting each expression.
+        :param batch_windows: Evaluate the window BTS for all the anchors of an identity at once.
+            Requires numpy.
+        """
+        super().__init__(stream_bts_file, window_bts_file, compiled, batch_windows)
+        if workers < 1:
+            raise ValueError('`workers` must be at least 1.')
 
+        self._workers = workers
         self._per_user_data = {}
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # Output of previous executions is not needed by the worker processes.
+        state = super().__getstate__()
+        state['_per_user_data'] = {}
+        return state
+
     def _validate_bts_syntax(self) -> None:
         validate(self._stream_bts)
         if self._window_bts is not None:
@@ -32,15 +86,44 @@ class LocalRunner(Runner):
                                     old_state: Optional[Dict[str, Dict]] = None) -> None:
         if not old_state:
             old_state = {}
-        for identity, records in identity_records.items():
-            _, data = self.execute_per_identity_records(identity, records,
-                                                        old_state.get(identity, None))
-            self._per_user_data[identity] = data
+        if self._workers > 1:
+            self._execute_in_workers(identity_records, old_state)
+        else:
+            for identity, records in identity_records.items():
+                _, data = self.execute_per_identity_records(identity, records,
+                                                            old_state.get(identity, None))
+                self._per_user_data[identity] = data
+            self.finalize()
+
+        self._add_unprocessed_old_state(old_state)
 
+    def _add_unprocessed_old_state(self, old_state: Dict[str, Dict]) -> None:
         for identity, state in old_state.items():
             if identity not in self._per_user_data:
                 self._per_user_data[identity] = (old_state[identity], [])
 
+    def _execute_in_workers(self, identity_records: Dict[str, List[TimeAndRecord]],
+                            old_state: Dict[str, Dict]) -> None:
+        """
+        Shards the identities by hash and executes each shard in a separate worker process. Each
+        worker receives the records of its shard in a single task.
+        """
+        shards = [{} for _ in range(self._workers)]
+        for identity, records in identity_records.items():
+            shards[self._get_shard(identity)][identity] = (records, old_state.get(identity, None))
+
+        with Pool(self._workers, initializer=_init_worker, initargs=(self, )) as pool:
+            shard_data = {}
+            for data in pool.map(_execute_shard, [shard for shard in shards if shard]):
+                shard_data.update(data)
+
+        # Keep the output in the same order as a single process execution.
+        for identity in identity_records:
+            self._per_user_data[identity] = shard_data[identity]
+
+    def _get_shard(self, identity: str) -> int:
+        return zlib.crc32(str(identity).encode('utf-8')) % self._workers
+
     def get_identity_records_from_json_files(
             self,
             json_files: List[str],
@@ -54,12 +137,126 @@ class LocalRunner(Runner):
                     identity_records[identity].append(record_with_datetime)
         return identity_records
 
+    def get_sorted_identity_records_from_json_files(
+            self,
+            json_files: List[str],
+            data_processor: DataProcessor = SimpleJsonDataProcessor(),
+            memory_budget: int = 512 * 1024 * 1024,
+            temp_dir: Optional[str] = None) -> Iterator[Tuple[str, Iterator[TimeAndRecord]]]:
+        """
+        Reads the records from the json files using an external sort so that the memory used is
+        bounded by `memory_budget` rather than by the size of the input. Sorted runs are spilled to
+        temporary files in `temp_dir` and merged when the result is iterated.
+
+        :param json_files: List of json file paths.
+        :param data_processor: `DataProcessor` to process each event in the json files.
+        :param memory_budget: Approximate number of bytes of records held in memory.
+        :param temp_dir: Directory for the sorted runs. Defaults to the system temporary directory.
+        :return: Iterator of identities, in sorted order, along with an iterator of the time ordered
+            records of the identity which can be used in `execute_sorted()`.
+        """
+        sorter = ExternalSorter(memory_budget, temp_dir)
+        for file in json_files:
+            with smart_open(file) as file_stream:
+                for identity, record_with_datetime in self.get_per_identity_records(
+                        file_stream, data_processor):
+                    sorter.add(identity, record_with_datetime)
+        return sorter.get_identity_records()
+
+    def get_presorted_identity_records_from_json_files(
+            self,
+            json_files: List[str],
+            data_processor: DataProcessor = SimpleJsonDataProcessor()
+    ) -> Iterator[Tuple[str, Iterator[TimeAndRecord]]]:
+        """
+        Reads the records from json files in which the records are already grouped by identity and
+        sorted by time. The files are read lazily in a single pass and each identity is yielded as
+        soon as its group of records ends.
+
+        Order is verified while the records are read. RecordOrderError is raised when the records of
+        an identity are not sorted by time or when an identity appears in more than one group.
+
+        :param json_files: List of json file paths, read in the given order.
+        :param data_processor: `DataProcessor` to process each event in the json files.
+        :return: Iterator of identities in the input order along with an iterator of the records of
+            the identity which can be used in `execute_sorted()` or `iter_execute_sorted()`.
+        """
+        return self._group_presorted_records(
+            record for file in json_files
+            for record in self._get_per_identity_records_from_json_file(file, data_processor))
+
+    def _get_per_identity_records_from_json_file(
+            self, json_file: str,
+            data_processor: DataProcessor) -> Generator[Tuple[str, TimeAndRecord], None, None]:
+        with smart_open(json_file) as file_stream:
+            yield from self.get_per_identity_records(file_stream, data_processor)
+
+    @staticmethod
+    def _group_presorted_records(identity_records: Iterable[Tuple[str, TimeAndRecord]]
+                                 ) -> Generator[Tuple[str, Iterator[TimeAndRecord]], None, None]:
+        # Only the identities are retained to detect an identity that is split across groups. The
+        # groups can be in any order of identity.
+        completed_identities = set()
+        previous_identity = None
+        for identity, records in groupby(identity_records, key=itemgetter(0)):
+            if identity in completed_identities:
+                raise RecordOrderError(
+                    'Records of identity {} are not grouped together. {} appears again after {}.'.
+                    format(identity, identity, previous_identity))
+            yield identity, LocalRunner._check_time_order(identity, records)
+            completed_identities.add(identity)
+            previous_identity = identity
+
+    @staticmethod
+    def _check_time_order(identity: str, identity_records: Iterable[Tuple[str, TimeAndRecord]]
+                          ) -> Generator[TimeAndRecord, None, None]:
+        last_time: datetime = None
+        for _, (time, record) in identity_records:
+            if last_time is not None and time < last_time:
+                raise RecordOrderError(
+                    'Records of identity {} are not sorted by time. {} is after {}.'.format(
+                        identity, time, last_time))
+            last_time = time
+            yield time, record
+
     def execute(self,
                 identity_records: Dict[str, List[TimeAndRecord]],
                 old_state: Optional[Dict[str, Dict]] = None) -> Dict[str, Tuple[Dict, List]]:
         self._execute_for_all_identities(identity_records, old_state)
         return self._per_user_data
 
+    def execute_sorted(self,
+                       identity_records: Iterable[Tuple[str, Iterable[TimeAndRecord]]],
+                       old_state: Optional[Dict[str, Dict]] = None) -> Dict[str, Tuple[Dict, List]]:
+        """
+        Executes the BTS on identities whose records are already sorted by time, such as the output
+        of `get_sorted_identity_records_from_json_files()`. The records of each identity are
+        streamed into the transformer without being collected in memory.
+        """
+        for identity, data in self.iter_execute_sorted(identity_records, old_state):
+            self._per_user_data[identity] = data
+        return self._per_user_data
+
+    def iter_execute_sorted(self,
+                            identity_records: Iterable[Tuple[str, Iterable[TimeAndRecord]]],
+                            old_state: Optional[Dict[str, Dict]] = None
+                            ) -> Generator[Tuple[str, Tuple[Dict, List]], None, None]:
+        """
+        Executes the BTS on identities whose records are already sorted by time and yields the
+        output of each identity as soon as it has been processed. The output is not retained by the
+        runner. Identities in `old_state` without any records are yielded at the end.
+        """
+        remaining_state = dict(old_state) if old_state else {}
+        try:
+            for identity, records in identity_records:
+                yield self.execute_per_identity_sorted_records(identity, records,
+                                                               remaining_state.pop(identity, None))
+        finally:
+            self.finalize()
+
+        for identity, state in remaining_state.items():
+            yield identity, (state, [])
+
     def print_output(self, per_user_data) -> None:
         for id, (block_data, window_data) in per_user_data.items():
             if not self._window_bts:
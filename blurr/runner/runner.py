@@ -7,17 +7,15 @@ import yaml
 from smart_open import smart_open
 
 from blurr.core import logging
-from blurr.core.aggregate_block import BlockAggregate, TimeAggregate
 from blurr.core.errors import PrepareWindowMissingBlocksError
 from blurr.core.evaluation import Context
 from blurr.core.record import Record
-from blurr.core.schema_loader import SchemaLoader
-from blurr.core.store import Store
 from blurr.core.store_key import Key
-from blurr.core.transformer_streaming import StreamingTransformer, StreamingTransformerSchema
+from blurr.core.transformer_streaming import StreamingTransformer
 from blurr.core.transformer_window import WindowTransformer
-from blurr.core.type import Type
+from blurr.core.window_array import require_numpy
 from blurr.runner.data_processor import DataProcessor
+from blurr.runner.execution_plan import ExecutionPlan
 
 TimeAndRecord = Tuple[datetime, Record]
 
@@ -40,10 +38,19 @@ class Runner(ABC):
             State) so as to allow batch execution to make use of previous output.
     """
 
-    def __init__(self, stream_bts_file: str, window_bts_file: Optional[str]):
+    def __init__(self,
+                 stream_bts_file: str,
+                 window_bts_file: Optional[str],
+                 compiled: bool = False,
+                 batch_windows: bool = False):
         self._stream_bts = yaml.safe_load(smart_open(stream_bts_file))
         self._window_bts = None if window_bts_file is None else yaml.safe_load(
             smart_open(window_bts_file))
+        self._compiled = compiled
+        self._batch_windows = batch_windows
+        self._execution_plan: Optional[ExecutionPlan] = None
+        if batch_windows:
+            require_numpy()
 
         # TODO: Assume validation will be done separately.
         # This causes a problem when running the code on spark
@@ -53,6 +60,24 @@ class Runner(ABC):
         # if self._window_bts is not None:
         #     validate_schema_spec(self._window_bts)
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # The execution plan contains compiled code objects which cannot be pickled. It is rebuilt
+        # lazily after the runner is shipped to a Spark executor.
+        state = self.__dict__.copy()
+        state['_execution_plan'] = None
+        return state
+
+    @property
+    def execution_plan(self) -> ExecutionPlan:
+        """
+        Returns the compiled BTS shared by all the identities processed by this runner. The plan is
+        built on first use.
+        """
+        if self._execution_plan is None:
+            self._execution_plan = ExecutionPlan(self._stream_bts, self._window_bts,
+                                                 self._compiled)
+        return self._execution_plan
+
     def execute_per_identity_records(
             self,
             identity: str,
@@ -69,17 +94,44 @@ class Runner(ABC):
         :return: Tuple[Identity, Tuple[Identity, Tuple[Streaming BTS state dictionary,
             List of window BTS output]].
         """
-        schema_loader = SchemaLoader()
         if records:
             records.sort(key=lambda x: x[0])
         else:
             records = []
 
-        block_data = self._execute_stream_bts(records, identity, schema_loader, old_state)
-        window_data = self._execute_window_bts(identity, schema_loader)
+        return self.execute_per_identity_sorted_records(identity, records, old_state)
+
+    def execute_per_identity_sorted_records(
+            self,
+            identity: str,
+            records: Iterable[TimeAndRecord],
+            old_state: Optional[Dict[Key, Any]] = None) -> Tuple[str, Tuple[Dict, List]]:
+        """
+        Executes the streaming and window BTS on records that are already sorted by time. The
+        records are consumed as they are iterated, so they do not need to be materialized in a list.
+
+        :param identity: Identity of the records.
+        :param records: Iterable of TimeAndRecord sorted by time.
+        :param old_state: Streaming BTS state dictionary from a previous execution.
+        :return: Tuple[Identity, Tuple[Identity, Tuple[Streaming BTS state dictionary,
+            List of window BTS output]].
+        """
+        execution_plan = self.execution_plan
+        execution_plan.reset_identity_state()
+
+        block_data = self._execute_stream_bts(records, identity, execution_plan, old_state)
+        execution_plan.finalize_identity_state()
+        window_data = self._execute_window_bts(identity, execution_plan)
 
         return identity, (block_data, window_data)
 
+    def finalize(self) -> None:
+        """
+        Finalizes the stores at the end of a run, once all the identities have been executed.
+        """
+        if self._execution_plan is not None:
+            self._execution_plan.finalize()
+
     def get_per_identity_records(self, events: Iterable, data_processor: DataProcessor
                                  ) -> Generator[Tuple[str, TimeAndRecord], None, None]:
         """
@@ -89,10 +141,7 @@ class Runner(ABC):
         :param data_processor: DataProcessor to process each event in events.
         :return: yields Tuple[Identity, TimeAndRecord] for all Records in events,
         """
-        schema_loader = SchemaLoader()
-        stream_bts_name = schema_loader.add_schema_spec(self._stream_bts)
-        stream_transformer_schema: StreamingTransformerSchema = schema_loader.get_schema_object(
-            stream_bts_name)
+        stream_transformer_schema = self.execution_plan.stream_transformer_schema
         for event in events:
             try:
                 for record in data_processor.process_data(event):
@@ -106,63 +155,66 @@ class Runner(ABC):
                 logging.error('{} in parsing Event {}.'.format(err, event))
 
     def _execute_stream_bts(self,
-                            identity_events: List[TimeAndRecord],
+                            identity_events: Iterable[TimeAndRecord],
                             identity: str,
-                            schema_loader: SchemaLoader,
+                            execution_plan: ExecutionPlan,
                             old_state: Optional[Dict] = None) -> Dict[Key, Any]:
         if self._stream_bts is None:
             return {}
 
-        stream_bts_name = schema_loader.add_schema_spec(self._stream_bts)
-        stream_transformer_schema = schema_loader.get_schema_object(stream_bts_name)
-        store = self._get_store(schema_loader)
+        store = execution_plan.store
 
         if old_state:
             for k, v in old_state.items():
                 store.save(k, v)
 
-        if identity_events:
-            stream_transformer = StreamingTransformer(stream_transformer_schema, identity)
+        # The identity and time were evaluated when the records were grouped. They are passed on
+        # so that the transformer does not evaluate them again.
+        stream_transformer = None
+        for time, event in identity_events:
+            if stream_transformer is None:
+                stream_transformer = StreamingTransformer(
+                    execution_plan.stream_transformer_schema, identity, execution_plan.compiled)
+            stream_transformer.run_evaluate_trusted(event, time)
 
-            for time, event in identity_events:
-                stream_transformer.run_evaluate(event)
+        if stream_transformer is not None:
             stream_transformer.run_finalize()
 
-        return self._get_store(schema_loader).get_all(identity)
+        return execution_plan.store.get_all(identity)
 
-    def _execute_window_bts(self, identity: str, schema_loader: SchemaLoader) -> List[Dict]:
+    def _execute_window_bts(self, identity: str, execution_plan: ExecutionPlan) -> List[Dict]:
         if self._window_bts is None:
             logging.debug('Window BTS not provided')
             return []
 
-        stream_transformer = StreamingTransformer(
-            self._get_streaming_transformer_schema(schema_loader), identity)
-        all_data = self._get_store(schema_loader).get_all(identity)
+        stream_transformer = StreamingTransformer(execution_plan.stream_transformer_schema,
+                                                  identity)
+        all_data = execution_plan.store.get_all(identity)
         stream_transformer.run_restore(all_data)
 
         exec_context = Context()
         exec_context.add(stream_transformer._schema.name, stream_transformer)
 
-        block_obj = None
-        for aggregate in stream_transformer._nested_items.values():
-            if not isinstance(aggregate, TimeAggregate):
-                continue
-            if block_obj is not None:
-                raise Exception(('Window operation is supported against Streaming ',
-                                 'BTS with only one BlockAggregate'))
-            block_obj = aggregate
-
-        if block_obj is None:
-            raise Exception('No BlockAggregate found in the Streaming BTS file')
+        block_obj = stream_transformer._nested_items[execution_plan.block_aggregate_schema.name]
 
         window_data = []
 
-        window_bts_name = schema_loader.add_schema_spec(self._window_bts)
-        window_transformer_schema = schema_loader.get_schema_object(window_bts_name)
-        window_transformer = WindowTransformer(window_transformer_schema, identity, exec_context)
+        window_transformer = WindowTransformer(execution_plan.window_transformer_schema, identity,
+                                               exec_context, all_data)
 
         logging.debug('Running Window BTS for identity {}'.format(identity))
 
+        if self._batch_windows:
+            columns, rows = window_transformer.run_evaluate_batch(
+                block_obj, [(key, data) for key, data in all_data.items()
+                            if key.group == block_obj._schema.name])
+            window_data = [
+                dict(zip(row_columns, row)) for row_columns, row in zip(columns, rows)
+            ]
+            if not window_data:
+                logging.debug('No anchors found for identity {}'.format(identity))
+            return window_data
+
         anchors = 0
         blocks = 0
         for key, data in all_data.items():
@@ -170,7 +222,8 @@ class Runner(ABC):
                 continue
             try:
                 blocks += 1
-                if window_transformer.run_evaluate(block_obj.run_restore(data)):
+                if window_transformer.run_evaluate(
+                        window_transformer.run_restore_block(block_obj, key, data)):
                     anchors += 1
                     window_data.append(window_transformer.run_flattened_snapshot)
             except PrepareWindowMissingBlocksError as err:
@@ -182,22 +235,6 @@ class Runner(ABC):
 
         return window_data
 
-    @staticmethod
-    def _get_store(schema_loader: SchemaLoader) -> Store:
-        stores = schema_loader.get_all_stores()
-        if not stores:
-            fq_name_and_schema = schema_loader.get_schema_specs_of_type(
-                Type.BLURR_STORE_DYNAMO, Type.BLURR_STORE_MEMORY)
-            return schema_loader.get_store(next(iter(fq_name_and_schema)))
-
-        return stores[0]
-
-    @staticmethod
-    def _get_streaming_transformer_schema(
-            schema_loader: SchemaLoader) -> StreamingTransformerSchema:
-        fq_name_and_schema = schema_loader.get_schema_specs_of_type(Type.BLURR_TRANSFORM_STREAMING)
-        return schema_loader.get_schema_object(next(iter(fq_name_and_schema)))
-
     @abstractmethod
     def execute(self, *args, **kwargs):
         NotImplemented('execute must be implemented')
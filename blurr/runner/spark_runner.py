@@ -1,5 +1,5 @@
 import json
-from typing import List, Optional, Tuple, Dict, Union
+from typing import Generator, Iterable, List, Optional, Tuple, Dict, Union
 
 from blurr.runner.data_processor import DataProcessor, SimpleJsonDataProcessor, \
     SimpleDictionaryDataProcessor
@@ -56,17 +56,25 @@ class SparkRunner(Runner):
     ```
     """
 
-    def __init__(self, stream_bts_file: str, window_bts_file: Optional[str] = None):
+    def __init__(self,
+                 stream_bts_file: str,
+                 window_bts_file: Optional[str] = None,
+                 compiled: bool = False,
+                 batch_windows: bool = False):
         """
         Initialize SparkRunner.
 
         :param stream_bts_file: Streaming BTS to use. Must be provded.
         :param window_bts_file: Window BTS to use. If none is provided only the streaming BTS output
             is generated.
+        :param compiled: Evaluate the streaming BTS with code generated from the BTS instead of
+            interpreting each expression.
+        :param batch_windows: Evaluate the window BTS for all the anchors of an identity at once.
+            Requires numpy.
         """
         if _spark_import_err:
             raise _spark_import_err
-        super().__init__(stream_bts_file, window_bts_file)
+        super().__init__(stream_bts_file, window_bts_file, compiled, batch_windows)
 
     def _execute_per_identity_records(
             self, identity_records_with_state: Tuple[str, Union[List, Tuple[List, Dict]]]):
@@ -77,6 +85,13 @@ class SparkRunner(Runner):
             record, state = records_with_state, None
         return self.execute_per_identity_records(identity, record, state)
 
+    def _execute_partition(self, partition: Iterable[Tuple[str, Union[List, Tuple[List, Dict]]]]
+                           ) -> Generator[Tuple[str, Tuple[Dict, List]], None, None]:
+        for identity_records_with_state in partition:
+            yield self._execute_per_identity_records(identity_records_with_state)
+        # The stores are finalized once the last identity of the partition is executed
+        self.finalize()
+
     def execute(self, identity_records: 'RDD', old_state_rdd: Optional['RDD'] = None) -> 'RDD':
         """
         Executes Blurr BTS with the given records. old_state_rdd can be provided to load an older
@@ -90,7 +105,7 @@ class SparkRunner(Runner):
         identity_records_with_state = identity_records
         if old_state_rdd:
             identity_records_with_state = identity_records.fullOuterJoin(old_state_rdd)
-        return identity_records_with_state.map(lambda x: self._execute_per_identity_records(x))
+        return identity_records_with_state.mapPartitions(lambda x: self._execute_partition(x))
 
     def get_record_rdd_from_json_files(self,
                                        json_files: List[str],
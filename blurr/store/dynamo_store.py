@@ -1,157 +1,630 @@
+import threading
+import time
 from datetime import datetime
-from typing import Any, Dict, List, Tuple
+from decimal import Decimal
+from itertools import islice
+from queue import Queue, Full
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from weakref import WeakKeyDictionary
 
 import boto3
 from boto3.dynamodb.conditions import Key as DynamoKey, Attr
 from dateutil import parser
 
+from blurr.core.errors import StoreWriteError
 from blurr.core.schema_loader import SchemaLoader
 from blurr.core.store import Store, Key, StoreSchema
 from blurr.core.store_key import KeyType
+from blurr.store.memory_store import MemoryStore
+
+# boto3 resources are not thread safe. A resource is created once per thread and shared by all the
+# stores created in that thread.
+_thread_local = threading.local()
+
+# (table name, region) of the tables known to exist, shared by all the stores in the process
+_existing_tables: Set[Tuple[str, str]] = set()
+_existing_tables_lock = threading.Lock()
+
+
+class _WriteBuffer:
+    """
+    Items saved to a table and not written yet. The buffer is shared by all the stores of the
+    table that use the same boto3 resource, so that the items are buffered across the identities
+    of a run.
+    """
+
+    def __init__(self) -> None:
+        self.items: Dict[Key, Dict[str, Any]] = {}
+        # Time at which the oldest buffered item was saved
+        self.start: Optional[float] = None
+
+
+# Write buffers by table name, for each boto3 resource
+_write_buffers: 'WeakKeyDictionary[Any, Dict[str, _WriteBuffer]]' = WeakKeyDictionary()
+_write_buffers_lock = threading.Lock()
+
+
+def _get_write_buffer(dynamodb_resource: Any, table_name: str) -> _WriteBuffer:
+    with _write_buffers_lock:
+        table_buffers = _write_buffers.setdefault(dynamodb_resource, {})
+        if table_name not in table_buffers:
+            table_buffers[table_name] = _WriteBuffer()
+        return table_buffers[table_name]
 
 
 class DynamoStoreSchema(StoreSchema):
     ATTRIBUTE_TABLE = 'Table'
     ATTRIBUTE_READ_CAPACITY_UNITS = 'ReadCapacityUnits'
     ATTRIBUTE_WRITE_CAPACITY_UNITS = 'WriteCapacityUnits'
+    ATTRIBUTE_WRITE_BUFFER_SIZE = 'WriteBufferSize'
+    ATTRIBUTE_WRITE_BUFFER_SECONDS = 'WriteBufferSeconds'
+    ATTRIBUTE_PREFETCH = 'Prefetch'
+    ATTRIBUTE_QUERY_PAGE_SIZE = 'QueryPageSize'
+    ATTRIBUTE_QUERY_READ_AHEAD = 'QueryReadAhead'
+    ATTRIBUTE_START_TIME_INDEX = 'StartTimeIndex'
     QUERY_LIMIT = 1000
+    WRITE_BUFFER_SECONDS = 60
 
     def __init__(self, fully_qualified_name: str, schema_loader: SchemaLoader) -> None:
         super().__init__(fully_qualified_name, schema_loader)
         self.table_name = self._spec.get(self.ATTRIBUTE_TABLE, None)
         self.rcu = self._spec.get(self.ATTRIBUTE_READ_CAPACITY_UNITS, 5)
         self.wcu = self._spec.get(self.ATTRIBUTE_WRITE_CAPACITY_UNITS, 5)
-        self.query_limit = self.QUERY_LIMIT
+        # Maximum number of items read by each page of a query
+        self.query_limit = self._spec.get(self.ATTRIBUTE_QUERY_PAGE_SIZE, self.QUERY_LIMIT)
+        # Number of query pages read in the background ahead of the page being consumed
+        self.query_read_ahead = self._spec.get(self.ATTRIBUTE_QUERY_READ_AHEAD, 0)
+        # Range queries use a local secondary index on the group and `_start_time` of the items.
+        # The index is created with the table.
+        self.start_time_index = self._spec.get(self.ATTRIBUTE_START_TIME_INDEX, False)
+        # Saves are buffered and written in batches when a buffer size is set
+        self.write_buffer_size = self._spec.get(self.ATTRIBUTE_WRITE_BUFFER_SIZE, None)
+        self.write_buffer_seconds = self._spec.get(self.ATTRIBUTE_WRITE_BUFFER_SECONDS,
+                                                   self.WRITE_BUFFER_SECONDS)
+        # All the items of an identity are read with one query when the identity is first read
+        self.prefetch = self._spec.get(self.ATTRIBUTE_PREFETCH, False)
 
     def validate_schema_spec(self) -> None:
         super().validate_schema_spec()
         self.validate_required_attributes(self.ATTRIBUTE_TABLE)
+        self.validate_number_attribute(self.ATTRIBUTE_WRITE_BUFFER_SIZE, int, 1)
+        self.validate_number_attribute(self.ATTRIBUTE_WRITE_BUFFER_SECONDS, float, 0)
+        self.validate_enum_attribute(self.ATTRIBUTE_PREFETCH, {True, False})
+        self.validate_number_attribute(self.ATTRIBUTE_QUERY_PAGE_SIZE, int, 1)
+        self.validate_number_attribute(self.ATTRIBUTE_QUERY_READ_AHEAD, int, 1)
+        self.validate_enum_attribute(self.ATTRIBUTE_START_TIME_INDEX, {True, False})
 
 
 class DynamoStore(Store):
     """
-    Dynamo store implementation
+    Dynamo store implementation.
+
+    When a write buffer size is set in the schema, saved items are buffered and written with
+    `batch_write_item`. Only the last save of a key is written. The buffer is shared by the stores
+    of the table in a thread and kept across identities. It is flushed when it reaches the buffer
+    size, when the oldest buffered item is older than the buffer duration, and on `finalize()` at
+    the end of the run. Buffered items are read from the buffer, range queries of an identity
+    with buffered items flush the buffer first.
+
+    When prefetch is set in the schema, the first read of an identity reads all the items of the
+    identity. Reads of the identity are then served from memory until another identity is read.
+    Saved keys are invalidated and read again from the table.
+
+    Queries read the items in pages of the query page size. The iterator variants of the reads
+    only read the next page once the items of the current page are consumed, or read ahead a
+    number of pages in a background thread when configured.
+
+    When the start time index is set in the schema, the table is created with a local secondary
+    index sorted by `group_start_time`, the group of the key followed by the `_start_time` of the
+    item. Range queries read the items of a group in time order from the index with key
+    conditions.
+
+    Updates of some of the fields of an item that is not buffered write only the changed fields
+    with `update_item`.
     """
+    # Maximum number of items that DynamoDB accepts in a `batch_write_item` request
+    BATCH_WRITE_SIZE = 25
+    BATCH_WRITE_RETRIES = 8
+    BATCH_WRITE_RETRY_DELAY_SECONDS = 0.05
+    START_TIME_INDEX_NAME = 'start_time_index'
+    GROUP_START_TIME = 'group_start_time'
 
     def __init__(self, schema: DynamoStoreSchema) -> None:
         self._schema = schema
+        self._prefetched_identity: Optional[str] = None
+        self._prefetched_items: Optional[MemoryStore] = None
+        self._invalidated_keys: Set[Key] = set()
         self._dynamodb_resource = DynamoStore.get_dynamodb_resource()
         self._table = self._dynamodb_resource.Table(self._schema.table_name)
+        self._buffer = _get_write_buffer(self._dynamodb_resource, self._schema.table_name)
 
-        # Test that the table exists.  Create a new one otherwise
-        try:
-            self._table.creation_date_time
-        except self._dynamodb_resource.meta.client.exceptions.ResourceNotFoundException:
-            self._table = self._dynamodb_resource.create_table(
-                TableName=self._schema.table_name,
-                KeySchema=[
-                    {
-                        'AttributeName': 'partition_key',
-                        'KeyType': 'HASH'
-                    },
-                    {
-                        'AttributeName': 'range_key',
-                        'KeyType': 'RANGE'
-                    },
-                ],
-                AttributeDefinitions=[{
+        self._create_table_if_not_exists()
+
+    @property
+    def _write_buffer(self) -> Dict[Key, Dict[str, Any]]:
+        return self._buffer.items
+
+    def _create_table_if_not_exists(self) -> None:
+        """
+        Creates the table if it does not exist. A table is only checked once per process and region.
+        """
+        table_key = (self._schema.table_name,
+                     self._dynamodb_resource.meta.client.meta.region_name)
+        if table_key in _existing_tables:
+            return
+
+        with _existing_tables_lock:
+            if table_key in _existing_tables:
+                return
+
+            # Test that the table exists.  Create a new one otherwise
+            try:
+                self._table.creation_date_time
+            except self._dynamodb_resource.meta.client.exceptions.ResourceNotFoundException:
+                self._table = self._dynamodb_resource.create_table(**self._get_table_definition())
+                # Wait until the table creation is complete
+                self._table.meta.client.get_waiter('table_exists').wait(
+                    TableName=self._schema.table_name, WaiterConfig={'Delay': 5})
+
+            _existing_tables.add(table_key)
+
+    def _get_table_definition(self) -> Dict[str, Any]:
+        """ Returns the arguments used to create the table """
+        table_definition = {
+            'TableName':
+            self._schema.table_name,
+            'KeySchema': [
+                {
                     'AttributeName': 'partition_key',
-                    'AttributeType': 'S'
-                }, {
+                    'KeyType': 'HASH'
+                },
+                {
                     'AttributeName': 'range_key',
-                    'AttributeType': 'S'
+                    'KeyType': 'RANGE'
+                },
+            ],
+            'AttributeDefinitions': [{
+                'AttributeName': 'partition_key',
+                'AttributeType': 'S'
+            }, {
+                'AttributeName': 'range_key',
+                'AttributeType': 'S'
+            }],
+            'ProvisionedThroughput': {
+                'ReadCapacityUnits': self._schema.rcu,
+                'WriteCapacityUnits': self._schema.wcu
+            }
+        }
+
+        if self._schema.start_time_index:
+            table_definition['AttributeDefinitions'].append({
+                'AttributeName': self.GROUP_START_TIME,
+                'AttributeType': 'S'
+            })
+            table_definition['LocalSecondaryIndexes'] = [{
+                'IndexName':
+                self.START_TIME_INDEX_NAME,
+                'KeySchema': [{
+                    'AttributeName': 'partition_key',
+                    'KeyType': 'HASH'
+                }, {
+                    'AttributeName': self.GROUP_START_TIME,
+                    'KeyType': 'RANGE'
                 }],
-                ProvisionedThroughput={
-                    'ReadCapacityUnits': self._schema.rcu,
-                    'WriteCapacityUnits': self._schema.wcu
-                })
-            # Wait until the table creation is complete
-            self._table.meta.client.get_waiter('table_exists').wait(
-                TableName=self._schema.table_name, WaiterConfig={'Delay': 5})
+                'Projection': {
+                    'ProjectionType': 'ALL'
+                }
+            }]
+
+        return table_definition
+
+    @staticmethod
+    def clear_table_cache() -> None:
+        """ Forgets the tables known to exist, e.g. after tables are deleted """
+        with _existing_tables_lock:
+            _existing_tables.clear()
 
     @staticmethod
     # This is separate out as a separate function so that this can be mocked in unit tests.
     def get_dynamodb_resource() -> Any:
-        return boto3.resource('dynamodb')
+        if not hasattr(_thread_local, 'dynamodb_resource'):
+            _thread_local.dynamodb_resource = boto3.resource('dynamodb')
+        return _thread_local.dynamodb_resource
 
     @staticmethod
     def clean_for_get(item: Dict[str, Any]) -> Dict[str, Any]:
         item.pop('partition_key', None)
         item.pop('range_key', None)
+        item.pop(DynamoStore.GROUP_START_TIME, None)
         return item
 
     @staticmethod
     def clean_item_for_save(item: Dict[str, Any]) -> Dict[str, Any]:
         return {k: v for k, v in item.items() if v}
 
+    def get_changed_fields(self, stored_item: Dict[str, Any], item: Dict[str, Any]) -> List[str]:
+        # Empty values are left out by `clean_item_for_save` and numbers are read as Decimal
+        return [
+            name for name, value in item.items()
+            if (value or name in stored_item) and
+            not self._is_saved_value(stored_item.get(name), value)
+        ]
+
+    @staticmethod
+    def _is_saved_value(stored_value: Any, value: Any) -> bool:
+        if isinstance(stored_value, Decimal) and isinstance(value, float):
+            return float(stored_value) == value
+        if isinstance(stored_value, dict) and isinstance(value, dict):
+            return stored_value.keys() == value.keys() and all(
+                DynamoStore._is_saved_value(stored_value[k], v) for k, v in value.items())
+        if isinstance(stored_value, list) and isinstance(value, list):
+            return len(stored_value) == len(value) and all(
+                DynamoStore._is_saved_value(s, v) for s, v in zip(stored_value, value))
+        return stored_value == value
+
     def prepare_record(self, record: Dict[str, Any]) -> Tuple[Key, Any]:
         key = Key.parse_sort_key(record['partition_key'], record['range_key'])
         return key, self.clean_for_get(record)
 
+    def prefetch(self, identity: str) -> None:
+        """
+        Reads all the items of an identity, following the pages of the query, so that the reads
+        of the identity are served from memory. Replaces the items of the previous identity.
+        """
+        prefetched_items = MemoryStore(None)
+        for item in self._query(KeyConditionExpression=DynamoKey('partition_key').eq(identity)):
+            prefetched_items.save(*self.prepare_record(item))
+        for key, item in self._get_buffered_items(identity):
+            prefetched_items.save(key, item)
+
+        self._prefetched_identity = identity
+        self._prefetched_items = prefetched_items
+        self._invalidated_keys.clear()
+
+    def _get_prefetched_items(self, identity: str, key: Key = None) -> Optional[MemoryStore]:
+        """
+        Returns the prefetched items if they can serve the read of an identity, or of a single key.
+        The identity is prefetched again when a range read includes invalidated keys.
+        """
+        if identity != self._prefetched_identity:
+            if not self._schema.prefetch:
+                return None
+            self.prefetch(identity)
+        elif key is not None and key in self._invalidated_keys:
+            return None
+        elif key is None and self._invalidated_keys:
+            self.prefetch(identity)
+
+        return self._prefetched_items
+
     def get(self, key: Key) -> Any:
+        prefetched_items = self._get_prefetched_items(key.identity, key)
+        if prefetched_items is not None:
+            return prefetched_items.get(key)
+
+        if key in self._write_buffer:
+            return self.clean_for_get(dict(self._write_buffer[key]))
+
         item = self._table.get_item(Key={
             'partition_key': key.identity,
             'range_key': key.sort_key
         }).get('Item', None)
 
+        if item and key.identity == self._prefetched_identity:
+            self._prefetched_items.save(key, item)
+            self._invalidated_keys.discard(key)
+
         if not item:
             return None
 
         return self.clean_for_get(item)
 
+    def _query(self, **query_args: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the items of a query. The pages of the query are read as the items are consumed,
+        following `LastEvaluatedKey`, or read ahead in a background thread when configured.
+        """
+        query_args.setdefault('Limit', self._schema.query_limit)
+        if not self._schema.query_read_ahead:
+            pages = self._query_pages(self._table, query_args)
+        else:
+            pages = self._read_ahead(query_args)
+
+        for page in pages:
+            yield from page
+
+    @staticmethod
+    def _query_pages(table: Any, query_args: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+        """ Yields the pages of a query """
+        while True:
+            response = table.query(**query_args)
+            yield response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            query_args = dict(query_args, ExclusiveStartKey=response['LastEvaluatedKey'])
+
+    def _read_ahead(self, query_args: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yields the pages of a query that are read in a background thread, up to the read ahead
+        number of pages ahead of the page being consumed. The thread stops once the iterator is
+        closed.
+        """
+        pages: Queue = Queue(maxsize=self._schema.query_read_ahead)
+        stopped = threading.Event()
+        end_of_pages = object()
+
+        def put(page: Any) -> bool:
+            while not stopped.is_set():
+                try:
+                    pages.put(page, timeout=0.1)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        def read_pages() -> None:
+            try:
+                # Each thread uses its own resource as boto3 resources are not thread safe
+                table = DynamoStore.get_dynamodb_resource().Table(self._schema.table_name)
+                for page in self._query_pages(table, query_args):
+                    if not put(page):
+                        return
+                put(end_of_pages)
+            except Exception as err:
+                put(err)
+
+        threading.Thread(target=read_pages, daemon=True).start()
+        try:
+            while True:
+                page = pages.get()
+                if page is end_of_pages:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+        finally:
+            stopped.set()
+
     def _get_range_timestamp_key(self, start: Key, end: Key,
                                  count: int = 0) -> List[Tuple[Key, Any]]:
+        return list(self._iterate_range_timestamp_key(start, end, count))
+
+    def _iterate_range_timestamp_key(self, start: Key, end: Key,
+                                     count: int = 0) -> Iterator[Tuple[Key, Any]]:
+        prefetched_items = self._get_prefetched_items(start.identity)
+        if prefetched_items is not None:
+            return prefetched_items._iterate_range_timestamp_key(start, end, count)
+
+        self._flush_identity(start.identity)
+        if self._schema.start_time_index:
+            return self._iterate_start_time_index(start.identity, start.group,
+                                                  start.timestamp.isoformat(),
+                                                  end.timestamp.isoformat(), count)
+
         sort_key_condition = DynamoKey('range_key').between(start.sort_key, end.sort_key)
         # Limit is set to count+1 because for items where the start key matches exactly
         # KeyConditionExpression passes and FilterExpression fails.
-        response = self._table.query(
-            Limit=abs(count) + 1 if count else self._schema.query_limit,
-            KeyConditionExpression=DynamoKey('partition_key').eq(
-                start.identity) & sort_key_condition,
+        items = (self.prepare_record(item) for item in self._query(
+            Limit=min(abs(count) + 1, self._schema.query_limit)
+            if count else self._schema.query_limit,
+            KeyConditionExpression=DynamoKey('partition_key').eq(start.identity) &
+            sort_key_condition,
             FilterExpression=Attr('_start_time').gt(start.timestamp.isoformat()) &
             Attr('_start_time').lt(end.timestamp.isoformat()),
             ScanIndexForward=count >= 0,
-        )
-        items = sorted([self.prepare_record(item) for item in response.get('Items', [])])
-        if count:
-            items = self._restrict_items_to_count(items, count)
-        return items
+        ))
+        if count < 0:
+            # The items are read backwards and returned in time order
+            return reversed(list(islice(items, -count)))
+        return islice(items, count) if count else items
 
     def _get_range_dimension_key(self,
                                  base_key: Key,
                                  start_time: datetime,
                                  end_time: datetime = None,
                                  count: int = 0) -> List[Tuple[Key, Any]]:
-        # A smaller limit cannot be set when abs(count) > 0 because all items need to be
-        # returned to find the count number of elements in a sorted manner.
-        # TODO: Improve count query performance by using a secondary index.
-        response = self._table.query(
-            Limit=self._schema.query_limit,
-            KeyConditionExpression=DynamoKey('partition_key').eq(
-                base_key.identity) & DynamoKey('range_key').begins_with(base_key.sort_prefix_key),
-            FilterExpression=Attr('_start_time').gt(start_time.isoformat()) &
-            Attr('_start_time').lt(end_time.isoformat()),
-            ScanIndexForward=count >= 0,
-        )
+        return list(self._iterate_range_dimension_key(base_key, start_time, end_time, count))
+
+    def _iterate_range_dimension_key(self,
+                                     base_key: Key,
+                                     start_time: datetime,
+                                     end_time: datetime,
+                                     count: int = 0) -> Iterator[Tuple[Key, Any]]:
+        prefetched_items = self._get_prefetched_items(base_key.identity)
+        if prefetched_items is not None:
+            return prefetched_items._iterate_range_dimension_key(base_key, start_time, end_time,
+                                                                 count)
+
+        self._flush_identity(base_key.identity)
+        if self._schema.start_time_index:
+            return self._iterate_start_time_index(
+                base_key.identity, base_key.group, start_time.isoformat(), end_time.isoformat(),
+                count, (lambda key: key.starts_with(base_key)) if base_key.dimensions else None)
+
+        # Without the start time index, a smaller limit cannot be set when abs(count) > 0 because
+        # all items need to be returned to find the count number of elements in a sorted manner.
         items = sorted(
-            [self.prepare_record(item) for item in response.get('Items', [])],
+            [
+                self.prepare_record(item) for item in self._query(
+                    KeyConditionExpression=DynamoKey('partition_key').eq(base_key.identity) &
+                    DynamoKey('range_key').begins_with(base_key.sort_prefix_key),
+                    FilterExpression=Attr('_start_time').gt(start_time.isoformat()) &
+                    Attr('_start_time').lt(end_time.isoformat()),
+                    ScanIndexForward=count >= 0,
+                )
+            ],
             key=lambda i: i[1].get('_start_time', datetime.min.isoformat()))
         if count:
             items = self._restrict_items_to_count(items, count)
-        return items
+        return iter(items)
+
+    def _iterate_start_time_index(self,
+                                  identity: str,
+                                  group: str,
+                                  start_time: str,
+                                  end_time: str,
+                                  count: int = 0,
+                                  predicate: Callable[[Key], bool] = None
+                                  ) -> Iterator[Tuple[Key, Any]]:
+        """
+        Iterates over the items of a group with a `_start_time` between start and end, both
+        exclusive, in time order by querying the start time index.
+        :param count: If set, only the first `count` items are returned. If negative, the last
+            `abs(count)` items are returned.
+        :param predicate: Filter applied to the keys of the items.
+        """
+        group_prefix = group + Key.PARTITION
+        # Key conditions are inclusive. Limit is set to count+1 so that an item which lies on the
+        # boundary of the range does not require another page.
+        items = (self.prepare_record(item) for item in self._query(
+            IndexName=self.START_TIME_INDEX_NAME,
+            Limit=min(abs(count) + 1, self._schema.query_limit)
+            if count else self._schema.query_limit,
+            KeyConditionExpression=DynamoKey('partition_key').eq(identity) & DynamoKey(
+                self.GROUP_START_TIME).between(group_prefix + start_time, group_prefix + end_time),
+            ScanIndexForward=count >= 0,
+        ))
+        items = (item for item in items
+                 if start_time < item[1]['_start_time'] < end_time and (predicate is None or
+                                                                        predicate(item[0])))
+        if count < 0:
+            # The items are read backwards and returned in time order
+            return reversed(list(islice(items, -count)))
+        return islice(items, count) if count else items
 
     def get_all(self, identity: str) -> Dict[Key, Any]:
-        response = self._table.query(KeyConditionExpression=DynamoKey('partition_key').eq(identity))
-        return dict([self.prepare_record(item)
-                     for item in response['Items']] if 'Items' in response else [])
+        return dict(self.iterate_all(identity))
+
+    def iterate_all(self, identity: str) -> Iterator[Tuple[Key, Any]]:
+        prefetched_items = self._get_prefetched_items(identity)
+        if prefetched_items is not None:
+            return prefetched_items.iterate_all(identity)
+
+        records = (self.prepare_record(item)
+                   for item in self._query(KeyConditionExpression=DynamoKey('partition_key').eq(
+                       identity)))
+        buffered_items = self._get_buffered_items(identity)
+        if not buffered_items:
+            return records
+
+        # The buffered items supersede the items of the table, in the order of the range key
+        items = dict(records)
+        items.update(buffered_items)
+        return iter(sorted(items.items(), key=lambda item: item[0].sort_key))
 
     def save(self, key: Key, item: Any) -> None:
         item['partition_key'] = key.identity
         item['range_key'] = key.sort_key
-        self._table.put_item(Item=self.clean_item_for_save(item))
+        if self._schema.start_time_index and item.get('_start_time', None):
+            item[self.GROUP_START_TIME] = key.group + Key.PARTITION + item['_start_time']
+        if key.identity == self._prefetched_identity:
+            self._invalidated_keys.add(key)
+
+        if not self._schema.write_buffer_size:
+            self._table.put_item(Item=self.clean_item_for_save(item))
+            return
+
+        if not self._write_buffer:
+            self._buffer.start = time.monotonic()
+        self._write_buffer[key] = self.clean_item_for_save(item)
+
+        if self._is_write_buffer_full():
+            self.flush()
+
+    def _is_write_buffer_full(self) -> bool:
+        """ Returns True when the buffer reached the buffer size or the buffer duration """
+        return bool(self._write_buffer) and (
+            len(self._write_buffer) >= self._schema.write_buffer_size or
+            time.monotonic() - self._buffer.start >= self._schema.write_buffer_seconds)
+
+    def update(self, key: Key, item: Dict[str, Any], changed_fields: List[str]) -> None:
+        # Buffered items are written whole by `batch_write_item`
+        if self._schema.write_buffer_size or key in self._write_buffer:
+            self.save(key, item)
+            return
+
+        if key.identity == self._prefetched_identity:
+            self._invalidated_keys.add(key)
+
+        values = {field: item[field] for field in changed_fields}
+        if self._schema.start_time_index and values.get('_start_time', None):
+            values[self.GROUP_START_TIME] = key.group + Key.PARTITION + item['_start_time']
+
+        # Empty values are removed in the same way as `clean_item_for_save` leaves them out
+        names = {'#f{}'.format(i): field for i, field in enumerate(values)}
+        set_values = {
+            ':f{}'.format(i): values[field]
+            for i, field in enumerate(values) if values[field]
+        }
+        set_actions = ['#{0} = :{0}'.format(name[1:]) for name in set_values]
+        remove_actions = [name for name, field in names.items() if not values[field]]
+        update_expression = []
+        if set_actions:
+            update_expression.append('SET ' + ', '.join(set_actions))
+        if remove_actions:
+            update_expression.append('REMOVE ' + ', '.join(remove_actions))
+
+        update_args = {
+            'Key': {
+                'partition_key': key.identity,
+                'range_key': key.sort_key
+            },
+            'UpdateExpression': ' '.join(update_expression),
+            'ExpressionAttributeNames': names
+        }
+        if set_values:
+            update_args['ExpressionAttributeValues'] = set_values
+        self._table.update_item(**update_args)
+
+    def _get_buffered_items(self, identity: str) -> List[Tuple[Key, Any]]:
+        """ Returns the buffered items of an identity as they are read from the table """
+        return [(key, self.clean_for_get(dict(item))) for key, item in self._write_buffer.items()
+                if key.identity == identity]
+
+    def _flush_identity(self, identity: str) -> None:
+        """ Flushes the buffer when it has items of the identity, before the table is queried """
+        if any(key.identity == identity for key in self._write_buffer):
+            self.flush()
+
+    def flush(self) -> None:
+        """ Writes the buffered items to the table """
+        items = list(self._write_buffer.values())
+        self._write_buffer.clear()
+        self._buffer.start = None
+
+        for i in range(0, len(items), self.BATCH_WRITE_SIZE):
+            self._batch_write(items[i:i + self.BATCH_WRITE_SIZE])
+
+    def _batch_write(self, items: List[Dict[str, Any]]) -> None:
+        """
+        Writes a batch of items. Items that DynamoDB does not process, e.g. when the write capacity
+        is exceeded, are retried with an exponential backoff.
+        """
+        request_items = {
+            self._schema.table_name: [{
+                'PutRequest': {
+                    'Item': item
+                }
+            } for item in items]
+        }
+        for retry in range(self.BATCH_WRITE_RETRIES + 1):
+            if retry:
+                time.sleep(self.BATCH_WRITE_RETRY_DELAY_SECONDS * 2**(retry - 1))
+            request_items = self._dynamodb_resource.batch_write_item(
+                RequestItems=request_items).get('UnprocessedItems', None)
+            if not request_items:
+                return
+
+        raise StoreWriteError('{} items could not be written to table {}.'.format(
+            len(request_items.get(self._schema.table_name, [])), self._schema.table_name))
 
     def delete(self, key: Key) -> None:
         pass
 
+    def finalize_identity(self) -> None:
+        # The buffer is kept across identities and flushed by `finalize` at the end of the run
+        if self._is_write_buffer_full():
+            self.flush()
+
     def finalize(self) -> None:
-        pass
+        self.flush()
@@ -1,7 +1,6 @@
-from datetime import datetime, timezone
-from typing import Any, Dict, List, Tuple
-
-from dateutil import parser
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union
 
 from blurr.core.store import Store, Key, StoreSchema
 from blurr.core.store_key import KeyType
@@ -11,14 +10,86 @@ class MemoryStoreSchema(StoreSchema):
     pass
 
 
+class _TimeIndex:
+    """
+    Keys of an (identity, group) kept sorted by time. Timestamp keys are sorted by their timestamp
+    and dimension keys by the `_start_time` of their item. Keys with the same time are kept in the
+    order in which they were added.
+    """
+
+    def __init__(self) -> None:
+        self._times: List[Union[datetime, str]] = []
+        self._keys: List[Key] = []
+        self._key_times: Dict[Key, Union[datetime, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: Key, time: Union[datetime, str]) -> None:
+        self.remove(key)
+        index = bisect_right(self._times, time)
+        self._times.insert(index, time)
+        self._keys.insert(index, key)
+        self._key_times[key] = time
+
+    def remove(self, key: Key) -> None:
+        if key not in self._key_times:
+            return
+
+        index = bisect_left(self._times, self._key_times.pop(key))
+        while self._keys[index] != key:
+            index += 1
+        del self._times[index]
+        del self._keys[index]
+
+    def iterate_range(self,
+                      start: Union[datetime, str],
+                      end: Union[datetime, str],
+                      count: int = 0,
+                      predicate: Callable[[Key], bool] = None) -> Iterator[Key]:
+        """
+        Iterates over the keys with a time between start and end, both exclusive, in time order.
+        The index must not be modified while iterating.
+        :param count: If set, only the first `count` keys are returned. If negative, the last
+            `abs(count)` keys are returned.
+        :param predicate: Filter applied to the keys in the range.
+        """
+        low = bisect_right(self._times, start)
+        high = bisect_left(self._times, end)
+        if count < 0:
+            # The last keys are found by walking backwards and are returned in time order
+            keys = []
+            for index in range(high - 1, low - 1, -1):
+                if predicate is None or predicate(self._keys[index]):
+                    keys.append(self._keys[index])
+                    if len(keys) == -count:
+                        break
+            yield from reversed(keys)
+            return
+
+        found = 0
+        for index in range(low, high):
+            key = self._keys[index]
+            if predicate is None or predicate(key):
+                yield key
+                found += 1
+                if found == count:
+                    return
+
+
 class MemoryStore(Store):
     """
-    In-memory store implementation
+    In-memory store implementation.
+
+    The items of each identity are bucketed and the keys of each (identity, group) are indexed by
+    time so that range queries do not scan the store.
     """
 
     def __init__(self, schema: MemoryStoreSchema) -> None:
         self._schema = schema
         self._cache: Dict[Key, Any] = dict()
+        self._identity_cache: Dict[str, Dict[Key, Any]] = dict()
+        self._time_index: Dict[Tuple[str, str, KeyType], _TimeIndex] = dict()
 
     def load(self):
         pass
@@ -27,44 +98,82 @@ class MemoryStore(Store):
         return self._cache.get(key, None)
 
     def get_all(self, identity: str = None) -> Dict[Key, Any]:
-        return {k: v
-                for k, v in self._cache.items()
-                if k.identity == identity} if identity else self._cache.copy()
+        if not identity:
+            return self._cache.copy()
+
+        return self._identity_cache.get(identity, {}).copy()
 
     def _get_range_timestamp_key(self, start: Key, end: Key = None,
                                  count: int = 0) -> List[Tuple[Key, Any]]:
-        items = []
-        for key, item in self._cache.items():
-            if start < key < end:
-                items.append((key, item))
-        items = sorted(items)
-        if count:
-            items = self._restrict_items_to_count(items, count)
-        return items
+        return list(self._iterate_range_timestamp_key(start, end, count))
+
+    def _iterate_range_timestamp_key(self, start: Key, end: Key,
+                                     count: int = 0) -> Iterator[Tuple[Key, Any]]:
+        index = self._time_index.get((start.identity, start.group, KeyType.TIMESTAMP), None)
+        if not index:
+            return iter(())
+
+        return ((key, self._cache[key])
+                for key in index.iterate_range(start.timestamp, end.timestamp, count))
 
     def _get_range_dimension_key(self,
                                  base_key: Key,
                                  start_time: datetime,
                                  end_time: datetime,
                                  count: int = 0) -> List[Tuple[Key, Any]]:
-        start_time_str = start_time.isoformat()
-        end_time_str = end_time.isoformat()
-        items = []
-        for key, item in self._cache.items():
-            if key.starts_with(base_key):
-                item_time = item.get('_start_time', datetime.min.isoformat())
-                if start_time_str < item_time < end_time_str:
-                    items.append((key, item))
-        items = sorted(items, key=lambda i: i[1].get('_start_time', datetime.min.isoformat()))
-        if count:
-            items = self._restrict_items_to_count(items, count)
-        return items
+        return list(self._iterate_range_dimension_key(base_key, start_time, end_time, count))
+
+    def _iterate_range_dimension_key(self,
+                                     base_key: Key,
+                                     start_time: datetime,
+                                     end_time: datetime,
+                                     count: int = 0) -> Iterator[Tuple[Key, Any]]:
+        index = self._time_index.get((base_key.identity, base_key.group, KeyType.DIMENSION), None)
+        if not index:
+            return iter(())
+
+        keys = index.iterate_range(start_time.isoformat(), end_time.isoformat(), count,
+                                   (lambda key: key.starts_with(base_key))
+                                   if base_key.dimensions else None)
+        return ((key, self._cache[key]) for key in keys)
 
     def save(self, key: Key, item: Any) -> None:
         self._cache[key] = item
+        self._identity_cache.setdefault(key.identity, dict())[key] = item
+
+        index_time = self._get_index_time(key, item)
+        if index_time is not None:
+            self._time_index.setdefault((key.identity, key.group, key.key_type),
+                                        _TimeIndex()).add(key, index_time)
 
     def delete(self, key: Key) -> None:
-        self._cache.pop(key, None)
+        if key not in self._cache:
+            return
+
+        del self._cache[key]
+        identity_items = self._identity_cache[key.identity]
+        del identity_items[key]
+        if not identity_items:
+            del self._identity_cache[key.identity]
+
+        index_key = (key.identity, key.group, key.key_type)
+        index = self._time_index.get(index_key, None)
+        if index is not None:
+            index.remove(key)
+            if not index:
+                del self._time_index[index_key]
 
     def finalize(self) -> None:
         pass
+
+    @staticmethod
+    def _get_index_time(key: Key, item: Any) -> Union[datetime, str, None]:
+        """ Returns the time by which the key is sorted within its (identity, group) """
+        if key.key_type == KeyType.TIMESTAMP:
+            return key.timestamp
+
+        if key.key_type == KeyType.DIMENSION:
+            return item.get('_start_time', datetime.min.isoformat()) if isinstance(
+                item, dict) else datetime.min.isoformat()
+
+        return None
@@ -0,0 +1,421 @@
+import heapq
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from bisect import bisect_right
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Segment directories are not shared between processes on platforms without fcntl
+    fcntl = None
+
+from blurr.core.schema_loader import SchemaLoader
+from blurr.core.store import Store, Key, StoreSchema
+from blurr.core.store_key import KeyType
+
+# Separates the identity from the sort key in the encoded keys, so that the encoded keys are
+# ordered by (identity, sort_key)
+IDENTITY_SEPARATOR = b'\x00'
+
+
+def encode_key(key: Key) -> bytes:
+    return key.identity.encode() + IDENTITY_SEPARATOR + key.sort_key.encode()
+
+
+def decode_key(encoded_key: bytes) -> Key:
+    identity, sort_key = encoded_key.split(IDENTITY_SEPARATOR, 1)
+    return Key.parse_sort_key(identity.decode(), sort_key.decode())
+
+
+class _Segment:
+    """
+    Immutable segment file that contains records sorted by key. The file is memory mapped and
+    records are located with a sparse index of every `INDEX_INTERVAL`th key.
+
+    File layout:
+        Records: <key length, value length, key, value>. Deleted keys have a TOMBSTONE length.
+        Sparse index: <key length, record offset, key>.
+        Footer: <sparse index offset, sparse index length, MAGIC>.
+    """
+    RECORD_HEADER = struct.Struct('<II')
+    INDEX_HEADER = struct.Struct('<IQ')
+    FOOTER = struct.Struct('<QQ8s')
+    MAGIC = b'BLURRSEG'
+    TOMBSTONE = 0xFFFFFFFF
+    INDEX_INTERVAL = 64
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as file:
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._end, index_length, magic = self.FOOTER.unpack_from(
+            self._data, len(self._data) - self.FOOTER.size)
+        if magic != self.MAGIC:
+            raise ValueError('{} is not a segment file.'.format(path))
+
+        self._index_keys: List[bytes] = []
+        self._index_offsets: List[int] = []
+        offset = self._end
+        for _ in range(index_length):
+            key_length, record_offset = self.INDEX_HEADER.unpack_from(self._data, offset)
+            offset += self.INDEX_HEADER.size
+            self._index_keys.append(self._data[offset:offset + key_length])
+            self._index_offsets.append(record_offset)
+            offset += key_length
+
+    def scan(self, low: bytes = b'',
+             high: Optional[bytes] = None) -> Iterator[Tuple[bytes, Optional[memoryview]]]:
+        """
+        Yields the (key, value) records with low <= key < high in key order. Values are views of
+        the mapped file and None for deleted keys.
+        """
+        position = bisect_right(self._index_keys, low) - 1
+        offset = self._index_offsets[position] if position >= 0 else 0
+        data = memoryview(self._data)
+        while offset < self._end:
+            key_length, value_length = self.RECORD_HEADER.unpack_from(self._data, offset)
+            offset += self.RECORD_HEADER.size
+            key = self._data[offset:offset + key_length]
+            offset += key_length
+            if high is not None and key >= high:
+                return
+
+            if value_length == self.TOMBSTONE:
+                value = None
+            else:
+                value = data[offset:offset + value_length]
+                offset += value_length
+
+            if key >= low:
+                yield key, value
+
+    @classmethod
+    def write(cls, path: str, records: Iterable[Tuple[bytes, Optional[bytes]]]) -> None:
+        """
+        Writes records sorted by key sequentially to a new segment file. The file is written to a
+        temporary path and renamed once complete.
+        """
+        index = []
+        offset = 0
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            for i, (key, value) in enumerate(records):
+                if i % cls.INDEX_INTERVAL == 0:
+                    index.append((key, offset))
+                file.write(
+                    cls.RECORD_HEADER.pack(
+                        len(key), cls.TOMBSTONE if value is None else len(value)))
+                file.write(key)
+                offset += cls.RECORD_HEADER.size + len(key)
+                if value is not None:
+                    file.write(value)
+                    offset += len(value)
+
+            for key, record_offset in index:
+                file.write(cls.INDEX_HEADER.pack(len(key), record_offset))
+                file.write(key)
+            file.write(cls.FOOTER.pack(offset, len(index), cls.MAGIC))
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary_path, path)
+
+
+# Segments are immutable and are opened once per process and shared by all the stores
+_segments: Dict[str, _Segment] = {}
+_segments_lock = threading.Lock()
+
+
+def _open_segment(path: str) -> _Segment:
+    with _segments_lock:
+        if path not in _segments:
+            _segments[path] = _Segment(path)
+        return _segments[path]
+
+
+def _forget_segment(path: str) -> None:
+    with _segments_lock:
+        _segments.pop(path, None)
+
+
+_last_segment_time = 0
+
+
+def _get_segment_time() -> int:
+    """ Returns the time in microseconds used to order new segments, unique in the process """
+    global _last_segment_time
+    with _segments_lock:
+        _last_segment_time = max(int(time.time() * 1000000), _last_segment_time + 1)
+        return _last_segment_time
+
+
+# Name of the file that is locked to coordinate the processes that use a directory
+LOCK_FILE = '.lock'
+
+
+@contextmanager
+def _lock_directory(directory: str, exclusive: bool = False) -> Iterator[None]:
+    """
+    Locks the directory against the other processes. Compaction takes an exclusive lock, so that
+    the segments are not removed while other processes list or write the segments.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class _Directory:
+    """
+    State of a segment directory that is shared by all the stores of the directory in a process,
+    so that the unflushed items are kept across the identities of a run.
+    """
+
+    def __init__(self) -> None:
+        # Unflushed items by encoded key. Deleted keys are None.
+        self.memtable: Dict[bytes, Any] = {}
+        self.segments: List[_Segment] = []
+
+
+_directories: Dict[str, _Directory] = {}
+
+
+def _get_directory(directory: str) -> _Directory:
+    with _segments_lock:
+        path = os.path.abspath(directory)
+        if path not in _directories:
+            _directories[path] = _Directory()
+        return _directories[path]
+
+
+class _Unflushed:
+    """ Wraps an unflushed item so that it is not decoded """
+    __slots__ = ['item']
+
+    def __init__(self, item: Any) -> None:
+        self.item = item
+
+
+class SegmentStoreSchema(StoreSchema):
+    ATTRIBUTE_DIRECTORY = 'Directory'
+    ATTRIBUTE_MAX_SEGMENTS = 'MaxSegments'
+    ATTRIBUTE_MAX_UNFLUSHED_ITEMS = 'MaxUnflushedItems'
+    MAX_SEGMENTS = 10
+    MAX_UNFLUSHED_ITEMS = 100000
+
+    def __init__(self, fully_qualified_name: str, schema_loader: SchemaLoader) -> None:
+        super().__init__(fully_qualified_name, schema_loader)
+        self.directory = self._spec.get(self.ATTRIBUTE_DIRECTORY, None)
+        # Segments are compacted into one when a flush creates more segments than this
+        self.max_segments = self._spec.get(self.ATTRIBUTE_MAX_SEGMENTS, self.MAX_SEGMENTS)
+        # Unflushed items are written to a new segment after an identity once there are more
+        # than this, and at the end of the run
+        self.max_unflushed_items = self._spec.get(self.ATTRIBUTE_MAX_UNFLUSHED_ITEMS,
+                                                  self.MAX_UNFLUSHED_ITEMS)
+
+    def validate_schema_spec(self) -> None:
+        super().validate_schema_spec()
+        self.validate_required_attributes(self.ATTRIBUTE_DIRECTORY)
+        self.validate_number_attribute(self.ATTRIBUTE_MAX_SEGMENTS, int, 1)
+        self.validate_number_attribute(self.ATTRIBUTE_MAX_UNFLUSHED_ITEMS, int, 1)
+
+
+class SegmentStore(Store):
+    """
+    Log structured store for bulk runs on a single machine that persist the state in local files.
+
+    Saves are kept in memory, shared by the stores of the directory in the process, and written
+    sequentially, sorted by (identity, sort_key), to a new immutable segment file once there are
+    more than `MaxUnflushedItems` after an identity and on `finalize()`. Reads merge the segments,
+    newest first, through their memory mapped files. Compaction merges the segments into one and
+    drops the superseded and deleted items.
+
+    Processes that share the directory, e.g. the workers of a run, write their own segments. The
+    directory is locked so that compaction does not remove the segments that other processes are
+    listing or writing.
+    """
+    SEGMENT_EXTENSION = '.seg'
+
+    def __init__(self, schema: SegmentStoreSchema) -> None:
+        self._schema = schema
+        self._directory = schema.directory
+        os.makedirs(self._directory, exist_ok=True)
+        self._state = _get_directory(self._directory)
+        with _lock_directory(self._directory):
+            self._list_segments()
+
+    @property
+    def _memtable(self) -> Dict[bytes, Any]:
+        return self._state.memtable
+
+    @property
+    def _segments(self) -> List[_Segment]:
+        return self._state.segments
+
+    def _list_segments(self) -> None:
+        """ Opens the segments in the directory. Must be called with the directory locked. """
+        segments = [
+            _open_segment(os.path.join(self._directory, name))
+            for name in sorted(os.listdir(self._directory), key=self._get_segment_order)
+            if name.endswith(self.SEGMENT_EXTENSION)
+        ]
+        # Segments removed by the compaction of another process
+        for segment in set(self._state.segments) - set(segments):
+            _forget_segment(segment.path)
+        self._state.segments = segments
+
+    @classmethod
+    def _get_segment_order(cls, name: str) -> Tuple[int, int]:
+        """ Segment files are named <time>-<process>-<generation>.seg and ordered by time """
+        if not name.endswith(cls.SEGMENT_EXTENSION):
+            return 0, 0
+        segment_time, _, generation = name[:-len(cls.SEGMENT_EXTENSION)].split('-')
+        return int(segment_time), int(generation)
+
+    def _get_segment_path(self, segment_time: int, generation: int) -> str:
+        return os.path.join(
+            self._directory, '{:020d}-{}-{}{}'.format(segment_time, os.getpid(), generation,
+                                                     self.SEGMENT_EXTENSION))
+
+    def _scan(self, low: bytes, high: bytes) -> List[Tuple[Key, Any]]:
+        """
+        Returns the items with low <= encoded key < high in key order. Newer segments and the
+        unflushed items supersede older segments.
+        """
+        records: Dict[bytes, Any] = {}
+        for segment in self._segments:
+            for key, value in segment.scan(low, high):
+                records[key] = value
+        for key, item in self._memtable.items():
+            if low <= key < high:
+                records[key] = None if item is None else _Unflushed(item)
+
+        return [(decode_key(key), value.item
+                 if isinstance(value, _Unflushed) else pickle.loads(value))
+                for key, value in sorted(records.items()) if value is not None]
+
+    def get(self, key: Key) -> Any:
+        encoded_key = encode_key(key)
+        if encoded_key in self._memtable:
+            return self._memtable[encoded_key]
+
+        for segment in reversed(self._segments):
+            for _, value in segment.scan(encoded_key, encoded_key + IDENTITY_SEPARATOR):
+                return None if value is None else pickle.loads(value)
+
+        return None
+
+    def get_all(self, identity: str) -> Dict[Key, Any]:
+        prefix = identity.encode() + IDENTITY_SEPARATOR
+        return dict(self._scan(prefix, prefix[:-1] + b'\x01'))
+
+    def _get_range_timestamp_key(self, start: Key, end: Key,
+                                 count: int = 0) -> List[Tuple[Key, Any]]:
+        items = self._scan(encode_key(start), encode_key(end))
+        if items and items[0][0] == start:
+            items = items[1:]
+        if count:
+            items = self._restrict_items_to_count(items, count)
+        return items
+
+    def _get_range_dimension_key(self,
+                                 base_key: Key,
+                                 start_time: datetime,
+                                 end_time: datetime,
+                                 count: int = 0) -> List[Tuple[Key, Any]]:
+        prefix = encode_key(Key(KeyType.DIMENSION, base_key.identity, base_key.group))[:-1]
+        start_time_str = start_time.isoformat()
+        end_time_str = end_time.isoformat()
+        items = [(key, item)
+                 for key, item in self._scan(prefix, prefix[:-1] + b'\x30')
+                 if key.starts_with(base_key) and start_time_str < item.get(
+                     '_start_time', datetime.min.isoformat()) < end_time_str]
+        items.sort(key=lambda i: i[1].get('_start_time', datetime.min.isoformat()))
+        if count:
+            items = self._restrict_items_to_count(items, count)
+        return items
+
+    def save(self, key: Key, item: Any) -> None:
+        self._memtable[encode_key(key)] = item
+
+    def delete(self, key: Key) -> None:
+        self._memtable[encode_key(key)] = None
+
+    def finalize(self) -> None:
+        self.flush()
+
+    def finalize_identity(self) -> None:
+        if len(self._memtable) >= self._schema.max_unflushed_items:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes the unflushed items to a new segment. The segments are compacted when there are more
+        than the maximum number of segments.
+        """
+        if not self._memtable:
+            return
+
+        with _lock_directory(self._directory):
+            path = self._get_segment_path(_get_segment_time(), 0)
+            _Segment.write(path, ((key, None if item is None else pickle.dumps(
+                item, pickle.HIGHEST_PROTOCOL)) for key, item in sorted(self._memtable.items())))
+        self._segments.append(_open_segment(path))
+        self._memtable.clear()
+
+        if len(self._segments) > self._schema.max_segments:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Merges the segments into one segment that contains the latest value of each key. Deleted
+        keys are dropped.
+        """
+        with _lock_directory(self._directory, exclusive=True):
+            # Includes the segments that other processes have written since the segments were
+            # listed, and excludes the segments that they have compacted
+            self._list_segments()
+            self._compact()
+
+    def _compact(self) -> None:
+        segments = self._segments
+        if len(segments) < 2:
+            return
+
+        def ordered_records(order: int, segment: _Segment) -> Iterator[Tuple[bytes, int, Any]]:
+            for key, value in segment.scan():
+                yield key, -order, value
+
+        # Orders the records of all the segments by key and then from the newest segment
+        merged = heapq.merge(
+            *[ordered_records(order, segment) for order, segment in enumerate(segments)])
+
+        def latest_records() -> Iterator[Tuple[bytes, bytes]]:
+            previous_key = None
+            for key, _, value in merged:
+                if key != previous_key and value is not None:
+                    yield key, value
+                previous_key = key
+
+        last_time, last_generation = self._get_segment_order(os.path.basename(segments[-1].path))
+        path = self._get_segment_path(last_time, last_generation + 1)
+        _Segment.write(path, latest_records())
+
+        self._state.segments = [_open_segment(path)]
+        for segment in segments:
+            _forget_segment(segment.path)
+            os.remove(segment.path)
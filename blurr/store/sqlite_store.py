@@ -0,0 +1,213 @@
+import pickle
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from blurr.core.schema_loader import SchemaLoader
+from blurr.core.store import Store, Key, StoreSchema
+from blurr.core.store_key import KeyType
+from blurr.core.validator import validate_python_identifier_attributes
+
+# sqlite3 connections cannot be shared between threads. A connection is opened once per thread and
+# file and shared by all the stores created in that thread.
+_thread_local = threading.local()
+
+
+class _ConnectionState:
+    """
+    State of a connection that is shared by all the stores of the database file in a thread, so
+    that the saves of many identities are committed together.
+    """
+
+    def __init__(self) -> None:
+        # Tables created by the stores of the connection
+        self.tables: Set[str] = set()
+        # Number of identities finalized in the open transaction
+        self.identities = 0
+        # Time at which the first uncommitted change was made
+        self.start: Optional[float] = None
+
+
+class SQLiteStoreSchema(StoreSchema):
+    ATTRIBUTE_FILE = 'File'
+    ATTRIBUTE_TABLE = 'Table'
+    ATTRIBUTE_MAX_UNCOMMITTED_IDENTITIES = 'MaxUncommittedIdentities'
+    ATTRIBUTE_MAX_UNCOMMITTED_SECONDS = 'MaxUncommittedSeconds'
+    MAX_UNCOMMITTED_IDENTITIES = 1000
+    MAX_UNCOMMITTED_SECONDS = 60
+
+    def __init__(self, fully_qualified_name: str, schema_loader: SchemaLoader) -> None:
+        super().__init__(fully_qualified_name, schema_loader)
+        self.file = self._spec.get(self.ATTRIBUTE_FILE, None)
+        self.table_name = self._spec.get(self.ATTRIBUTE_TABLE, self.name)
+        # The transaction is committed after an identity once this many identities are saved in
+        # it or its first save is older than this, and at the end of the run
+        self.max_uncommitted_identities = self._spec.get(
+            self.ATTRIBUTE_MAX_UNCOMMITTED_IDENTITIES, self.MAX_UNCOMMITTED_IDENTITIES)
+        self.max_uncommitted_seconds = self._spec.get(self.ATTRIBUTE_MAX_UNCOMMITTED_SECONDS,
+                                                      self.MAX_UNCOMMITTED_SECONDS)
+
+    def validate_schema_spec(self) -> None:
+        super().validate_schema_spec()
+        self.validate_required_attributes(self.ATTRIBUTE_FILE)
+        self.validate_number_attribute(self.ATTRIBUTE_MAX_UNCOMMITTED_IDENTITIES, int, 1)
+        self.validate_number_attribute(self.ATTRIBUTE_MAX_UNCOMMITTED_SECONDS, float, 0)
+        self.add_errors(
+            validate_python_identifier_attributes(self.fully_qualified_name, self._spec,
+                                                  self.ATTRIBUTE_TABLE))
+
+
+class SQLiteStore(Store):
+    """
+    SQLite store implementation for runs on a single machine that persist the state in a local
+    file.
+
+    Items are stored by identity and sort key, so that the items of an identity are ordered by
+    `Key.sort_key`. An index on the group and `_start_time` of the items serves the range queries
+    on DIMENSION keys. Saves are written in a transaction that is shared by the stores of the file
+    in a thread. The transaction is committed once it holds the maximum number of identities or
+    is older than the maximum duration, and on `finalize()` at the end of the run.
+    """
+
+    def __init__(self, schema: SQLiteStoreSchema) -> None:
+        self._schema = schema
+        self._table = schema.table_name
+        self._connection = self.get_connection(schema.file)
+        self._transaction = self._get_connection_state(schema.file)
+        # Creating the table commits the open transaction, so it is only done once per connection
+        if self._table in self._transaction.tables:
+            return
+        self._transaction.tables.add(self._table)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS {table} ('
+                'identity TEXT NOT NULL, sort_key TEXT NOT NULL, key_group TEXT NOT NULL, '
+                'key_type INTEGER NOT NULL, start_time TEXT NOT NULL, item BLOB NOT NULL, '
+                'PRIMARY KEY (identity, sort_key)) WITHOUT ROWID'.format(table=self._table))
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS {table}_start_time ON {table} '
+                '(identity, key_group, key_type, start_time)'.format(table=self._table))
+
+    @staticmethod
+    def get_connection(file: str) -> sqlite3.Connection:
+        """ Returns the connection to the database file for the current thread """
+        connections = getattr(_thread_local, 'connections', None)
+        if connections is None:
+            connections = _thread_local.connections = {}
+        if file not in connections:
+            connections[file] = sqlite3.connect(file)
+        return connections[file]
+
+    @staticmethod
+    def _get_connection_state(file: str) -> _ConnectionState:
+        """ Returns the state of the connection to the database file for the current thread """
+        states = getattr(_thread_local, 'connection_states', None)
+        if states is None:
+            states = _thread_local.connection_states = {}
+        if file not in states:
+            states[file] = _ConnectionState()
+        return states[file]
+
+    @staticmethod
+    def _get_start_time(item: Any) -> str:
+        """ Returns the `_start_time` by which DIMENSION keys are sorted in range queries """
+        if isinstance(item, dict) and item.get('_start_time', None):
+            return item['_start_time']
+        return datetime.min.isoformat()
+
+    def _get_items(self, identity: str, rows: List[Tuple[str, bytes]]) -> List[Tuple[Key, Any]]:
+        return [(Key.parse_sort_key(identity, sort_key), pickle.loads(item))
+                for sort_key, item in rows]
+
+    def get(self, key: Key) -> Any:
+        row = self._connection.execute(
+            'SELECT item FROM {table} WHERE identity = ? AND sort_key = ?'.format(
+                table=self._table), (key.identity, key.sort_key)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def get_all(self, identity: str) -> Dict[Key, Any]:
+        return dict(self.iterate_all(identity))
+
+    def iterate_all(self, identity: str) -> Iterator[Tuple[Key, Any]]:
+        rows = self._connection.execute(
+            'SELECT sort_key, item FROM {table} WHERE identity = ? ORDER BY sort_key'.format(
+                table=self._table), (identity, ))
+        return ((Key.parse_sort_key(identity, sort_key), pickle.loads(item))
+                for sort_key, item in rows)
+
+    def _get_range_timestamp_key(self, start: Key, end: Key,
+                                 count: int = 0) -> List[Tuple[Key, Any]]:
+        rows = self._connection.execute(
+            'SELECT sort_key, item FROM {table} '
+            'WHERE identity = ? AND sort_key > ? AND sort_key < ? '
+            'ORDER BY sort_key {order} {limit}'.format(
+                table=self._table,
+                order='DESC' if count < 0 else 'ASC',
+                limit='LIMIT {}'.format(abs(count)) if count else ''),
+            (start.identity, start.sort_key, end.sort_key)).fetchall()
+        return self._get_items(start.identity, rows[::-1] if count < 0 else rows)
+
+    def _get_range_dimension_key(self,
+                                 base_key: Key,
+                                 start_time: datetime,
+                                 end_time: datetime,
+                                 count: int = 0) -> List[Tuple[Key, Any]]:
+        conditions = 'identity = ? AND key_group = ? AND key_type = ? ' \
+                     'AND start_time > ? AND start_time < ?'
+        parameters = [
+            base_key.identity, base_key.group, KeyType.DIMENSION.value,
+            start_time.isoformat(),
+            end_time.isoformat()
+        ]
+        if base_key.dimensions:
+            # Matches the keys that start with all the dimensions of the base key
+            prefix = Key.PARTITION.join([base_key.group, base_key.dimensions_str])
+            conditions += ' AND (sort_key = ? OR substr(sort_key, 1, ?) = ?)'
+            parameters += [
+                prefix + Key.PARTITION,
+                len(prefix) + 1, prefix + Key.DIMENSION_PARTITION
+            ]
+
+        rows = self._connection.execute(
+            'SELECT sort_key, item FROM {table} WHERE {conditions} '
+            'ORDER BY start_time {order}, sort_key {order} {limit}'.format(
+                table=self._table,
+                conditions=conditions,
+                order='DESC' if count < 0 else 'ASC',
+                limit='LIMIT {}'.format(abs(count)) if count else ''), parameters).fetchall()
+        return self._get_items(base_key.identity, rows[::-1] if count < 0 else rows)
+
+    def _begin(self) -> None:
+        """ Records the time of the first change of the transaction """
+        if self._transaction.start is None:
+            self._transaction.start = time.monotonic()
+
+    def save(self, key: Key, item: Any) -> None:
+        self._begin()
+        self._connection.execute(
+            'INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?)'.format(table=self._table),
+            (key.identity, key.sort_key, key.group, key.key_type.value,
+             self._get_start_time(item), pickle.dumps(item, pickle.HIGHEST_PROTOCOL)))
+
+    def delete(self, key: Key) -> None:
+        self._begin()
+        self._connection.execute(
+            'DELETE FROM {table} WHERE identity = ? AND sort_key = ?'.format(table=self._table),
+            (key.identity, key.sort_key))
+
+    def finalize_identity(self) -> None:
+        if self._transaction.start is None:
+            return
+
+        self._transaction.identities += 1
+        if (self._transaction.identities >= self._schema.max_uncommitted_identities or
+                time.monotonic() - self._transaction.start >=
+                self._schema.max_uncommitted_seconds):
+            self.finalize()
+
+    def finalize(self) -> None:
+        self._connection.commit()
+        self._transaction.identities = 0
+        self._transaction.start = None
@@ -0,0 +1,59 @@
+"""
+Measures the throughput of `Runner.get_per_identity_records` which evaluates the identity and time
+of every raw event.
+
+Usage:
+    benchmark_per_identity_records.py [--events=<count>] [--streaming-bts=<file>] [--repeat=<count>]
+    benchmark_per_identity_records.py (-h | --help)
+
+Options:
+    -h --help                   Show this screen.
+    --events=<count>            Number of synthetic events to process. [default: 100000]
+    --streaming-bts=<file>      Streaming BTS to use. [default: tests/data/stream.yml]
+    --repeat=<count>            Number of runs. The best run is reported. [default: 3]
+
+Run from blurr's base directory with `PYTHONPATH=. python scripts/benchmark_per_identity_records.py`
+"""
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from docopt import docopt
+
+from blurr.runner.data_processor import SimpleJsonDataProcessor
+from blurr.runner.local_runner import LocalRunner
+
+
+def generate_events(count: int) -> List[str]:
+    start = datetime(2018, 3, 7, tzinfo=timezone.utc)
+    return [
+        json.dumps({
+            'user_id': 'user{}'.format(i % 1000),
+            'event_time': (start + timedelta(seconds=i)).isoformat(),
+            'country': 'US' if i % 2 else 'IN'
+        }) for i in range(count)
+    ]
+
+
+def run(stream_bts_file: str, events: List[str]) -> float:
+    runner = LocalRunner(stream_bts_file)
+    data_processor = SimpleJsonDataProcessor()
+    start = time.perf_counter()
+    for _ in runner.get_per_identity_records(events, data_processor):
+        pass
+    return time.perf_counter() - start
+
+
+def main():
+    arguments = docopt(__doc__)
+    events = generate_events(int(arguments['--events']))
+    elapsed = min(
+        run(arguments['--streaming-bts'], events) for _ in range(int(arguments['--repeat'])))
+    print('{} events in {:.3f}s: {:.0f} events/sec'.format(
+        len(events), elapsed,
+        len(events) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
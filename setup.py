@@ -64,6 +64,8 @@ setup(
     data_files=["blurr/VERSION"],
     include_package_data=True,
     install_requires=requirements(),
+    # numpy is only required to evaluate the window BTS in batches and vectorized windows
+    extras_require={'numpy': ['numpy']},
     python_requires='>=3.6',
     classifiers=[
         "Development Status :: 1 - Planning",  # https://pypi.python.org/pypi?%3Aaction=list_classifiers
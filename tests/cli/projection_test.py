@@ -0,0 +1,42 @@
+from typing import List
+
+from blurr.cli.cli import cli
+from blurr.cli.projection import get_source_projection
+
+
+def run_command(bts_files: List[str]) -> int:
+    return cli({
+        'transform': False,
+        'validate': False,
+        'projection': True,
+        'package-spark': False,
+        '<BTS>': bts_files
+    })
+
+
+def test_projection(capsys) -> None:
+    assert run_command(['tests/data/stream.yml']) == 0
+    out, err = capsys.readouterr()
+    assert out == ('Source fields read by tests/data/stream.yml:\n'
+                   'country\n'
+                   'event_time\n'
+                   'user_id\n')
+    assert err == ''
+
+
+def test_projection_window_bts(capsys) -> None:
+    assert run_command(['tests/data/stream.yml', 'tests/data/window.yml']) == 1
+    out, err = capsys.readouterr()
+    assert 'Source fields read by tests/data/stream.yml:' in out
+    assert 'tests/data/window.yml is not a streaming BTS.' in err
+
+
+def test_projection_invalid_bts(capsys) -> None:
+    assert run_command(['tests/cli/bts/invalid_missing_time.yml']) == 1
+    out, err = capsys.readouterr()
+    assert 'There was an error parsing the document.' in err
+
+
+def test_get_source_projection() -> None:
+    assert get_source_projection('tests/data/stream.yml') == {'country', 'event_time', 'user_id'}
+    assert get_source_projection('tests/cli/bts/invalid_missing_time.yml') is None
@@ -1,5 +1,6 @@
 import json
 from typing import Any, Optional
+from unittest import mock
 
 from pytest import mark
 
@@ -11,7 +12,12 @@ def run_command(stream_bts_file: Optional[str],
                 source: Optional[str],
                 raw_json_files: Optional[str],
                 runner: Optional[str] = None,
-                data_processor: Optional[str] = None) -> int:
+                data_processor: Optional[str] = None,
+                workers: Optional[str] = None,
+                memory_budget: Optional[str] = None,
+                presorted: bool = False,
+                compiled: bool = False,
+                batch_windows: bool = False) -> int:
     return cli({
         'transform': True,
         'validate': False,
@@ -20,6 +26,11 @@ def run_command(stream_bts_file: Optional[str],
         '--streaming-bts': stream_bts_file,
         '--window-bts': window_bts_file,
         '--data-processor': data_processor,
+        '--workers': workers,
+        '--memory-budget': memory_budget,
+        '--presorted': presorted,
+        '--compiled': compiled,
+        '--batch-windows': batch_windows,
         '--source': source,
         '<raw-json-files>': raw_json_files,
     })
@@ -145,3 +156,142 @@ def test_transform_invalid_data_processor(capsys) -> None:
         data_processor='incorrect') == 1
     out, err = capsys.readouterr()
     assert 'Unknown data-processor: \'local\'. Possible values: [\'ipfix\', \'simple\']' in err
+
+
+def test_transform_with_workers(capsys) -> None:
+    assert run_command(
+        stream_bts_file='tests/data/stream.yml',
+        window_bts_file='tests/data/window.yml',
+        source='tests/data/raw.json,tests/data/raw.json',
+        raw_json_files=None,
+        workers='2') == 0
+    out, err = capsys.readouterr()
+    assert_record_in_ouput([
+        'userA', [{
+            'last_session._identity': 'userA',
+            'last_session.events': 2,
+            'last_day._identity': 'userA',
+            'last_day.total_events': 2
+        }]
+    ], out)
+    assert err == ''
+
+
+def test_transform_invalid_workers(capsys) -> None:
+    assert run_command(
+        stream_bts_file='tests/data/stream.yml',
+        window_bts_file='tests/data/window.yml',
+        source='tests/data/raw.json',
+        raw_json_files=None,
+        workers='0') == 1
+    out, err = capsys.readouterr()
+    assert 'Invalid workers: \'0\'. Must be a positive integer.' in err
+
+
+@mark.parametrize('memory_budget, presorted, option', [('1', False, 'memory-budget'),
+                                                       (None, True, 'presorted')])
+def test_transform_workers_with_sorted_input(capsys, memory_budget, presorted, option) -> None:
+    assert run_command(
+        stream_bts_file='tests/data/stream.yml',
+        window_bts_file='tests/data/window.yml',
+        source='tests/data/raw.json',
+        raw_json_files=None,
+        workers='2',
+        memory_budget=memory_budget,
+        presorted=presorted) == 1
+    out, err = capsys.readouterr()
+    assert 'workers cannot be combined with {}.'.format(option) in err
+    assert out == ''
+
+
+def test_transform_batch_windows_without_numpy(capsys) -> None:
+    with mock.patch('blurr.core.window_array._numpy_import_err',
+                    ImportError('No module named \'numpy\'')):
+        assert run_command(
+            stream_bts_file='tests/data/stream.yml',
+            window_bts_file='tests/data/window.yml',
+            source='tests/data/raw.json',
+            raw_json_files=None,
+            batch_windows=True) == 1
+    out, err = capsys.readouterr()
+    assert 'batch-windows requires numpy.' in err
+    assert out == ''
+
+
+def test_transform_with_memory_budget(capsys) -> None:
+    assert run_command(
+        stream_bts_file='tests/data/stream.yml',
+        window_bts_file='tests/data/window.yml',
+        source='tests/data/raw.json,tests/data/raw.json',
+        raw_json_files=None,
+        memory_budget='1') == 0
+    out, err = capsys.readouterr()
+    assert_record_in_ouput([
+        'userA', [{
+            'last_session._identity': 'userA',
+            'last_session.events': 2,
+            'last_day._identity': 'userA',
+            'last_day.total_events': 2
+        }]
+    ], out)
+    assert err == ''
+
+
+def test_transform_invalid_memory_budget(capsys) -> None:
+    assert run_command(
+        stream_bts_file='tests/data/stream.yml',
+        window_bts_file=None,
+        source='tests/data/raw.json',
+        raw_json_files=None,
+        memory_budget='abc') == 1
+    out, err = capsys.readouterr()
+    assert 'Invalid memory-budget: \'abc\'. Must be a positive integer.' in err
+
+
+def test_transform_presorted(capsys) -> None:
+    assert run_command(
+        stream_bts_file='tests/data/stream.yml',
+        window_bts_file='tests/data/window.yml',
+        source='tests/data/raw.json',
+        raw_json_files=None,
+        presorted=True) == 0
+    out, err = capsys.readouterr()
+    assert_record_in_ouput([
+        'userA', [{
+            'last_session._identity': 'userA',
+            'last_session.events': 1,
+            'last_day._identity': 'userA',
+            'last_day.total_events': 1
+        }]
+    ], out)
+    assert err == ''
+
+
+def test_transform_presorted_order_violated(capsys) -> None:
+    assert run_command(
+        stream_bts_file='tests/data/stream.yml',
+        window_bts_file='tests/data/window.yml',
+        source='tests/data/raw.json,tests/data/raw.json',
+        raw_json_files=None,
+        presorted=True) == 1
+    out, err = capsys.readouterr()
+    assert 'Records of identity userA are not grouped together.' in err
+
+
+def test_transform_compiled(capsys) -> None:
+    assert run_command(
+        stream_bts_file='tests/data/stream.yml',
+        window_bts_file='tests/data/window.yml',
+        source='tests/data/raw.json',
+        raw_json_files=None,
+        compiled=True) == 0
+    out, err = capsys.readouterr()
+    assert_record_in_ouput([
+        'userA', [{
+            'last_session._identity': 'userA',
+            'last_session.events': 1,
+            'last_day._identity': 'userA',
+            'last_day.total_events': 1
+        }]
+    ], out)
+    assert err == ''
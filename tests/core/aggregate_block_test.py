@@ -94,6 +94,8 @@ def test_block_aggregate_schema_evaluate_with_dimensions(block_aggregate_schema_
         'Type': Type.STRING,
         'Value': 'source.label'
     }]
+    # The state of the previous dimension is saved to the store when the dimension changes
+    block_aggregate_schema_spec['DimensionCacheSize'] = 1
     name = schema_loader.add_schema_spec(block_aggregate_schema_spec)
     block_aggregate_schema = BlockAggregateSchema(name, schema_loader)
 
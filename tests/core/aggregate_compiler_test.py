@@ -0,0 +1,201 @@
+from datetime import datetime
+from typing import Dict, Any, List
+
+import pytest
+from pytest import fixture
+
+from blurr.core.errors import MissingAttributeError
+from blurr.core.record import Record
+from blurr.core.schema_loader import SchemaLoader
+from blurr.core.transformer_streaming import StreamingTransformer
+from blurr.core.type import Type
+
+
+@fixture
+def schema_spec() -> Dict[str, Any]:
+    return {
+        'Name': 'test',
+        'Type': Type.BLURR_TRANSFORM_STREAMING,
+        'Version': '2018-03-01',
+        'Import': [{
+            'Module': 'datetime',
+            'Identifiers': ['datetime']
+        }],
+        'Identity': 'source.user',
+        'Time': 'datetime(2016, 10, 10, source.hour)',
+        'Stores': [{
+            'Name': 'memstore',
+            'Type': Type.BLURR_STORE_MEMORY
+        }],
+        'Aggregates': [{
+            'Name': 'vars',
+            'Type': Type.BLURR_AGGREGATE_VARIABLE,
+            'Fields': [{
+                'Name': 'country',
+                'Type': Type.STRING,
+                'Value': 'source[\'country\'].upper()'
+            }]
+        }, {
+            'Name': 'session',
+            'Type': Type.BLURR_AGGREGATE_BLOCK,
+            'Store': 'memstore',
+            'When': 'source.event != \'ignored\'',
+            'Dimensions': [{
+                'Name': 'session_id',
+                'Type': Type.STRING,
+                'Value': 'source.session_id'
+            }],
+            'Fields': [{
+                'Name': 'events',
+                'Type': Type.INTEGER,
+                'Value': 'session.events + 1'
+            }, {
+                'Name': 'amount',
+                'Type': Type.INTEGER,
+                'When': 'source.event == \'purchase\'',
+                'Value': 'session[\'amount\'] + int(source.amount)'
+            }, {
+                'Name': 'countries',
+                'Type': Type.SET,
+                'Value': 'session.countries.add(vars.country)'
+            }, {
+                'Name': 'ratio',
+                'Type': Type.FLOAT,
+                'Value': 'session.amount / (session.events - 1)'
+            }, {
+                'Name': 'user',
+                'Type': Type.STRING,
+                'Value': 'session._identity'
+            }, {
+                'Name': 'items',
+                'Type': Type.INTEGER,
+                'Value': 'len([item for item in source.products if item])'
+            }]
+        }]
+    }
+
+
+def get_records() -> List[Record]:
+    return [
+        Record({
+            'user': 'user1',
+            'hour': 1,
+            'event': 'visit',
+            'session_id': 'a',
+            'country': 'us',
+            'products': []
+        }),
+        Record({
+            'user': 'user1',
+            'hour': 2,
+            'event': 'purchase',
+            'session_id': 'a',
+            'country': 'ca',
+            'amount': '10',
+            'products': ['x', None, 'y']
+        }),
+        Record({
+            'user': 'user1',
+            'hour': 3,
+            'event': 'purchase',
+            'session_id': 'a',
+            'country': 'us',
+            'amount': 'invalid'
+        }),
+        Record({
+            'user': 'user1',
+            'hour': 4,
+            'event': 'ignored',
+            'session_id': 'b',
+            'country': 'in'
+        }),
+        Record({
+            'user': 'user1',
+            'hour': 5,
+            'event': 'visit',
+            'country': 'in'
+        }),
+        Record({
+            'user': 'user1',
+            'hour': 6,
+            'event': 'purchase',
+            'session_id': 'b',
+            'country': 'in',
+            'amount': 5
+        }),
+    ]
+
+
+def evaluate(schema_spec: Dict[str, Any], compiled: bool) -> Dict:
+    schema_loader = SchemaLoader()
+    transformer_schema = schema_loader.get_schema_object(
+        schema_loader.add_schema_spec(schema_spec))
+    transformer = StreamingTransformer(transformer_schema, 'user1', compiled)
+    for record in get_records():
+        transformer.run_evaluate(record)
+    transformer.run_finalize()
+
+    return schema_loader.get_store('test.memstore').get_all('user1')
+
+
+def test_compiled_evaluation_same_as_interpreted(schema_spec: Dict[str, Any]) -> None:
+    interpreted = evaluate(schema_spec, False)
+    compiled = evaluate(schema_spec, True)
+
+    assert len(interpreted) == 2
+    assert compiled == interpreted
+
+
+def test_compiled_evaluation_field_values(schema_spec: Dict[str, Any]) -> None:
+    schema_loader = SchemaLoader()
+    transformer_schema = schema_loader.get_schema_object(
+        schema_loader.add_schema_spec(schema_spec))
+    transformer = StreamingTransformer(transformer_schema, 'user1', True)
+    for record in get_records()[:3]:
+        transformer.run_evaluate(record)
+
+    assert transformer.vars.country == 'US'
+    assert transformer.session.session_id == 'a'
+    assert transformer.session.events == 3
+    # The invalid amount fails the evaluation which leaves the value unchanged
+    assert transformer.session.amount == 10
+    assert transformer.session.countries == {'US', 'CA'}
+    assert transformer.session.ratio == 5.0
+    assert transformer.session.user == 'user1'
+    assert transformer.session.items == 2
+    assert transformer.session._start_time == datetime(2016, 10, 10, 1)
+    assert transformer.session._end_time == datetime(2016, 10, 10, 3)
+
+
+def test_compiled_evaluation_generated_once(schema_spec: Dict[str, Any]) -> None:
+    schema_loader = SchemaLoader()
+    transformer_schema = schema_loader.get_schema_object(
+        schema_loader.add_schema_spec(schema_spec))
+    StreamingTransformer(transformer_schema, 'user1', True)
+    compiled_aggregates = transformer_schema._compiled_aggregates
+
+    StreamingTransformer(transformer_schema, 'user2', True)
+    assert transformer_schema._compiled_aggregates is compiled_aggregates
+    assert set(compiled_aggregates.keys()) == {'vars', 'session'}
+
+
+def test_compiled_evaluation_name_error(schema_spec: Dict[str, Any]) -> None:
+    schema_spec['Aggregates'][0]['Fields'][0]['Value'] = 'undefined_name'
+    schema_loader = SchemaLoader()
+    transformer_schema = schema_loader.get_schema_object(
+        schema_loader.add_schema_spec(schema_spec))
+    transformer = StreamingTransformer(transformer_schema, 'user1', True)
+
+    with pytest.raises(NameError, match='undefined_name'):
+        transformer.run_evaluate(get_records()[0])
+
+
+def test_compiled_evaluation_missing_field(schema_spec: Dict[str, Any]) -> None:
+    schema_spec['Aggregates'][0]['Fields'][0]['Value'] = 'session.undefined_field'
+    schema_loader = SchemaLoader()
+    transformer_schema = schema_loader.get_schema_object(
+        schema_loader.add_schema_spec(schema_spec))
+    transformer = StreamingTransformer(transformer_schema, 'user1', True)
+
+    with pytest.raises(MissingAttributeError, match='undefined_field not defined in session'):
+        transformer.run_evaluate(get_records()[0])
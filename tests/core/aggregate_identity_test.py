@@ -1,4 +1,5 @@
 from typing import Dict, Any, List
+from unittest import mock
 
 from dateutil import parser
 from pytest import fixture
@@ -261,3 +262,112 @@ def test_two_key_fields_in_aggregate(
         'sum': 11000,
         'count': 2
     }
+
+
+def test_dimension_switch_saves_changed_state_only(identity_aggregate_schema_spec: Dict[str, Any],
+                                                   store_spec: Dict[str, Any],
+                                                   records: List[Record]):
+    # The count is only changed by the events of label 'a'
+    identity_aggregate_schema_spec['Fields'][1]['When'] = 'source.label == \'a\''
+    identity_aggregate_schema_spec['Fields'][0]['When'] = 'source.label == \'a\''
+    identity_aggregate_schema_spec['DimensionCacheSize'] = 1
+    schema = identity_aggregate_schema(identity_aggregate_schema_spec, store_spec)
+    identity = 'user1'
+    evaluation_context = EvaluationContext()
+    evaluation_context.global_add('identity', identity)
+    identity_aggregate = IdentityAggregate(schema, identity, evaluation_context)
+    evaluation_context.global_add(identity_aggregate._schema.name, identity_aggregate)
+    store = identity_aggregate._store
+    store.save(
+        Key(KeyType.DIMENSION, 'user1', 'label_aggr', ['b']), {
+            '_identity': 'user1',
+            'label': 'b',
+            'sum': 7,
+            'count': 3
+        })
+
+    with mock.patch.object(store, 'save', wraps=store.save) as save, mock.patch.object(
+            store, 'update', wraps=store.update) as update:
+        for record in records[:3]:
+            evaluate_event(record, identity_aggregate)
+        identity_aggregate.run_finalize()
+
+    # The restored state of 'b' is unchanged and not written again
+    assert [call[0][0].dimensions for call in update.call_args_list] == [['a']]
+    assert update.call_args[0][2] == ['sum', 'count']
+    assert [call[0][0].dimensions for call in save.call_args_list] == [['a'], ['a']]
+    assert store.get(Key(KeyType.DIMENSION, 'user1', 'label_aggr', ['a'])) == {
+        '_identity': 'user1',
+        'label': 'a',
+        'sum': 110,
+        'count': 2
+    }
+
+
+def test_dimension_states_kept_in_memory(identity_aggregate_schema_spec: Dict[str, Any],
+                                         store_spec: Dict[str, Any], records: List[Record]):
+    schema = identity_aggregate_schema(identity_aggregate_schema_spec, store_spec)
+    identity = 'user1'
+    evaluation_context = EvaluationContext()
+    evaluation_context.global_add('identity', identity)
+    identity_aggregate = IdentityAggregate(schema, identity, evaluation_context)
+    evaluation_context.global_add(identity_aggregate._schema.name, identity_aggregate)
+    store = identity_aggregate._store
+
+    with mock.patch.object(store, 'get', wraps=store.get) as get, mock.patch.object(
+            store, 'save', wraps=store.save) as save:
+        for record in records:
+            evaluate_event(record, identity_aggregate)
+        assert not save.called
+        identity_aggregate.run_finalize()
+
+    # Each dimension is read from the store once and saved on finalize
+    assert [call[0][0].dimensions for call in get.call_args_list] == [['a'], ['b'], ['c']]
+    assert sorted(call[0][0].dimensions[0] for call in save.call_args_list) == ['a', 'b', 'c']
+    assert store.get(Key(KeyType.DIMENSION, 'user1', 'label_aggr', ['a'])) == {
+        '_identity': 'user1',
+        'label': 'a',
+        'sum': 110,
+        'count': 2
+    }
+    assert store.get(Key(KeyType.DIMENSION, 'user1', 'label_aggr', ['c'])) == {
+        '_identity': 'user1',
+        'label': 'c',
+        'sum': 11000,
+        'count': 2
+    }
+
+
+def test_dimension_states_evicted_over_cache_size(identity_aggregate_schema_spec: Dict[str, Any],
+                                                  store_spec: Dict[str, Any],
+                                                  records: List[Record]):
+    identity_aggregate_schema_spec['DimensionCacheSize'] = 2
+    schema = identity_aggregate_schema(identity_aggregate_schema_spec, store_spec)
+    identity = 'user1'
+    evaluation_context = EvaluationContext()
+    evaluation_context.global_add('identity', identity)
+    identity_aggregate = IdentityAggregate(schema, identity, evaluation_context)
+    evaluation_context.global_add(identity_aggregate._schema.name, identity_aggregate)
+
+    for record in records[:4]:
+        evaluate_event(record, identity_aggregate)
+
+    # 'b' is the least recently used state when 'c' is evaluated
+    store_state = identity_aggregate._store.get_all(identity)
+    assert store_state == {
+        Key(KeyType.DIMENSION, 'user1', 'label_aggr', ['b']): {
+            '_identity': 'user1',
+            'label': 'b',
+            'sum': 1,
+            'count': 1
+        }
+    }
+    assert identity_aggregate.sum == 10000
+    assert list(identity_aggregate._dimension_states) == [('a', )]
+
+
+def test_dimension_cache_size_validation(identity_aggregate_schema_spec: Dict[str, Any],
+                                         store_spec: Dict[str, Any]):
+    identity_aggregate_schema_spec['DimensionCacheSize'] = 0
+    schema = identity_aggregate_schema(identity_aggregate_schema_spec, store_spec)
+    assert schema.errors
@@ -1,5 +1,6 @@
 from datetime import datetime, timezone
 from typing import Dict, Any
+from unittest import mock
 
 from pytest import fixture
 
@@ -104,3 +105,50 @@ def test_aggregate_finalize(aggregate_schema_with_store):
         Key(KeyType.DIMENSION, identity="12345", group="user"))
     assert snapshot_aggregate is not None
     assert snapshot_aggregate == aggregate._snapshot
+
+
+def test_aggregate_persist_unchanged_after_restore(aggregate_schema_with_store):
+    aggregate = MockAggregate(
+        schema=aggregate_schema_with_store,
+        identity="12345",
+        evaluation_context=EvaluationContext())
+    aggregate.run_restore({'_identity': '12345', 'event_count': 5})
+
+    with mock.patch.object(aggregate._store, 'save') as save, mock.patch.object(
+            aggregate._store, 'update') as update:
+        aggregate.run_finalize()
+
+    assert not save.called
+    assert not update.called
+
+
+def test_aggregate_persist_changed_fields_after_restore(aggregate_schema_with_store):
+    aggregate = MockAggregate(
+        schema=aggregate_schema_with_store,
+        identity="12345",
+        evaluation_context=EvaluationContext())
+    aggregate.run_restore({'_identity': '12345', 'event_count': 3})
+    aggregate._evaluation_context.global_add('identity', '12345')
+    aggregate.run_evaluate()
+
+    with mock.patch.object(aggregate._store, 'update') as update:
+        aggregate.run_finalize()
+
+    update.assert_called_once_with(
+        Key(KeyType.DIMENSION, identity="12345", group="user"), {
+            '_identity': '12345',
+            'event_count': 5
+        }, ['event_count'])
+
+
+def test_aggregate_persist_after_reset(aggregate_schema_with_store):
+    aggregate = MockAggregate(
+        schema=aggregate_schema_with_store,
+        identity="12345",
+        evaluation_context=EvaluationContext())
+    aggregate.run_restore({'_identity': '12345', 'event_count': 0})
+    aggregate.run_reset()
+    aggregate.run_finalize()
+
+    assert aggregate._store.get(Key(KeyType.DIMENSION, identity="12345",
+                                    group="user")) == aggregate._snapshot
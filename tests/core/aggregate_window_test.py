@@ -1,12 +1,16 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from unittest import mock
 
 import pytest
 from pytest import fixture
 
-from blurr.core.aggregate_window import WindowAggregateSchema, WindowAggregate
+from blurr.core.aggregate_window import (BlockCache, BlockSequence, WindowAggregateSchema,
+                                         WindowAggregate)
 from blurr.core.errors import PrepareWindowMissingBlocksError
-from blurr.core.evaluation import EvaluationContext, Context
+from blurr.core.evaluation import EvaluationContext, Context, Expression
+from blurr.core.loader import TypeLoader
 from blurr.core.schema_loader import SchemaLoader
+from blurr.core.store_key import Key, KeyType
 from blurr.core.type import Type
 
 
@@ -156,3 +160,199 @@ def test_evaluate(window_aggregate):
     window_aggregate._prepare_window(datetime(2018, 3, 7, 21, 36, 31, 0, timezone.utc))
     window_aggregate.run_evaluate()
     assert window_aggregate.total_events == 9
+
+
+def test_block_cache_decodes_each_block_once(
+        window_aggregate_schema: WindowAggregateSchema) -> None:
+    source = window_aggregate_schema.source
+    store = window_aggregate_schema.schema_loader.get_store(
+        source.store_schema.fully_qualified_name)
+    items = [(key, snapshot) for key, snapshot in store.get_all('user1').items()
+             if key.group == source.name]
+    expected = [
+        TypeLoader.load_item(source.type)(source, 'user1', EvaluationContext()).run_restore(
+            snapshot)._snapshot for _, snapshot in items
+    ]
+
+    block_cache = BlockCache(source, 'user1')
+    block_sequence = BlockSequence(source, 'user1', items, block_cache)
+    block = TypeLoader.load_item(source.type)(source, 'user1', EvaluationContext())
+    with mock.patch('blurr.core.field_simple.parser.parse') as parse:
+        for (key, snapshot), expected_snapshot in zip(items, expected):
+            assert block_cache.restore(block, key, snapshot) is block
+            assert block._snapshot == expected_snapshot
+            assert block_cache.get(key, snapshot) in block_sequence.blocks
+        parse.assert_not_called()
+
+
+def test_block_cache_blocks_read_only(schema_loader_with_mem_store: SchemaLoader,
+                                     mem_store_name: str, stream_bts_name: str) -> None:
+    schema_loader_with_mem_store.add_schema_spec({
+        'Type': Type.BLURR_AGGREGATE_BLOCK,
+        'Name': 'session_countries',
+        'Store': mem_store_name,
+        'Fields': [{
+            'Name': 'countries',
+            'Type': Type.MAP,
+            'Value': 'session_countries.countries'
+        }]
+    }, stream_bts_name)
+    window_name = schema_loader_with_mem_store.add_schema_spec({
+        'Type': Type.BLURR_AGGREGATE_WINDOW,
+        'Name': 'test_window_name',
+        'WindowType': Type.COUNT,
+        'WindowValue': 1,
+        'Source': stream_bts_name + '.session_countries',
+        'Fields': [{
+            'Name': 'countries',
+            'Type': Type.MAP,
+            'Value': "source.view[0].countries.increment('US')"
+        }]
+    })
+    source = schema_loader_with_mem_store.get_schema_object(stream_bts_name + '.session_countries')
+    key = Key(source.key_type, 'user1', source.name)
+    snapshot = {
+        '_start_time': datetime(2018, 3, 7, 22, 36, 31, 0, timezone.utc).isoformat(),
+        'countries': {
+            'US': 1
+        }
+    }
+    schema_loader_with_mem_store.get_store(source.store_schema.fully_qualified_name).save(
+        key, snapshot)
+    window_aggregate = WindowAggregate(
+        WindowAggregateSchema(window_name, schema_loader_with_mem_store), 'user1',
+        EvaluationContext(Context({
+            'identity': 'user1'
+        })))
+
+    window_aggregate._prepare_window(datetime(2018, 3, 7, 21, 36, 31, 0, timezone.utc))
+    window_aggregate.run_evaluate()
+
+    # The window expression cannot change the block shared by the windows
+    assert window_aggregate._nested_items['countries'].eval_error
+    block = window_aggregate._block_sequence.blocks[0]
+    assert block.countries == {'US': 1}
+
+    # Blocks restored from the shared block can be changed
+    restored = BlockCache(source, 'user1').restore(
+        TypeLoader.load_item(source.type)(source, 'user1', EvaluationContext()), key, snapshot)
+    assert restored.countries.increment('US') == {'US': 2}
+
+
+def test_block_sequence_same_as_store_range(window_aggregate_schema: WindowAggregateSchema) -> None:
+    source = window_aggregate_schema.source
+    store = window_aggregate_schema.schema_loader.get_store(
+        source.store_schema.fully_qualified_name)
+    block_sequence = BlockSequence(source, 'user1', store.get_all('user1').items())
+    base_key = Key(source.key_type, 'user1', source.name)
+
+    assert len(block_sequence) == 6
+    for start_time in [
+            datetime(2018, 3, 7, 19, 35, 31, 0, timezone.utc),
+            datetime(2018, 3, 7, 21, 0, 0, 0, timezone.utc),
+            datetime(2018, 3, 7, 21, 36, 31, 0, timezone.utc)
+    ]:
+        for end_time, count in [(start_time + timedelta(days=1), 0),
+                                (start_time - timedelta(hours=2), 0), (None, 2), (None, -2),
+                                (None, 20), (None, -20)]:
+            assert [block.events for block in block_sequence.get_range(
+                start_time, end_time, count)] == [
+                    block['events']
+                    for _, block in store.get_range(base_key, start_time, end_time, count)
+                ]
+
+
+def test_prepare_window_reads_store_once(window_aggregate: WindowAggregate) -> None:
+    store = window_aggregate._schema.schema_loader.get_store(
+        window_aggregate._schema.source.store_schema.fully_qualified_name)
+    with mock.patch.object(store, 'iterate_all', wraps=store.iterate_all) as iterate_all, \
+            mock.patch.object(store, 'iterate_range') as iterate_range:
+        window_aggregate._prepare_window(datetime(2018, 3, 7, 21, 36, 31, 0, timezone.utc))
+        assert window_aggregate._window_source.events == [4, 5]
+        window_aggregate._prepare_window(datetime(2018, 3, 7, 19, 35, 31, 0, timezone.utc))
+        assert window_aggregate._window_source.events == [2, 3, 4, 5]
+
+    iterate_all.assert_called_once_with('user1')
+    assert not iterate_range.called
+
+
+def test_prepare_window_after_reset_reads_store_again(window_aggregate: WindowAggregate) -> None:
+    source = window_aggregate._schema.source
+    store = window_aggregate._schema.schema_loader.get_store(
+        source.store_schema.fully_qualified_name)
+    window_aggregate._prepare_window(datetime(2018, 3, 7, 21, 36, 31, 0, timezone.utc))
+    assert window_aggregate._window_source.events == [4, 5]
+
+    date = datetime(2018, 3, 7, 23, 0, 0, 0, timezone.utc)
+    if source.key_type == KeyType.TIMESTAMP:
+        key = Key(source.key_type, 'user1', source.name, [], date)
+    else:
+        key = Key(source.key_type, 'user1', source.name, ['dimA', 'session7'])
+    store.save(key, {'events': 7, '_start_time': date.isoformat()})
+    window_aggregate.run_reset()
+    window_aggregate._prepare_window(datetime(2018, 3, 7, 21, 36, 31, 0, timezone.utc))
+    assert window_aggregate._window_source.events == [4, 7, 5]
+
+
+def test_evaluate_reductions_over_block_sequence(window_aggregate: WindowAggregate) -> None:
+    window_aggregate._schema.window_type = Type.DAY
+    window_aggregate._schema.window_value = 1
+    for start_time, total_events in [(datetime(2018, 3, 7, 21, 36, 31, 0, timezone.utc), 9),
+                                     (datetime(2018, 3, 7, 19, 35, 31, 0, timezone.utc), 14)]:
+        window_aggregate.run_reset()
+        window_aggregate._prepare_window(start_time)
+        window_aggregate.run_evaluate()
+        assert window_aggregate.total_events == total_events
+
+    # The sum is computed from the column of the events of all the blocks
+    assert list(window_aggregate._block_sequence._column_reductions) == ['events']
+
+
+def test_vectorized_window_source(window_aggregate_schema: WindowAggregateSchema) -> None:
+    numpy = pytest.importorskip('numpy')
+    window_aggregate_schema.vectorized = True
+    window_aggregate_schema.nested_schema['total_events'].value = Expression(
+        'int(source.events[source.events > 3].sum())')
+    window_aggregate = WindowAggregate(window_aggregate_schema, 'user1',
+                                       EvaluationContext(Context({
+                                           'identity': 'user1'
+                                       })))
+    window_aggregate._prepare_window(datetime(2018, 3, 7, 19, 35, 31, 0, timezone.utc))
+    events = window_aggregate._window_source.events
+    assert isinstance(events, numpy.ndarray)
+    assert events.dtype == 'int64'
+    assert events.tolist() == [2, 3, 4, 5]
+    assert (events > 3).sum() == 2
+
+    # Windows are read-only views of the array of all the blocks
+    assert events.base is window_aggregate._block_sequence.get_array('events')
+    with pytest.raises(ValueError):
+        events[0] = 0
+
+    window_aggregate.run_evaluate()
+    assert window_aggregate.total_events == 9
+
+
+def test_block_sequence_batch_ranges_same_as_ranges(
+        window_aggregate_schema: WindowAggregateSchema) -> None:
+    pytest.importorskip('numpy')
+    source = window_aggregate_schema.source
+    store = window_aggregate_schema.schema_loader.get_store(
+        source.store_schema.fully_qualified_name)
+    block_sequence = BlockSequence(source, 'user1', store.get_all('user1').items())
+
+    start_times = [
+        datetime(2018, 3, 7, 19, 35, 31, 0, timezone.utc) + timedelta(minutes=17 * i)
+        for i in range(-10, 150)
+    ]
+    for end_delta, count in [(timedelta(days=1), 0), (timedelta(hours=-2), 0), (None, 2),
+                             (None, -2), (None, 20), (None, -20)]:
+        end_times = None if end_delta is None else [
+            start_time + end_delta for start_time in start_times
+        ]
+        lows, highs = block_sequence.get_range_indexes_batch(start_times, end_times, count)
+        assert list(zip(lows.tolist(), highs.tolist())) == [
+            block_sequence.get_range_indexes(start_time, None if end_delta is None else
+                                             start_time + end_delta, count)
+            for start_time in start_times
+        ]
@@ -0,0 +1,94 @@
+from typing import Dict, Any
+
+from pytest import fixture
+
+from blurr.core.dependency import ExpressionDependencies
+from blurr.core.schema_loader import SchemaLoader
+from blurr.core.type import Type
+
+
+@fixture
+def schema_spec() -> Dict[str, Any]:
+    return {
+        'Name': 'test',
+        'Type': Type.BLURR_TRANSFORM_STREAMING,
+        'Version': '2018-03-01',
+        'Import': [{
+            'Module': 'dateutil.parser',
+            'Identifiers': ['parse']
+        }],
+        'Identity': 'source.user_id',
+        'Time': 'parse(source[\'event_time\'])',
+        'Stores': [{
+            'Name': 'memstore',
+            'Type': Type.BLURR_STORE_MEMORY
+        }],
+        'Aggregates': [{
+            'Name': 'vars',
+            'Type': Type.BLURR_AGGREGATE_VARIABLE,
+            'Fields': [{
+                'Name': 'country',
+                'Type': Type.STRING,
+                'Value': 'source.country'
+            }]
+        }, {
+            'Name': 'session',
+            'Type': Type.BLURR_AGGREGATE_ACTIVITY,
+            'SeparateByInactiveSeconds': 1800,
+            'Store': 'memstore',
+            'When': 'source.event_id != \'ignored\'',
+            'Fields': [{
+                'Name': 'events',
+                'Type': Type.INTEGER,
+                'Value': 'session.events + 1'
+            }, {
+                'Name': 'country',
+                'Type': Type.STRING,
+                'When': 'source.event_id == \'country\'',
+                'Value': 'vars[\'country\'] + source.region.name'
+            }]
+        }]
+    }
+
+
+def test_expression_dependencies_source_attributes() -> None:
+    dependencies = ExpressionDependencies(
+        'source.a + source[\'b\'] if source.c.d else session.events')
+    assert dependencies.source_attributes == {'a', 'b', 'c'}
+    assert not dependencies.reads_source
+    assert dependencies.names == {'source', 'session'}
+    assert dependencies.attributes == {('source', 'a'), ('source', 'b'), ('source', 'c'),
+                                       ('session', 'events')}
+
+
+def test_expression_dependencies_reads_source() -> None:
+    assert ExpressionDependencies('len(source)').reads_source
+    assert ExpressionDependencies('source.get(\'a\')').reads_source
+    assert ExpressionDependencies('source[key]').reads_source
+    assert ExpressionDependencies('[source.a for source in items]').reads_source
+    assert not ExpressionDependencies('[item.a for item in source.products]').reads_source
+
+
+def test_dependency_graph(schema_spec: Dict[str, Any]) -> None:
+    schema_loader = SchemaLoader()
+    name = schema_loader.add_schema_spec(schema_spec)
+    graph = schema_loader.get_dependency_graph(name)
+
+    assert graph.source_dependencies['test'] == {'user_id', 'event_time'}
+    assert graph.source_dependencies['test.session'] == {'event_id'}
+    assert graph.source_dependencies['test.session.country'] == {'event_id', 'region'}
+    assert graph.field_dependencies['test.session.country'] == {'test.vars.country'}
+    assert graph.field_dependencies['test.session.events'] == {'test.session.events'}
+    assert graph.field_dependencies['test.session._start_time'] == {'test.session._start_time'}
+    assert graph.source_projection == {'user_id', 'event_time', 'event_id', 'region', 'country'}
+    assert graph.unprojectable_elements == set()
+
+
+def test_dependency_graph_reads_source(schema_spec: Dict[str, Any]) -> None:
+    schema_spec['Aggregates'][0]['Fields'][0]['Value'] = 'str(source)'
+    schema_loader = SchemaLoader()
+    name = schema_loader.add_schema_spec(schema_spec)
+    graph = schema_loader.get_dependency_graph(name)
+
+    assert graph.source_projection is None
+    assert graph.unprojectable_elements == {'test.vars.country'}
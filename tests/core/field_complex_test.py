@@ -1,12 +1,12 @@
 from typing import Dict, Any
 
-from pytest import fixture
+from pytest import fixture, raises
 
 from blurr.core.aggregate import Aggregate, AggregateSchema
 from blurr.core.aggregate_variable import VariableAggregate, \
     VariableAggregateSchema
 from blurr.core.evaluation import EvaluationContext
-from blurr.core.field_complex import Map, List, Set
+from blurr.core.field_complex import Map, List, Set, read_only
 from blurr.core.schema_loader import SchemaLoader
 from blurr.core.type import Type
 
@@ -63,6 +63,25 @@ def test_set_add() -> None:
     assert sample.add(None) == sample
 
 
+def test_read_only() -> None:
+    sample = Map({'key': List([1])})
+    read_only_sample = read_only(sample)
+
+    assert read_only_sample == sample
+    assert read_only_sample is not sample
+    assert isinstance(read_only_sample, Map)
+    with raises(TypeError, match='ReadOnlyMap is read-only'):
+        read_only_sample.set('key', 'value')
+    with raises(TypeError, match='ReadOnlyMap is read-only'):
+        read_only_sample['key'] = 'value'
+    with raises(TypeError, match='ReadOnlyList is read-only'):
+        read_only(List([1])).append(2)
+    with raises(TypeError, match='ReadOnlySet is read-only'):
+        read_only(Set([1])).add(2)
+    assert Map(read_only_sample).set('key', 'value')['key'] == 'value'
+    assert read_only(1) == 1
+
+
 # Test the Complex object evaluation
 
 
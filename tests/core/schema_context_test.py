@@ -1,3 +1,5 @@
+from unittest import mock
+
 import pytest
 
 from blurr.core.schema_context import SchemaContext
@@ -85,3 +87,23 @@ def test_import_module_and_identifier_error():
     schema_context = SchemaContext(spec)
     with pytest.raises(ImportError, match='cannot import name \'unknown_func\''):
         assert schema_context.context
+
+
+def test_import_executed_once():
+    spec = [{'Module': 'dateutil', 'Identifiers': ['parser']}]
+    schema_context = SchemaContext(spec)
+    import_statement = schema_context.import_statements[0]
+    with mock.patch.object(
+            import_statement, 'evaluate', wraps=import_statement.evaluate) as evaluate:
+        first_context = schema_context.context
+        second_context = schema_context.context
+
+    assert evaluate.call_count == 1
+
+    from dateutil import parser
+    assert second_context.global_context['parser'] == parser
+
+    # Each call returns a separate context so changes to one do not leak into the other.
+    first_context.global_add('identity', 'user1')
+    assert 'identity' not in second_context.global_context
+    assert 'identity' not in schema_context.context.global_context
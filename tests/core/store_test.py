@@ -141,3 +141,51 @@ def test_get_range_start_end_time_no_dimensions_match(memory_store: MemoryStore)
 
 def test_get_all(memory_store: MemoryStore) -> None:
     assert len(memory_store.get_all('user1')) == 13
+
+
+def test_get_all_unknown_identity(memory_store: MemoryStore) -> None:
+    assert memory_store.get_all('unknown_user') == {}
+
+
+def test_get_range_after_delete(memory_store: MemoryStore) -> None:
+    key = Key(KeyType.TIMESTAMP, 'user1', 'session')
+    start = datetime(2018, 3, 7, 19, 35, 31, 0, timezone.utc)
+    end = datetime(2018, 3, 7, 22, 38, 31, 0, timezone.utc)
+    memory_store.delete(
+        Key(KeyType.TIMESTAMP, 'user1', 'session', [],
+            datetime(2018, 3, 7, 20, 35, 35, 0, timezone.utc)))
+
+    blocks = memory_store.get_range(key, start, end)
+    assert len(blocks) == 1
+    assert len(memory_store.get_all('user1')) == 12
+
+
+def test_get_range_dimension_key_after_start_time_update(memory_store: MemoryStore) -> None:
+    key = Key(KeyType.DIMENSION, 'user1', 'session_dim', ['dimA', 'session1'])
+    start_time = datetime(2018, 3, 7, 23, 35, 31, 0, timezone.utc)
+    memory_store.save(key, {'events': 5, '_start_time': start_time.isoformat()})
+
+    blocks = memory_store.get_range(
+        Key(KeyType.DIMENSION, 'user1', 'session_dim'),
+        datetime(2018, 3, 7, 22, 38, 31, 0, timezone.utc), None, 5)
+    assert blocks[0] == (key, {'events': 5, '_start_time': start_time.isoformat()})
+    assert len([k for k, _ in blocks if k == key]) == 1
+
+
+@mark.parametrize('key, count', [(Key(KeyType.TIMESTAMP, 'user1', 'session'), 0),
+                                 (Key(KeyType.TIMESTAMP, 'user1', 'session'), 2),
+                                 (Key(KeyType.TIMESTAMP, 'user1', 'session'), -2),
+                                 (Key(KeyType.DIMENSION, 'user1', 'session_dim'), 0),
+                                 (Key(KeyType.DIMENSION, 'user1', 'session_dim', ['dimA']), 2),
+                                 (Key(KeyType.DIMENSION, 'user1', 'session_dim'), -2)])
+def test_iterate_range_same_as_get_range(memory_store: MemoryStore, key: Key, count: int) -> None:
+    start_time = datetime(2018, 3, 7, 20, 0, 0, 0, timezone.utc)
+    end_time = None if count else datetime(2018, 3, 8, 0, 0, 0, 0, timezone.utc)
+    blocks = memory_store.iterate_range(key, start_time, end_time, count)
+
+    assert not isinstance(blocks, list)
+    assert list(blocks) == memory_store.get_range(key, start_time, end_time, count)
+
+
+def test_iterate_all(memory_store: MemoryStore) -> None:
+    assert dict(memory_store.iterate_all('user1')) == memory_store.get_all('user1')
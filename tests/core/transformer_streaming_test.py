@@ -1,5 +1,6 @@
 from datetime import datetime
 from typing import Dict, Any
+from unittest import mock
 
 import pytest
 from pytest import fixture
@@ -174,3 +175,19 @@ def test_streaming_transformer_schema_missing_attributes_adds_error(schema_loade
                                   StreamingTransformerSchema.ATTRIBUTE_TIME) in schema.errors
     assert RequiredAttributeError(streaming_bts, schema_spec,
                                   StreamingTransformerSchema.ATTRIBUTE_STORES) in schema.errors
+
+
+def test_streaming_transformer_evaluate_trusted(schema_loader: SchemaLoader,
+                                                schema_spec: Dict[str, Any]) -> None:
+    streaming_bts = schema_loader.add_schema_spec(schema_spec)
+    transformer_schema = StreamingTransformerSchema(streaming_bts, schema_loader)
+    transformer = StreamingTransformer(transformer_schema, 'user1')
+    with mock.patch.object(transformer_schema.identity, 'evaluate') as identity_evaluate, \
+            mock.patch.object(transformer_schema.time, 'evaluate') as time_evaluate:
+        transformer.run_evaluate_trusted(Record(), datetime(2016, 10, 10))
+
+    identity_evaluate.assert_not_called()
+    time_evaluate.assert_not_called()
+    assert transformer._snapshot == {'test_group': {'_identity': 'user1', 'events': 1}}
+    assert 'source' not in transformer._evaluation_context.global_context
+    assert 'time' not in transformer._evaluation_context.global_context
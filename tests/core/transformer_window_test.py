@@ -132,6 +132,62 @@ def test_window_transformer(schema_loader, window_transformer, time_aggregate):
     }
 
 
+def test_window_transformer_flattened_row(schema_loader, window_transformer, time_aggregate):
+    init_memory_store(schema_loader.get_store('Sessions.memory'))
+    time_aggregate.run_restore({
+        'events': 3,
+        '_start_time': datetime(2018, 3, 7, 21, 36, 31, 0, timezone.utc).isoformat(),
+        '_end_time': datetime(2018, 3, 7, 21, 37, 31, 0, timezone.utc).isoformat()
+    })
+
+    assert window_transformer.run_evaluate(time_aggregate) is True
+
+    assert window_transformer.run_flattened_columns == [
+        'last_session._identity', 'last_session.events', 'last_day._identity',
+        'last_day.total_events'
+    ]
+    assert window_transformer.run_flattened_row == ('user1', 2, 'user1', 3)
+    assert list(window_transformer.run_flattened_snapshot.items()) == list(
+        zip(window_transformer.run_flattened_columns, window_transformer.run_flattened_row))
+
+
+def test_window_transformer_flattened_map_field(schema_loader, stream_transformer,
+                                                window_schema_spec, time_aggregate):
+    window_schema_spec['Aggregates'][0]['Fields'].append({
+        'Name': 'countries',
+        'Type': Type.MAP,
+        'Value': "last_session.countries.set('US', source.events[0])"
+    })
+    window_bts_name = schema_loader.add_schema_spec(window_schema_spec)
+    init_memory_store(schema_loader.get_store('Sessions.memory'))
+    window_transformer = WindowTransformer(
+        schema_loader.get_schema_object(window_bts_name), 'user1',
+        Context({
+            stream_transformer._schema.name: stream_transformer
+        }))
+    time_aggregate.run_restore({
+        'events': 3,
+        '_start_time': datetime(2018, 3, 7, 21, 36, 31, 0, timezone.utc).isoformat(),
+        '_end_time': datetime(2018, 3, 7, 21, 37, 31, 0, timezone.utc).isoformat()
+    })
+
+    assert window_transformer._schema.flattened_columns is None
+    assert window_transformer.run_evaluate(time_aggregate) is True
+
+    # The columns of map fields are the keys of the map
+    assert window_transformer.run_flattened_snapshot == {
+        'last_session._identity': 'user1',
+        'last_session.events': 2,
+        'countries.US': 2,
+        'last_day._identity': 'user1',
+        'last_day.total_events': 3
+    }
+    assert window_transformer.run_flattened_columns == list(
+        window_transformer.run_flattened_snapshot)
+    assert window_transformer.run_flattened_row == tuple(
+        window_transformer.run_flattened_snapshot.values())
+
+
 def test_window_transformer_internal_reset(schema_loader, window_transformer, time_aggregate):
     init_memory_store(schema_loader.get_store('Sessions.memory'))
     window_transformer._anchor._schema.max = None
@@ -163,3 +219,132 @@ def test_window_transformer_schema_missing_attributes_adds_error(schema_loader,
     assert 1 == len(schema.errors)
     assert isinstance(schema.errors[0], RequiredAttributeError)
     assert WindowTransformerSchema.ATTRIBUTE_ANCHOR == schema.errors[0].attribute
+
+
+def test_window_aggregates_with_same_window_key_share_window(schema_loader, stream_transformer,
+                                                            window_schema_spec, time_aggregate):
+    window_schema_spec['Aggregates'].append({
+        'Type': Type.BLURR_AGGREGATE_WINDOW,
+        'Name': 'previous_session',
+        'WindowType': 'Count',
+        'WindowValue': -1,
+        'Source': 'Sessions.session',
+        'Fields': [{
+            'Name': 'events',
+            'Type': Type.INTEGER,
+            'Value': 'sum(source.events)'
+        }]
+    })
+    window_bts_name = schema_loader.add_schema_spec(window_schema_spec)
+    init_memory_store(schema_loader.get_store('Sessions.memory'))
+    window_transformer = WindowTransformer(
+        schema_loader.get_schema_object(window_bts_name), 'user1',
+        Context({
+            stream_transformer._schema.name: stream_transformer
+        }))
+    time_aggregate.run_restore({
+        'events': 3,
+        '_start_time': datetime(2018, 3, 7, 21, 36, 31, 0, timezone.utc).isoformat(),
+        '_end_time': datetime(2018, 3, 7, 21, 37, 31, 0, timezone.utc).isoformat()
+    })
+
+    assert window_transformer.run_evaluate(time_aggregate) is True
+
+    aggregates = window_transformer._nested_items
+    assert aggregates['previous_session']._window_source is aggregates[
+        'last_session']._window_source
+    assert aggregates['last_day']._window_source is not aggregates['last_session']._window_source
+    assert window_transformer._snapshot['previous_session'] == {
+        '_identity': 'user1',
+        'events': 2
+    }
+
+
+@pytest.mark.parametrize('anchor_max', [1, None])
+def test_evaluate_batch_same_as_evaluate(schema_loader, stream_transformer, window_schema_spec,
+                                         time_aggregate, anchor_max):
+    pytest.importorskip('numpy')
+    window_schema_spec['Anchor']['Max'] = anchor_max
+    window_schema_spec['Aggregates'].append({
+        'Type': Type.BLURR_AGGREGATE_WINDOW,
+        'Name': 'next_sessions',
+        'WindowType': Type.COUNT,
+        'WindowValue': 2,
+        'Source': 'Sessions.session',
+        'Fields': [{
+            'Name': 'total_events',
+            'Type': Type.INTEGER,
+            'Value': 'sum(source.events)'
+        }, {
+            'Name': 'max_events',
+            'Type': Type.INTEGER,
+            'Value': 'max(source.events)'
+        }]
+    })
+    window_schema_spec['Aggregates'].append({
+        'Type': Type.BLURR_AGGREGATE_WINDOW,
+        'Name': 'next_sessions_events',
+        'WindowType': 'Count',
+        'WindowValue': 2,
+        'Source': 'Sessions.session',
+        'Fields': [{
+            'Name': 'events',
+            'Type': Type.LIST,
+            'Value': 'source.events'
+        }]
+    })
+    window_bts_name = schema_loader.add_schema_spec(window_schema_spec)
+    store = schema_loader.get_store('Sessions.memory')
+    init_memory_store(store)
+    items = [(key, block) for key, block in store.get_all('user1').items()
+             if key.group == 'session']
+
+    def get_window_transformer():
+        return WindowTransformer(
+            schema_loader.get_schema_object(window_bts_name), 'user1',
+            Context({
+                stream_transformer._schema.name: stream_transformer
+            }))
+
+    window_transformer = get_window_transformer()
+    expected = []
+    for _, block in items:
+        try:
+            if window_transformer.run_evaluate(time_aggregate.run_restore(block)):
+                expected.append(window_transformer.run_flattened_snapshot)
+        except PrepareWindowMissingBlocksError:
+            pass
+
+    columns, rows = get_window_transformer().run_evaluate_batch(time_aggregate, items)
+    assert len(expected) == (1 if anchor_max else 3)
+    assert [dict(zip(row_columns, row)) for row_columns, row in zip(columns, rows)] == expected
+
+
+def test_evaluate_batch_map_field_columns(schema_loader, stream_transformer, window_schema_spec,
+                                          time_aggregate):
+    pytest.importorskip('numpy')
+    window_schema_spec['Anchor']['Max'] = None
+    window_schema_spec['Aggregates'][0]['Fields'].append({
+        'Name': 'events_by_count',
+        'Type': Type.MAP,
+        'Value': "last_session.events_by_count.set(str(source.events[0]), 1)"
+    })
+    window_bts_name = schema_loader.add_schema_spec(window_schema_spec)
+    store = schema_loader.get_store('Sessions.memory')
+    init_memory_store(store)
+    items = [(key, block) for key, block in store.get_all('user1').items()
+             if key.group == 'session']
+    window_transformer = WindowTransformer(
+        schema_loader.get_schema_object(window_bts_name), 'user1',
+        Context({
+            stream_transformer._schema.name: stream_transformer
+        }))
+
+    columns, rows = window_transformer.run_evaluate_batch(time_aggregate, items)
+
+    # The keys of the map differ for each anchor, and so do the columns
+    assert len(rows) == 4
+    for row_columns, row in zip(columns, rows):
+        row = dict(zip(row_columns, row))
+        assert row['events_by_count.' + str(row['last_session.events'])] == 1
+        assert len(row_columns) == 5
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import pytest
+
+from blurr.core import window_array
+from blurr.core.type import Type
+from blurr.core.window_array import get_array, require_numpy
+
+
+@pytest.mark.skipif(window_array.numpy is not None, reason='numpy is installed')
+def test_require_numpy_not_installed() -> None:
+    with pytest.raises(ImportError):
+        require_numpy()
+    with pytest.raises(ImportError):
+        get_array([1, 2], Type.INTEGER)
+
+
+@pytest.mark.parametrize('values, field_type, dtype', [
+    ([1, 2, 3], Type.INTEGER, 'int64'),
+    ([1, 2, 3], 'Integer', 'int64'),
+    ([1, 2.5, 3], Type.FLOAT, 'float64'),
+    ([True, False], Type.BOOLEAN, 'bool'),
+    ([1, 2.5, 3], Type.INTEGER, 'object'),
+    ([1, True], Type.INTEGER, 'object'),
+    ([2**70, 1], Type.INTEGER, 'object'),
+    (['a', 'b'], Type.STRING, 'object'),
+    ([1, 2], None, 'object'),
+    ([], Type.INTEGER, 'int64'),
+])
+def test_get_array_type(values, field_type, dtype) -> None:
+    pytest.importorskip('numpy')
+    array = get_array(values, field_type)
+    assert array.dtype == dtype
+    assert array.tolist() == values
+
+
+def test_get_array_keeps_values() -> None:
+    pytest.importorskip('numpy')
+    values = [[1, 2], [3, 4], (5, 6), {'a': 1}, datetime(2018, 1, 1)]
+    array = get_array(values, Type.LIST)
+    assert array.shape == (5, )
+    assert list(array) == values
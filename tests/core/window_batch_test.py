@@ -0,0 +1,99 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import yaml
+
+from blurr.core.evaluation import Context, EvaluationContext, Expression
+from blurr.core.schema_loader import SchemaLoader
+from blurr.core.store_key import Key, KeyType
+from blurr.core.transformer_streaming import StreamingTransformer
+from blurr.core.window_batch import get_batch_condition
+
+rng = random.Random(11)
+
+
+@pytest.fixture
+def stream_transformer() -> StreamingTransformer:
+    schema_loader = SchemaLoader()
+    stream_bts_name = schema_loader.add_schema_spec(yaml.safe_load(open('tests/data/stream.yml')))
+    stream_transformer = StreamingTransformer(
+        schema_loader.get_schema_object(stream_bts_name), 'user1')
+    stream_transformer.run_restore({Key(KeyType.DIMENSION, 'user1', 'state'): {'country': 'US'}})
+    return stream_transformer
+
+
+def get_snapshots():
+    start_time = datetime(2018, 3, 7, 19, 35, 31, 0, timezone.utc)
+    return [{
+        'events': rng.randint(0, 4),
+        'country': rng.choice(['US', 'CA', '']),
+        'continent': rng.choice(['North America', '']),
+        '_start_time': (start_time + timedelta(hours=i)).isoformat(),
+        '_end_time': (start_time + timedelta(hours=i, minutes=5)).isoformat(),
+    } for i in range(40)]
+
+
+@pytest.mark.parametrize('code_string', [
+    'Sessions.session.events > 1 and Sessions.state.country != \'\'',
+    'not Sessions.session.events >= 2 or Sessions.session.country == \'US\'',
+    '1 < Sessions.session.events <= 3',
+    'Sessions.session.continent',
+    'Sessions.session.events == 2 and identity == \'user1\'',
+    'Sessions.state.country == \'CA\'',
+    'True',
+])
+def test_batch_condition_same_as_evaluated_per_block(stream_transformer, code_string) -> None:
+    pytest.importorskip('numpy')
+    condition = Expression(code_string)
+    batch_condition = get_batch_condition(condition)
+    block = stream_transformer.session
+    evaluation_context = EvaluationContext(
+        Context({
+            'identity': 'user1',
+            stream_transformer._schema.name: stream_transformer
+        }))
+    snapshots = get_snapshots()
+
+    columns = {name: [] for name in block._schema.nested_schema}
+    expected = []
+    for snapshot in snapshots:
+        block.run_restore(snapshot)
+        for name, values in columns.items():
+            values.append(getattr(block, name))
+        expected.append(bool(condition.evaluate(evaluation_context)))
+
+    assert batch_condition.evaluate_blocks(evaluation_context, block, columns) == expected
+
+
+@pytest.mark.parametrize('code_string', [
+    'len(Sessions.session.country) > 0',
+    'Sessions.session.events + 1 > 2',
+    'Sessions.session.events in [1, 2]',
+    'Sessions[\'session\'].events > 2',
+    'Sessions.session.events.real > 2',
+])
+def test_batch_condition_not_supported(code_string) -> None:
+    assert get_batch_condition(Expression(code_string)) is None
+
+
+@pytest.mark.parametrize('code_string', [
+    'Sessions.session.country > 1',
+    'Sessions.session > 1',
+    'Sessions.session.events < \'a\'',
+])
+def test_batch_condition_not_evaluated_element_wise(stream_transformer, code_string) -> None:
+    pytest.importorskip('numpy')
+    block = stream_transformer.session
+    evaluation_context = EvaluationContext(
+        Context({
+            stream_transformer._schema.name: stream_transformer
+        }))
+    columns = {name: [] for name in block._schema.nested_schema}
+    for snapshot in get_snapshots():
+        block.run_restore(snapshot)
+        for name, values in columns.items():
+            values.append(getattr(block, name))
+
+    assert get_batch_condition(Expression(code_string)).evaluate_blocks(
+        evaluation_context, block, columns) is None
@@ -0,0 +1,127 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from blurr.core.evaluation import Context, EvaluationContext, Expression
+from blurr.core.window_reduction import ColumnReductions, get_window_expression, \
+    ReductionExpression
+
+rng = random.Random(7)
+
+
+class MockWindowSource:
+    def __init__(self, values):
+        self.values = values
+        self.reduced = []
+
+    def _reduce(self, function, attribute):
+        self.reduced.append((function, attribute))
+        return function(getattr(self, attribute))
+
+
+def evaluate(expression: Expression, source: MockWindowSource, **names):
+    return expression.evaluate(
+        EvaluationContext(Context(names), Context({
+            'source': source
+        })))
+
+
+def test_reductions_replaced():
+    expression = get_window_expression(
+        Expression('sum(source.values) / len(source.values) + max(source.values)'))
+    source = MockWindowSource([1, 2, 6])
+
+    assert isinstance(expression, ReductionExpression)
+    assert evaluate(expression, source) == 9
+    assert source.reduced == [(sum, 'values'), (len, 'values'), (max, 'values')]
+
+
+@pytest.mark.parametrize('code_string', [
+    'source.values[0]',
+    'sum(source.values, 10)',
+    'sorted(source.values)',
+    'sum([value for value in source.values])',
+    'sum(source for source in [1, 2])',
+])
+def test_expressions_without_reductions_unchanged(code_string):
+    expression = Expression(code_string)
+    assert get_window_expression(expression) is expression
+
+
+def test_shadowed_reduction_evaluated_as_before():
+    expression = get_window_expression(Expression('sum(source.values)'))
+    source = MockWindowSource([1, 2, 6])
+
+    assert evaluate(expression, source, sum=lambda values: 'custom') == 'custom'
+
+
+def test_reduction_error_reports_original_expression():
+    expression = get_window_expression(Expression('sum(source.values)'))
+    assert expression.code_string == 'sum(source.values)'
+    assert evaluate(expression, MockWindowSource(['a', 1])) is None
+
+
+@pytest.mark.parametrize('values', [
+    [rng.randint(-5, 5) for _ in range(50)],
+    [rng.random() for _ in range(50)],
+    [rng.choice([True, False]) for _ in range(50)],
+    [rng.choice([0, 1, 1.0, True, 2, 2.0]) for _ in range(50)],
+    [rng.choice(['a', 'b', '']) for _ in range(50)],
+    [datetime(2018, 1, 1) + timedelta(hours=rng.randint(0, 100)) for _ in range(50)],
+    [rng.choice([1, 'a', None]) for _ in range(50)],
+    [rng.choice([float('nan'), 1.0, 2.0]) for _ in range(50)],
+    [rng.choice([{1}, {2}, {1, 2}, set()]) for _ in range(50)],
+])
+@pytest.mark.parametrize('function', [sum, len, min, max, any, all])
+def test_column_reductions_same_as_builtins(values, function):
+    reductions = ColumnReductions(values)
+    for low in range(len(values) + 1):
+        for high in range(low, len(values) + 1):
+            try:
+                expected = function(values[low:high])
+            except Exception as err:
+                with pytest.raises(type(err)):
+                    reductions.reduce(function, low, high)
+                continue
+
+            result = reductions.reduce(function, low, high)
+            if expected != expected:
+                assert result != result
+            else:
+                assert result == expected
+                assert type(result) is type(expected)
+
+
+@pytest.mark.parametrize('values', [
+    [rng.randint(-5, 5) for _ in range(40)],
+    [rng.random() for _ in range(40)],
+    [rng.choice([0, 1, 1.0, True, 2, 2.0]) for _ in range(40)],
+    [datetime(2018, 1, 1) + timedelta(hours=rng.randint(0, 100)) for _ in range(40)],
+    [rng.choice([1, 'a', None]) for _ in range(40)],
+    [2**70 + rng.randint(0, 5) for _ in range(40)],
+])
+@pytest.mark.parametrize('function', [sum, len, min, max, any, all, sorted])
+def test_column_reductions_batch_same_as_reduce(values, function):
+    numpy = pytest.importorskip('numpy')
+    reductions = ColumnReductions(values)
+    ranges = [(low, high) for low in range(len(values) + 1) for high in range(len(values) + 1)]
+    lows = numpy.array([low for low, _ in ranges])
+    highs = numpy.array([high for _, high in ranges])
+
+    results = reductions.reduce_batch(function, lows, highs)
+    if function is sorted:
+        assert results is None
+        return
+    if results is None:
+        # Only the reductions that are not computed incrementally are not computed in batches
+        assert function in (sum, min, max)
+        return
+
+    for (low, high), result in zip(ranges, results):
+        if low >= high:
+            assert result is None
+            continue
+        expected = reductions.reduce(function, low, high)
+        assert result == expected
+        assert type(result) is type(expected)
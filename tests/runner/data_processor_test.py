@@ -9,6 +9,15 @@ def test_simple_json_processor_success():
     assert data_processor.process_data('{"test": 1}') == [Record({'test': 1})]
 
 
+def test_simple_json_processor_projection():
+    data_processor = SimpleJsonDataProcessor(['test', 'missing'])
+    assert data_processor.process_data('{"test": 1, "payload": {"large": [1, 2, 3]}}') == [
+        Record({
+            'test': 1
+        })
+    ]
+
+
 def test_simple_json_processor_invalid_json_error():
     data_processor = SimpleJsonDataProcessor()
     with pytest.raises(Exception):
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+
+from pytest import raises
+
+from blurr.core.record import Record
+from blurr.runner.external_sort import ExternalSorter
+
+
+def time(minute: int) -> datetime:
+    return datetime(2018, 3, 7, 22, minute, tzinfo=timezone.utc)
+
+
+def add_records(sorter: ExternalSorter) -> None:
+    sorter.add('userB', (time(3), Record({'id': 1})))
+    sorter.add('userA', (time(2), Record({'id': 2})))
+    sorter.add('userB', (time(1), Record({'id': 3})))
+    sorter.add('userA', (time(2), Record({'id': 4})))
+    sorter.add('userC', (time(5), Record({'id': 5})))
+    sorter.add('userA', (time(1), Record({'id': 6})))
+
+
+def collect(sorter: ExternalSorter):
+    return [(identity, [(time, record['id']) for time, record in records])
+            for identity, records in sorter.get_identity_records()]
+
+
+EXPECTED = [
+    ('userA', [(time(1), 6), (time(2), 2), (time(2), 4)]),
+    ('userB', [(time(1), 3), (time(3), 1)]),
+    ('userC', [(time(5), 5)]),
+]
+
+
+def test_sort_in_memory():
+    sorter = ExternalSorter(1024 * 1024)
+    add_records(sorter)
+    assert sorter.run_count == 0
+    assert collect(sorter) == EXPECTED
+
+
+def test_sort_spilled_runs():
+    # A budget smaller than a single record spills every record into its own run.
+    sorter = ExternalSorter(1)
+    add_records(sorter)
+    assert sorter.run_count == 6
+    assert collect(sorter) == EXPECTED
+    assert sorter.run_count == 0
+
+
+def test_sort_spilled_runs_and_buffer():
+    # The first four records are spilled and the last two stay in the buffer.
+    sorter = ExternalSorter(ExternalSorter.ENTRY_OVERHEAD * 4)
+    add_records(sorter)
+    assert sorter.run_count == 1
+    assert collect(sorter) == EXPECTED
+
+
+def test_invalid_memory_budget():
+    with raises(ValueError, match='`memory_budget` must be a positive number of bytes.'):
+        ExternalSorter(0)
@@ -1,17 +1,30 @@
+import os
+import pickle
+import sqlite3
 from datetime import datetime
 from typing import List, Tuple, Any, Optional, Dict
+from unittest import mock
 
 from dateutil.tz import tzutc
+import pytest
+import yaml
+from pytest import raises
 
+from blurr.core.errors import RecordOrderError
 from blurr.core.store_key import Key, KeyType
+from blurr.runner.data_processor import SimpleJsonDataProcessor
 from blurr.runner.local_runner import LocalRunner
+from blurr.store.segment_store import decode_key, _Segment
 
 
 def execute_runner(stream_bts_file: str,
                    window_bts_file: Optional[str],
                    local_json_files: List[str],
-                   old_state: Optional[Dict[str, Dict]] = None) -> Tuple[LocalRunner, Any]:
-    runner = LocalRunner(stream_bts_file, window_bts_file)
+                   old_state: Optional[Dict[str, Dict]] = None,
+                   workers: int = 1,
+                   compiled: bool = False,
+                   batch_windows: bool = False) -> Tuple[LocalRunner, Any]:
+    runner = LocalRunner(stream_bts_file, window_bts_file, workers, compiled, batch_windows)
     return runner, runner.execute(
         runner.get_identity_records_from_json_files(local_json_files), old_state)
 
@@ -136,3 +149,277 @@ def test_write_output_file_with_stream_and_window_bts_provided(tmpdir):
     output_text = output_file.readlines(cr=False)
     assert 'last_day._identity,last_day.total_events,last_session._identity,last_session.events' in output_text
     assert 'userA,1,userA,1' in output_text
+
+
+def test_execution_plan_shared_across_identities():
+    runner, data = execute_runner('tests/data/stream.yml', 'tests/data/window.yml',
+                                  ['tests/data/raw.json'])
+    execution_plan = runner.execution_plan
+    assert len(data) == 3
+
+    runner.execute(runner.get_identity_records_from_json_files(['tests/data/raw2.json']))
+    assert runner.execution_plan is execution_plan
+
+    # Each identity starts with a new store so only the last identity is in the store.
+    assert len({key.identity for key in execution_plan.store.get_all()}) == 1
+
+
+def test_execution_plan_not_pickled():
+    runner, data = execute_runner('tests/data/stream.yml', 'tests/data/window.yml',
+                                  ['tests/data/raw.json'])
+    assert runner.execution_plan
+
+    unpickled_runner = pickle.loads(pickle.dumps(runner))
+    assert unpickled_runner._execution_plan is None
+    assert unpickled_runner.execute(
+        unpickled_runner.get_identity_records_from_json_files(['tests/data/raw.json'])) == data
+
+
+def test_workers_same_output_as_single_process():
+    _, data_single = execute_runner('tests/data/stream.yml', 'tests/data/window.yml',
+                                    ['tests/data/raw.json', 'tests/data/raw2.json'])
+    _, data_workers = execute_runner(
+        'tests/data/stream.yml',
+        'tests/data/window.yml', ['tests/data/raw.json', 'tests/data/raw2.json'],
+        workers=2)
+
+    assert data_workers == data_single
+    assert list(data_workers.keys()) == list(data_single.keys())
+
+
+def test_workers_with_state():
+    _, data_combined = execute_runner('tests/data/stream.yml', 'tests/data/window.yml',
+                                      ['tests/data/raw.json', 'tests/data/raw2.json'])
+
+    _, data_separate = execute_runner(
+        'tests/data/stream.yml', 'tests/data/window.yml', ['tests/data/raw.json'], workers=3)
+    old_state = {
+        identity: block_data
+        for identity, (block_data, window_data) in data_separate.items()
+    }
+    _, data_separate = execute_runner(
+        'tests/data/stream.yml',
+        'tests/data/window.yml', ['tests/data/raw2.json'],
+        old_state,
+        workers=3)
+
+    assert data_separate == data_combined
+
+
+def test_compiled_same_output_as_interpreted():
+    _, data_interpreted = execute_runner('tests/data/stream.yml', 'tests/data/window.yml',
+                                         ['tests/data/raw.json', 'tests/data/raw2.json'])
+    _, data_compiled = execute_runner(
+        'tests/data/stream.yml',
+        'tests/data/window.yml', ['tests/data/raw.json', 'tests/data/raw2.json'],
+        compiled=True)
+
+    assert data_compiled == data_interpreted
+
+
+def test_batch_windows_same_output():
+    pytest.importorskip('numpy')
+    _, data = execute_runner('tests/data/stream.yml', 'tests/data/window.yml',
+                             ['tests/data/raw.json', 'tests/data/raw2.json'])
+    _, data_batch = execute_runner(
+        'tests/data/stream.yml',
+        'tests/data/window.yml', ['tests/data/raw.json', 'tests/data/raw2.json'],
+        batch_windows=True)
+
+    assert any(window_data for _, window_data in data.values())
+    assert data_batch == data
+
+
+def test_batch_windows_requires_numpy():
+    with mock.patch('blurr.core.window_array._numpy_import_err',
+                    ImportError('No module named \'numpy\'')):
+        with raises(ImportError, match='numpy'):
+            LocalRunner('tests/data/stream.yml', 'tests/data/window.yml', batch_windows=True)
+
+
+def test_source_projection_same_output():
+    _, data = execute_runner('tests/data/stream.yml', 'tests/data/window.yml',
+                             ['tests/data/raw.json'])
+
+    runner = LocalRunner('tests/data/stream.yml', 'tests/data/window.yml')
+    assert runner.execution_plan.source_projection == {'country', 'event_time', 'user_id'}
+    data_processor = SimpleJsonDataProcessor(runner.execution_plan.source_projection)
+    assert runner.execute(
+        runner.get_identity_records_from_json_files(['tests/data/raw.json'],
+                                                    data_processor)) == data
+
+
+def test_workers_invalid():
+    with raises(ValueError, match='`workers` must be at least 1.'):
+        LocalRunner('tests/data/stream.yml', None, 0)
+
+
+def test_execute_sorted_spilled_to_disk(tmpdir):
+    _, data = execute_runner('tests/data/stream.yml', 'tests/data/window.yml',
+                             ['tests/data/raw.json', 'tests/data/raw2.json'])
+
+    runner = LocalRunner('tests/data/stream.yml', 'tests/data/window.yml')
+    data_sorted = runner.execute_sorted(
+        runner.get_sorted_identity_records_from_json_files(
+            ['tests/data/raw.json', 'tests/data/raw2.json'], memory_budget=1,
+            temp_dir=str(tmpdir)))
+
+    assert data_sorted == data
+    assert tmpdir.listdir() == []
+
+
+def test_execute_sorted_with_state():
+    _, data_combined = execute_runner('tests/data/stream.yml', None,
+                                      ['tests/data/raw.json', 'tests/data/raw2.json'])
+
+    _, data_separate = execute_runner('tests/data/stream.yml', None, ['tests/data/raw.json'])
+    old_state = {
+        identity: block_data
+        for identity, (block_data, window_data) in data_separate.items()
+    }
+    runner = LocalRunner('tests/data/stream.yml')
+    data_separate = runner.execute_sorted(
+        runner.get_sorted_identity_records_from_json_files(['tests/data/raw2.json'],
+                                                           memory_budget=1), old_state)
+
+    assert data_separate == data_combined
+
+
+def test_iter_execute_sorted_presorted_input():
+    _, data = execute_runner('tests/data/stream.yml', 'tests/data/window.yml',
+                             ['tests/data/raw.json'])
+
+    runner = LocalRunner('tests/data/stream.yml', 'tests/data/window.yml')
+    identity_data = list(
+        runner.iter_execute_sorted(
+            runner.get_presorted_identity_records_from_json_files(['tests/data/raw.json'])))
+
+    assert [identity for identity, _ in identity_data] == ['userA', 'userB', 'userC']
+    assert dict(identity_data) == data
+    # Output of the identities is not retained by the runner.
+    assert runner._per_user_data == {}
+
+
+def test_presorted_input_identity_not_grouped():
+    runner = LocalRunner('tests/data/stream.yml')
+    with raises(RecordOrderError, match='Records of identity userA are not grouped together.'):
+        runner.execute_sorted(
+            runner.get_presorted_identity_records_from_json_files(
+                ['tests/data/raw.json', 'tests/data/raw2.json']))
+
+
+def test_presorted_input_identity_not_sorted(tmpdir):
+    raw_file = tmpdir.join('raw.json')
+    raw_file.write('\n'.join([
+        '{"user_id": "userB", "event_time": "2018-03-07T22:35:31+00:00"}',
+        '{"user_id": "userA", "event_time": "2018-03-07T23:35:31+00:00"}',
+        '{"user_id": "userC", "event_time": "2018-03-07T21:35:31+00:00"}',
+    ]))
+    runner = LocalRunner('tests/data/stream.yml')
+
+    # Grouped records are accepted in any order of identity
+    identity_data = list(
+        runner.iter_execute_sorted(
+            runner.get_presorted_identity_records_from_json_files([str(raw_file)])))
+    assert [identity for identity, _ in identity_data] == ['userB', 'userA', 'userC']
+
+    raw_file.write('\n{"user_id": "userB", "event_time": "2018-03-07T23:35:31+00:00"}', mode='a')
+    with raises(RecordOrderError, match='userB appears again after userC.'):
+        runner.execute_sorted(
+            runner.get_presorted_identity_records_from_json_files([str(raw_file)]))
+
+
+def test_presorted_input_time_not_sorted(tmpdir):
+    raw_file = tmpdir.join('raw.json')
+    raw_file.write('\n'.join([
+        '{"user_id": "userA", "event_time": "2018-03-07T23:35:31+00:00"}',
+        '{"user_id": "userA", "event_time": "2018-03-07T22:35:31+00:00"}',
+    ]))
+    runner = LocalRunner('tests/data/stream.yml')
+    with raises(RecordOrderError, match='Records of identity userA are not sorted by time.'):
+        runner.execute_sorted(
+            runner.get_presorted_identity_records_from_json_files([str(raw_file)]))
+
+
+def get_stream_bts_file(tmpdir, store: Dict[str, Any]) -> str:
+    stream_bts = yaml.safe_load(open('tests/data/stream.yml'))
+    stream_bts['Stores'] = [dict(store, Name='memory')]
+    stream_bts_file = tmpdir.join('stream.yml')
+    stream_bts_file.write(yaml.safe_dump(stream_bts))
+    return str(stream_bts_file)
+
+
+@pytest.mark.parametrize('sorted_input', [False, True])
+def test_dynamo_store_buffer_written_at_end_of_run(tmpdir, sorted_input):
+    dynamodb_resource = mock.MagicMock()
+    dynamodb_resource.batch_write_item.return_value = {}
+    dynamodb_resource.Table.return_value.query.return_value = {'Items': []}
+    dynamodb_resource.Table.return_value.get_item.return_value = {}
+    with mock.patch(
+            'blurr.store.dynamo_store.DynamoStore.get_dynamodb_resource',
+            return_value=dynamodb_resource):
+        runner = LocalRunner(
+            get_stream_bts_file(tmpdir, {
+                'Type': 'Blurr:Store:Dynamo',
+                'Table': '_unit_test_runner',
+                'WriteBufferSize': 100
+            }))
+        if sorted_input:
+            list(
+                runner.iter_execute_sorted(
+                    runner.get_presorted_identity_records_from_json_files(
+                        ['tests/data/raw.json'])))
+        else:
+            runner.execute(runner.get_identity_records_from_json_files(['tests/data/raw.json']))
+
+    # The items of all the identities are written together at the end of the run
+    assert dynamodb_resource.batch_write_item.call_count == 1
+    items = dynamodb_resource.batch_write_item.call_args[1]['RequestItems']['_unit_test_runner']
+    assert sorted({item['PutRequest']['Item']['partition_key']
+                   for item in items}) == ['userA', 'userB', 'userC']
+
+
+@pytest.mark.parametrize('sorted_input', [False, True])
+def test_sqlite_store_has_all_identities(tmpdir, sorted_input):
+    database_file = str(tmpdir.join('state.db'))
+    runner = LocalRunner(
+        get_stream_bts_file(tmpdir, {
+            'Type': 'Blurr:Store:SQLite',
+            'File': database_file
+        }))
+    if sorted_input:
+        list(
+            runner.iter_execute_sorted(
+                runner.get_presorted_identity_records_from_json_files(['tests/data/raw.json'])))
+    else:
+        runner.execute(runner.get_identity_records_from_json_files(['tests/data/raw.json']))
+
+    connection = sqlite3.connect(database_file)
+    try:
+        identities = connection.execute('SELECT DISTINCT identity FROM memory').fetchall()
+    finally:
+        connection.close()
+    assert sorted(identity for identity, in identities) == ['userA', 'userB', 'userC']
+
+
+@pytest.mark.parametrize('sorted_input', [False, True])
+def test_segment_store_flushed_at_end_of_run(tmpdir, sorted_input):
+    directory = str(tmpdir.join('segments'))
+    runner = LocalRunner(
+        get_stream_bts_file(tmpdir, {
+            'Type': 'Blurr:Store:Segment',
+            'Directory': directory
+        }))
+    if sorted_input:
+        list(
+            runner.iter_execute_sorted(
+                runner.get_presorted_identity_records_from_json_files(['tests/data/raw.json'])))
+    else:
+        runner.execute(runner.get_identity_records_from_json_files(['tests/data/raw.json']))
+
+    # The identities are written to one segment at the end of the run
+    segment_files = [name for name in os.listdir(directory) if name.endswith('.seg')]
+    assert len(segment_files) == 1
+    segment = _Segment(os.path.join(directory, segment_files[0]))
+    assert sorted({decode_key(key).identity
+                   for key, _ in segment.scan()}) == ['userA', 'userB', 'userC']
@@ -1,13 +1,19 @@
+import threading
 import time
 from datetime import datetime, timezone
+from decimal import Decimal
 from typing import Dict, Any
 from unittest import mock
 
 import boto3
-from pytest import fixture, mark
+from pytest import fixture, mark, raises
 
+from blurr.core.aggregate_identity import IdentityAggregate
+from blurr.core.errors import StoreWriteError
+from blurr.core.evaluation import EvaluationContext
 from blurr.core.schema_loader import SchemaLoader
 from blurr.core.store_key import Key, KeyType
+from blurr.core.type import Type
 from blurr.store.dynamo_store import DynamoStore
 from tests.core.conftest import init_memory_store
 from tests.store.dynamo.utils import DYNAMODB_KWARGS
@@ -41,6 +47,7 @@ def store(dynamo_store_spec: Dict[str, Any]) -> DynamoStore:
         dynamo_store = schema_loader.get_store(name)
     yield dynamo_store
     dynamo_store._table.delete()
+    DynamoStore.clear_table_cache()
 
 
 @fixture(scope='session')
@@ -59,6 +66,7 @@ def loaded_store() -> DynamoStore:
     init_memory_store(dynamo_store)
     yield dynamo_store
     dynamo_store._table.delete()
+    DynamoStore.clear_table_cache()
 
 
 def test_schema_init(dynamo_store_spec: Dict[str, Any]) -> None:
@@ -81,6 +89,17 @@ def test_schema_init_with_read_write_units(dynamo_store_spec: Dict[str, Any]) ->
     assert store_schema.wcu == 10
 
 
+def test_schema_init_with_write_buffer(dynamo_store_spec: Dict[str, Any]) -> None:
+    dynamo_store_spec['WriteBufferSize'] = 500
+    dynamo_store_spec['WriteBufferSeconds'] = 2.5
+    schema_loader = SchemaLoader()
+    name = schema_loader.add_schema_spec(dynamo_store_spec)
+    store_schema = schema_loader.get_schema_object(name)
+    assert store_schema.write_buffer_size == 500
+    assert store_schema.write_buffer_seconds == 2.5
+    assert not schema_loader.get_errors()
+
+
 @mock.patch(
     'blurr.store.dynamo_store.DynamoStore.get_dynamodb_resource',
     new=override_boto3_dynamodb_resource)
@@ -120,6 +139,7 @@ def test_table_creation_if_not_exist(dynamo_store_spec: Dict[str, Any]) -> None:
     assert item
 
     dynamo_store._table.delete()
+    DynamoStore.clear_table_cache()
 
 
 def test_save_simple(store: DynamoStore) -> None:
@@ -236,3 +256,433 @@ def test_get_range_start_end_time_no_dimensions_match(loaded_store: DynamoStore)
 
 def test_get_all(loaded_store: DynamoStore) -> None:
     assert len(loaded_store.get_all('user1')) == 13
+
+
+def get_buffered_store(dynamodb_resource: mock.MagicMock, **spec: Any) -> DynamoStore:
+    schema_loader = SchemaLoader()
+    name = schema_loader.add_schema_spec({
+        'Name': 'dynamostore',
+        'Type': 'Blurr:Store:Dynamo',
+        'Table': '_unit_test_buffered',
+        **spec
+    })
+    with mock.patch(
+            'blurr.store.dynamo_store.DynamoStore.get_dynamodb_resource',
+            return_value=dynamodb_resource):
+        return schema_loader.get_store(name)
+
+
+def get_written_items(dynamodb_resource: mock.MagicMock) -> list:
+    return [[request['PutRequest']['Item']
+             for request in call[1]['RequestItems']['_unit_test_buffered']]
+            for call in dynamodb_resource.batch_write_item.call_args_list]
+
+
+def test_save_buffered_collapses_keys_and_writes_in_batches() -> None:
+    dynamodb_resource = mock.MagicMock()
+    dynamodb_resource.batch_write_item.return_value = {'UnprocessedItems': {}}
+    store = get_buffered_store(dynamodb_resource, WriteBufferSize=100)
+
+    for i in range(30):
+        store.save(Key(KeyType.DIMENSION, 'user{}'.format(i), 'state'), {'events': i})
+    store.save(Key(KeyType.DIMENSION, 'user0', 'state'), {'events': 100})
+    assert not dynamodb_resource.batch_write_item.called
+    assert not store._table.put_item.called
+
+    store.finalize()
+    batches = get_written_items(dynamodb_resource)
+    assert [len(batch) for batch in batches] == [25, 5]
+    assert batches[0][0] == {'events': 100, 'partition_key': 'user0', 'range_key': 'state//'}
+
+
+def test_save_buffered_flushes_at_buffer_size() -> None:
+    dynamodb_resource = mock.MagicMock()
+    dynamodb_resource.batch_write_item.return_value = {}
+    store = get_buffered_store(dynamodb_resource, WriteBufferSize=2)
+
+    store.save(Key(KeyType.DIMENSION, 'user1', 'state'), {'events': 1})
+    assert not dynamodb_resource.batch_write_item.called
+    store.save(Key(KeyType.DIMENSION, 'user2', 'state'), {'events': 2})
+    assert len(get_written_items(dynamodb_resource)) == 1
+
+
+def test_save_buffered_reads_buffered_items() -> None:
+    dynamodb_resource = mock.MagicMock()
+    dynamodb_resource.batch_write_item.return_value = {}
+    store = get_buffered_store(dynamodb_resource, WriteBufferSize=10)
+    items = [{
+        'partition_key': 'user1',
+        'range_key': 'session//2018-03-07T19:35:31+00:00',
+        '_start_time': '2018-03-07T19:35:31+00:00'
+    }, {
+        'partition_key': 'user1',
+        'range_key': 'state//',
+        'events': 0
+    }]
+    store._table.query.side_effect = lambda **kwargs: {'Items': [dict(item) for item in items]}
+
+    store.save(Key(KeyType.DIMENSION, 'user1', 'state'), {'events': 1})
+    assert store.get(Key(KeyType.DIMENSION, 'user1', 'state')) == {'events': 1}
+    assert store.get_all('user1') == {
+        Key(KeyType.TIMESTAMP, 'user1', 'session', [],
+            datetime(2018, 3, 7, 19, 35, 31, 0, timezone.utc)): {
+                '_start_time': '2018-03-07T19:35:31+00:00'
+            },
+        Key(KeyType.DIMENSION, 'user1', 'state'): {
+            'events': 1
+        }
+    }
+    store.get_range(
+        Key(KeyType.TIMESTAMP, 'user2', 'session'),
+        datetime(2018, 3, 7, 19, 35, 31, 0, timezone.utc), None, 1)
+    assert not dynamodb_resource.batch_write_item.called
+    assert not store._table.get_item.called
+
+    # Range queries of an identity with buffered items are read from the table
+    store.get_range(
+        Key(KeyType.TIMESTAMP, 'user1', 'session'),
+        datetime(2018, 3, 7, 19, 35, 31, 0, timezone.utc), None, 1)
+    assert len(get_written_items(dynamodb_resource)) == 1
+
+
+def test_save_buffered_kept_across_identities() -> None:
+    dynamodb_resource = mock.MagicMock()
+    dynamodb_resource.batch_write_item.return_value = {}
+
+    # A store is created for each identity. The stores share the buffer of the table.
+    for i in range(3):
+        store = get_buffered_store(dynamodb_resource, WriteBufferSize=4)
+        store.save(Key(KeyType.DIMENSION, 'user{}'.format(i), 'state'), {'events': i})
+        store.finalize_identity()
+    assert not dynamodb_resource.batch_write_item.called
+
+    with mock.patch('blurr.store.dynamo_store.time.monotonic', return_value=time.monotonic() + 60):
+        store.finalize_identity()
+    assert [len(batch) for batch in get_written_items(dynamodb_resource)] == [3]
+
+    store = get_buffered_store(dynamodb_resource, WriteBufferSize=4)
+    store.save(Key(KeyType.DIMENSION, 'user3', 'state'), {'events': 3})
+    store.finalize_identity()
+    assert [len(batch) for batch in get_written_items(dynamodb_resource)] == [3]
+    store.finalize()
+    assert [len(batch) for batch in get_written_items(dynamodb_resource)] == [3, 1]
+
+
+@mock.patch('blurr.store.dynamo_store.time.sleep')
+def test_save_buffered_retries_unprocessed_items(sleep: mock.MagicMock) -> None:
+    dynamodb_resource = mock.MagicMock()
+    unprocessed = {'_unit_test_buffered': [{'PutRequest': {'Item': {'events': 2}}}]}
+    dynamodb_resource.batch_write_item.side_effect = [{
+        'UnprocessedItems': unprocessed
+    }, {
+        'UnprocessedItems': unprocessed
+    }, {
+        'UnprocessedItems': {}
+    }]
+    store = get_buffered_store(dynamodb_resource, WriteBufferSize=10)
+
+    store.save(Key(KeyType.DIMENSION, 'user1', 'state'), {'events': 1})
+    store.save(Key(KeyType.DIMENSION, 'user2', 'state'), {'events': 2})
+    store.finalize()
+
+    assert dynamodb_resource.batch_write_item.call_count == 3
+    assert dynamodb_resource.batch_write_item.call_args[1]['RequestItems'] == unprocessed
+    assert [call[0][0] for call in sleep.call_args_list] == [
+        DynamoStore.BATCH_WRITE_RETRY_DELAY_SECONDS, DynamoStore.BATCH_WRITE_RETRY_DELAY_SECONDS * 2
+    ]
+
+
+@mock.patch('blurr.store.dynamo_store.time.sleep')
+def test_save_buffered_raises_when_retries_exhausted(sleep: mock.MagicMock) -> None:
+    dynamodb_resource = mock.MagicMock()
+    unprocessed = {'_unit_test_buffered': [{'PutRequest': {'Item': {'events': 1}}}]}
+    dynamodb_resource.batch_write_item.return_value = {'UnprocessedItems': unprocessed}
+    store = get_buffered_store(dynamodb_resource, WriteBufferSize=10)
+
+    store.save(Key(KeyType.DIMENSION, 'user1', 'state'), {'events': 1})
+    with raises(StoreWriteError):
+        store.finalize()
+    assert dynamodb_resource.batch_write_item.call_count == DynamoStore.BATCH_WRITE_RETRIES + 1
+
+
+def get_prefetch_store() -> DynamoStore:
+    dynamodb_resource = mock.MagicMock()
+    store = get_buffered_store(dynamodb_resource, Prefetch=True)
+    first_page = [{
+        'partition_key': 'user1',
+        'range_key': 'state//',
+        'events': 3
+    }, {
+        'partition_key': 'user1',
+        'range_key': 'session//2018-03-07T19:35:31+00:00',
+        '_start_time': '2018-03-07T19:35:31+00:00'
+    }]
+    second_page = [{
+        'partition_key': 'user1',
+        'range_key': 'session//2018-03-07T20:35:35+00:00',
+        '_start_time': '2018-03-07T20:35:35+00:00'
+    }]
+    store._table.query.side_effect = lambda **kwargs: {
+        'Items': [dict(item) for item in second_page]
+    } if 'ExclusiveStartKey' in kwargs else {
+        'Items': [dict(item) for item in first_page],
+        'LastEvaluatedKey': {
+            'partition_key': 'user1'
+        }
+    }
+    return store
+
+
+def test_prefetch_reads_all_pages_once() -> None:
+    store = get_prefetch_store()
+
+    assert store.get(Key(KeyType.DIMENSION, 'user1', 'state')) == {'events': 3}
+    assert store.get(Key(KeyType.DIMENSION, 'user1', 'missing')) is None
+    assert len(store.get_all('user1')) == 3
+    blocks = store.get_range(
+        Key(KeyType.TIMESTAMP, 'user1', 'session'),
+        datetime(2018, 3, 7, 19, 35, 31, 0, timezone.utc), None, 1)
+    assert blocks[0][1] == {'_start_time': '2018-03-07T20:35:35+00:00'}
+
+    assert store._table.query.call_count == 2
+    assert not store._table.get_item.called
+
+
+def test_prefetch_invalidates_saved_keys() -> None:
+    store = get_prefetch_store()
+    key = Key(KeyType.DIMENSION, 'user1', 'state')
+    store.get(key)
+    store.save(key, {'events': 4})
+    store._table.get_item.return_value = {
+        'Item': {
+            'partition_key': 'user1',
+            'range_key': 'state//',
+            'events': 4
+        }
+    }
+
+    assert store.get(key) == {'events': 4}
+    assert store.get(key) == {'events': 4}
+    assert store._table.get_item.call_count == 1
+
+    store.save(key, {'events': 5})
+    store.get_all('user1')
+    assert store._table.query.call_count == 4
+
+
+def test_table_checked_once_per_process() -> None:
+    dynamodb_resource = mock.MagicMock()
+    creation_date_time = mock.PropertyMock()
+    type(dynamodb_resource.Table.return_value).creation_date_time = creation_date_time
+
+    get_buffered_store(dynamodb_resource)
+    get_buffered_store(dynamodb_resource)
+    assert creation_date_time.call_count == 1
+
+    DynamoStore.clear_table_cache()
+    get_buffered_store(dynamodb_resource)
+    assert creation_date_time.call_count == 2
+
+
+@mock.patch('blurr.store.dynamo_store.boto3.resource', side_effect=lambda name: mock.MagicMock())
+def test_dynamodb_resource_pooled_per_thread(resource: mock.MagicMock) -> None:
+    resources = []
+
+    def get_resources():
+        resources.append((DynamoStore.get_dynamodb_resource(),
+                          DynamoStore.get_dynamodb_resource()))
+
+    for _ in range(2):
+        thread = threading.Thread(target=get_resources)
+        thread.start()
+        thread.join()
+
+    assert resources[0][0] is resources[0][1]
+    assert resources[1][0] is resources[1][1]
+    assert resources[0][0] is not resources[1][0]
+    assert resource.call_count == 2
+
+
+def get_paginated_store(**spec: Any) -> DynamoStore:
+    store = get_buffered_store(mock.MagicMock(), QueryPageSize=2, **spec)
+    pages = [[{
+        'partition_key': 'user1',
+        'range_key': 'session//2018-03-07T{}:00:00+00:00'.format(hour),
+        '_start_time': '2018-03-07T{}:00:00+00:00'.format(hour)
+    } for hour in hours] for hours in [(10, 11), (12, 13), (14, )]]
+
+    def query(**kwargs):
+        page = int(kwargs.get('ExclusiveStartKey', {}).get('page', 0))
+        response = {'Items': [dict(item) for item in pages[page]]}
+        if page + 1 < len(pages):
+            response['LastEvaluatedKey'] = {'page': page + 1}
+        return response
+
+    store._table.query.side_effect = query
+    return store
+
+
+@mark.parametrize('read_ahead', [{}, {'QueryReadAhead': 1}])
+def test_get_all_reads_all_pages(read_ahead: Dict[str, Any]) -> None:
+    store = get_paginated_store(**read_ahead)
+    with mock.patch(
+            'blurr.store.dynamo_store.DynamoStore.get_dynamodb_resource',
+            return_value=store._dynamodb_resource):
+        assert len(store.get_all('user1')) == 5
+    assert {call[1]['Limit'] for call in store._table.query.call_args_list} == {2}
+
+
+def test_iterate_all_reads_pages_lazily() -> None:
+    store = get_paginated_store()
+    items = store.iterate_all('user1')
+    assert not store._table.query.called
+
+    assert next(items)[1]['_start_time'] == '2018-03-07T10:00:00+00:00'
+    assert store._table.query.call_count == 1
+    assert len(list(items)) == 4
+    assert store._table.query.call_count == 3
+
+
+def test_iterate_range_count_stops_reading() -> None:
+    store = get_paginated_store()
+    blocks = list(
+        store.iterate_range(
+            Key(KeyType.TIMESTAMP, 'user1', 'session'),
+            datetime(2018, 3, 7, 9, 0, 0, 0, timezone.utc), None, 1))
+    assert len(blocks) == 1
+    assert store._table.query.call_count == 1
+
+
+def test_start_time_index_table_definition() -> None:
+    store = get_buffered_store(mock.MagicMock(), StartTimeIndex=True)
+    table_definition = store._get_table_definition()
+
+    assert table_definition['LocalSecondaryIndexes'][0]['KeySchema'][1] == {
+        'AttributeName': 'group_start_time',
+        'KeyType': 'RANGE'
+    }
+    assert 'LocalSecondaryIndexes' not in get_buffered_store(
+        mock.MagicMock())._get_table_definition()
+
+
+def test_start_time_index_save() -> None:
+    store = get_buffered_store(mock.MagicMock(), StartTimeIndex=True)
+    store.save(
+        Key(KeyType.DIMENSION, 'user1', 'session_dim', ['dimA']), {
+            'events': 1,
+            '_start_time': '2018-03-07T19:35:31+00:00'
+        })
+    store.save(Key(KeyType.DIMENSION, 'user1', 'state'), {'events': 1})
+
+    items = [call[1]['Item'] for call in store._table.put_item.call_args_list]
+    assert items[0]['group_start_time'] == 'session_dim/2018-03-07T19:35:31+00:00'
+    assert 'group_start_time' not in items[1]
+
+
+def test_start_time_index_count_query() -> None:
+    store = get_buffered_store(mock.MagicMock(), StartTimeIndex=True)
+    store._table.query.return_value = {
+        'Items': [{
+            'partition_key': 'user1',
+            'range_key': 'session_dim/{}/'.format(dimension),
+            'group_start_time': 'session_dim/' + start_time,
+            '_start_time': start_time
+        } for dimension, start_time in [('dimA', '2018-03-07T22:38:31+00:00'), (
+            'dimB', '2018-03-07T21:36:31+00:00'), ('dimA', '2018-03-07T20:35:35+00:00')]]
+    }
+
+    blocks = store.get_range(
+        Key(KeyType.DIMENSION, 'user1', 'session_dim', ['dimA']),
+        datetime(2018, 3, 7, 22, 38, 31, 0, timezone.utc), None, -1)
+
+    query_args = store._table.query.call_args[1]
+    assert query_args['IndexName'] == 'start_time_index'
+    assert query_args['Limit'] == 2
+    assert not query_args['ScanIndexForward']
+    assert 'FilterExpression' not in query_args
+    assert blocks == [(Key(KeyType.DIMENSION, 'user1', 'session_dim', ['dimA']), {
+        '_start_time': '2018-03-07T20:35:35+00:00'
+    })]
+
+
+def test_update_writes_changed_fields() -> None:
+    store = get_buffered_store(mock.MagicMock(), StartTimeIndex=True)
+    store.update(
+        Key(KeyType.DIMENSION, 'user1', 'session_dim', ['dimA']), {
+            'events': 2,
+            'amount': 0,
+            'country': 'US',
+            '_start_time': '2018-03-07T19:35:31+00:00'
+        }, ['events', 'amount'])
+
+    assert not store._table.put_item.called
+    update_args = store._table.update_item.call_args[1]
+    assert update_args['Key'] == {'partition_key': 'user1', 'range_key': 'session_dim/dimA/'}
+    assert update_args['UpdateExpression'] == 'SET #f0 = :f0 REMOVE #f1'
+    assert update_args['ExpressionAttributeNames'] == {'#f0': 'events', '#f1': 'amount'}
+    assert update_args['ExpressionAttributeValues'] == {':f0': 2}
+
+
+def test_update_buffered_saves_item() -> None:
+    dynamodb_resource = mock.MagicMock()
+    dynamodb_resource.batch_write_item.return_value = {}
+    store = get_buffered_store(dynamodb_resource, WriteBufferSize=10)
+    store.update(Key(KeyType.DIMENSION, 'user1', 'state'), {'events': 2, 'amount': 5}, ['events'])
+    store.finalize()
+
+    assert not store._table.update_item.called
+    assert get_written_items(dynamodb_resource) == [[{
+        'events': 2,
+        'amount': 5,
+        'partition_key': 'user1',
+        'range_key': 'state//'
+    }]]
+
+
+def test_unchanged_restore_not_written() -> None:
+    schema_loader = SchemaLoader()
+    name = schema_loader.add_schema_spec({
+        'Type': Type.BLURR_AGGREGATE_IDENTITY,
+        'Name': 'state',
+        'Store': 'dynamostore',
+        'Fields': [{
+            'Name': field_name,
+            'Type': field_type,
+            'Value': 'state.' + field_name
+        } for field_name, field_type in [('events', Type.INTEGER), ('amount', Type.FLOAT),
+                                         ('country', Type.STRING), ('amounts', Type.MAP)]]
+    })
+    schema_loader.add_schema_spec({
+        'Name': 'dynamostore',
+        'Type': 'Blurr:Store:Dynamo',
+        'Table': '_unit_test_buffered'
+    }, name)
+    evaluation_context = EvaluationContext()
+    evaluation_context.global_add('identity', 'user1')
+    with mock.patch(
+            'blurr.store.dynamo_store.DynamoStore.get_dynamodb_resource',
+            return_value=mock.MagicMock()):
+        aggregate = IdentityAggregate(
+            schema_loader.get_schema_object(name), 'user1', evaluation_context)
+    evaluation_context.global_add('state', aggregate)
+    store = aggregate._store
+
+    # Empty values are not saved and numbers are read as Decimal
+    store._table.get_item.return_value = {
+        'Item': {
+            'partition_key': 'user1',
+            'range_key': 'state//',
+            '_identity': 'user1',
+            'events': Decimal('3'),
+            'amount': Decimal('0.1'),
+            'amounts': {
+                'US': Decimal('0.1')
+            }
+        }
+    }
+    aggregate.run_evaluate()
+    aggregate.run_finalize()
+
+    assert aggregate._snapshot['amount'] == 0.1
+    assert not store._table.update_item.called
+    assert not store._table.put_item.called
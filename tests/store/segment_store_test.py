@@ -0,0 +1,148 @@
+import os
+import pickle
+from datetime import datetime, timezone
+
+from pytest import fixture, mark
+
+from blurr.core.schema_loader import SchemaLoader
+from blurr.core.store_key import Key, KeyType
+from blurr.core.type import Type
+from blurr.store.memory_store import MemoryStore
+from blurr.store.segment_store import encode_key, SegmentStore, _Segment
+from tests.core.conftest import init_memory_store
+
+
+def get_segment_store(directory: str, **spec) -> SegmentStore:
+    schema_loader = SchemaLoader()
+    name = schema_loader.add_schema_spec({
+        'Name': 'segmentstore',
+        'Type': Type.BLURR_STORE_SEGMENT,
+        'Directory': directory,
+        **spec
+    })
+    return schema_loader.get_store(name)
+
+
+def get_segment_files(directory: str) -> list:
+    return [name for name in os.listdir(directory) if name.endswith('.seg')]
+
+
+@fixture
+def directory(tmpdir) -> str:
+    return str(tmpdir.join('segments'))
+
+
+@fixture
+def store(directory: str) -> SegmentStore:
+    store = get_segment_store(directory)
+    init_memory_store(store)
+    store.finalize()
+    return get_segment_store(directory)
+
+
+@fixture
+def memory_store() -> MemoryStore:
+    schema_loader = SchemaLoader()
+    name = schema_loader.add_schema_spec({'Name': 'memstore', 'Type': Type.BLURR_STORE_MEMORY})
+    memory_store = schema_loader.get_store(name)
+    init_memory_store(memory_store)
+    return memory_store
+
+
+def test_get(store: SegmentStore) -> None:
+    key = Key(KeyType.DIMENSION, 'user1', 'state')
+    assert store.get(key) == {'variable_1': 1, 'variable_a': 'a', 'variable_true': True}
+    assert store.get(Key(KeyType.DIMENSION, 'user1', 'missing')) is None
+    assert store.get(Key(KeyType.DIMENSION, 'user0', 'state')) is None
+
+
+def test_get_all(store: SegmentStore, memory_store: MemoryStore) -> None:
+    assert store.get_all('user1') == memory_store.get_all('user1')
+    assert store.get_all('user') == {}
+
+
+@mark.parametrize('key, end_time, count', [
+    (Key(KeyType.TIMESTAMP, 'user1', 'session'), datetime(2018, 3, 7, 22, 38, 31, 0,
+                                                          timezone.utc), 0),
+    (Key(KeyType.TIMESTAMP, 'user1', 'session'), None, 2),
+    (Key(KeyType.TIMESTAMP, 'user1', 'session'), None, -2),
+    (Key(KeyType.DIMENSION, 'user1', 'session_dim'), datetime(2018, 3, 7, 22, 38, 31, 0,
+                                                              timezone.utc), 0),
+    (Key(KeyType.DIMENSION, 'user1', 'session_dim'), None, -2),
+    (Key(KeyType.DIMENSION, 'user1', 'session_dim', ['dimA']), None, 2),
+    (Key(KeyType.DIMENSION, 'user1', 'session_dim', ['dimC']), None, 2),
+])
+def test_get_range_same_as_memory_store(store: SegmentStore, memory_store: MemoryStore, key: Key,
+                                        end_time: datetime, count: int) -> None:
+    start_time = datetime(2018, 3, 7, 20, 35, 35, 0, timezone.utc)
+    assert store.get_range(key, start_time, end_time, count) == memory_store.get_range(
+        key, start_time, end_time, count)
+
+
+def test_newer_segments_supersede_older(store: SegmentStore, directory: str) -> None:
+    key = Key(KeyType.DIMENSION, 'user1', 'state')
+    store.save(key, {'variable_1': 2})
+    assert store.get(key) == {'variable_1': 2}
+    store.delete(Key(KeyType.DIMENSION, 'user1', 'session_dim', ['dimA', 'session1']))
+    store.finalize()
+
+    store = get_segment_store(directory)
+    assert store.get(key) == {'variable_1': 2}
+    assert len(store.get_all('user1')) == 12
+    assert len(get_segment_files(directory)) == 2
+
+
+def test_compaction(directory: str) -> None:
+    store = get_segment_store(directory, MaxSegments=3)
+    for run in range(3):
+        for i in range(200):
+            store.save(Key(KeyType.DIMENSION, 'user{}'.format(i), 'state'), {'run': run})
+        store.finalize()
+    store.delete(Key(KeyType.DIMENSION, 'user0', 'state'))
+    store.finalize()
+
+    assert len(get_segment_files(directory)) == 1
+    store = get_segment_store(directory)
+    assert store.get(Key(KeyType.DIMENSION, 'user0', 'state')) is None
+    assert store.get(Key(KeyType.DIMENSION, 'user150', 'state')) == {'run': 2}
+    assert len(store.get_all('user15')) == 1
+
+
+def test_finalize_identity_flushes_when_full(directory: str) -> None:
+    store = get_segment_store(directory, MaxUnflushedItems=3)
+    for i in range(2):
+        store.save(Key(KeyType.DIMENSION, 'user{}'.format(i), 'state'), {'run': 0})
+        store.finalize_identity()
+    assert get_segment_files(directory) == []
+
+    # Unflushed items are kept across the store instances of the directory
+    store = get_segment_store(directory, MaxUnflushedItems=3)
+    assert store.get(Key(KeyType.DIMENSION, 'user0', 'state')) == {'run': 0}
+    store.save(Key(KeyType.DIMENSION, 'user2', 'state'), {'run': 0})
+    store.finalize_identity()
+    assert len(get_segment_files(directory)) == 1
+
+    store.save(Key(KeyType.DIMENSION, 'user3', 'state'), {'run': 0})
+    store.finalize()
+    assert len(get_segment_files(directory)) == 2
+
+
+def test_compaction_includes_segments_of_other_processes(directory: str) -> None:
+    store = get_segment_store(directory, MaxSegments=2)
+    store.save(Key(KeyType.DIMENSION, 'user0', 'state'), {'run': 0})
+    store.finalize()
+
+    # Segment written by another worker process after the store listed the segments
+    other_key = Key(KeyType.DIMENSION, 'user1', 'state')
+    _Segment.write(
+        os.path.join(directory, '{:020d}-0-0.seg'.format(2**62)),
+        [(encode_key(other_key), pickle.dumps({'run': 1}))])
+
+    for run in range(1, 3):
+        store.save(Key(KeyType.DIMENSION, 'user0', 'state'), {'run': run})
+        store.finalize()
+
+    assert len(get_segment_files(directory)) == 1
+    store = get_segment_store(directory)
+    assert store.get(other_key) == {'run': 1}
+    assert store.get(Key(KeyType.DIMENSION, 'user0', 'state')) == {'run': 2}
@@ -0,0 +1,150 @@
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Any
+from unittest import mock
+
+from pytest import fixture, mark
+
+from blurr.core.schema_loader import SchemaLoader
+from blurr.core.store_key import Key, KeyType
+from blurr.core.type import Type
+from blurr.store.memory_store import MemoryStore
+from blurr.store.sqlite_store import SQLiteStore
+from tests.core.conftest import init_memory_store
+
+
+def get_sqlite_store(file: str, **spec: Any) -> SQLiteStore:
+    schema_loader = SchemaLoader()
+    name = schema_loader.add_schema_spec({
+        'Name': 'sqlitestore',
+        'Type': Type.BLURR_STORE_SQLITE,
+        'File': file,
+        **spec
+    })
+    return schema_loader.get_store(name)
+
+
+@fixture
+def sqlite_file(tmpdir) -> str:
+    return str(tmpdir.join('store.db'))
+
+
+@fixture
+def store(sqlite_file: str) -> SQLiteStore:
+    store = get_sqlite_store(sqlite_file)
+    init_memory_store(store)
+    return store
+
+
+@fixture
+def memory_store() -> MemoryStore:
+    schema_loader = SchemaLoader()
+    name = schema_loader.add_schema_spec({'Name': 'memstore', 'Type': Type.BLURR_STORE_MEMORY})
+    memory_store = schema_loader.get_store(name)
+    init_memory_store(memory_store)
+    return memory_store
+
+
+def test_schema_validation() -> None:
+    schema_loader = SchemaLoader()
+    name = schema_loader.add_schema_spec({
+        'Name': 'sqlitestore',
+        'Type': Type.BLURR_STORE_SQLITE,
+        'Table': 'invalid table'
+    })
+    schema_loader.get_schema_object(name)
+    assert {error.attribute for error in schema_loader.get_errors()} == {'File', 'Table'}
+
+    name = schema_loader.add_schema_spec({
+        'Name': 'sqlitestore_commits',
+        'Type': Type.BLURR_STORE_SQLITE,
+        'File': 'store.db',
+        'MaxUncommittedIdentities': 0,
+        'MaxUncommittedSeconds': -1
+    })
+    schema_loader.get_schema_object(name)
+    assert {error.attribute for error in schema_loader.get_errors()} == {
+        'File', 'Table', 'MaxUncommittedIdentities', 'MaxUncommittedSeconds'
+    }
+
+
+def test_get(store: SQLiteStore) -> None:
+    key = Key(KeyType.DIMENSION, 'user1', 'state')
+    assert store.get(key) == {'variable_1': 1, 'variable_a': 'a', 'variable_true': True}
+    assert store.get(Key(KeyType.DIMENSION, 'user1', 'missing')) is None
+
+
+def test_save_replaces_and_delete(store: SQLiteStore) -> None:
+    key = Key(KeyType.DIMENSION, 'user1', 'state')
+    store.save(key, {'values': {1, 2}})
+    assert store.get(key) == {'values': {1, 2}}
+
+    store.delete(key)
+    assert store.get(key) is None
+
+
+def test_get_all(store: SQLiteStore, memory_store: MemoryStore) -> None:
+    items = store.get_all('user1')
+    assert items == memory_store.get_all('user1')
+    assert list(items.keys()) == sorted(items.keys(), key=lambda key: key.sort_key)
+
+
+@mark.parametrize('key, end_time, count', [
+    (Key(KeyType.TIMESTAMP, 'user1', 'session'), datetime(2018, 3, 7, 22, 38, 31, 0,
+                                                          timezone.utc), 0),
+    (Key(KeyType.TIMESTAMP, 'user1', 'session'), None, 2),
+    (Key(KeyType.TIMESTAMP, 'user1', 'session'), None, -2),
+    (Key(KeyType.DIMENSION, 'user1', 'session_dim'), datetime(2018, 3, 7, 22, 38, 31, 0,
+                                                              timezone.utc), 0),
+    (Key(KeyType.DIMENSION, 'user1', 'session_dim'), None, 2),
+    (Key(KeyType.DIMENSION, 'user1', 'session_dim'), None, -2),
+    (Key(KeyType.DIMENSION, 'user1', 'session_dim', ['dimA']), None, 2),
+    (Key(KeyType.DIMENSION, 'user1', 'session_dim', ['dimA']), None, -2),
+    (Key(KeyType.DIMENSION, 'user1', 'session_dim', ['dimC']), None, 2),
+])
+def test_get_range_same_as_memory_store(store: SQLiteStore, memory_store: MemoryStore, key: Key,
+                                        end_time: datetime, count: int) -> None:
+    start_time = datetime(2018, 3, 7, 20, 35, 35, 0, timezone.utc)
+    assert store.get_range(key, start_time, end_time, count) == memory_store.get_range(
+        key, start_time, end_time, count)
+
+
+def test_finalize_commits(sqlite_file: str) -> None:
+    store = get_sqlite_store(sqlite_file)
+    store.save(Key(KeyType.DIMENSION, 'user1', 'state'), {'events': 1})
+    assert sqlite3.connect(sqlite_file).execute('SELECT * FROM sqlitestore').fetchall() == []
+
+    store.finalize()
+    assert len(sqlite3.connect(sqlite_file).execute('SELECT * FROM sqlitestore').fetchall()) == 1
+    assert get_sqlite_store(sqlite_file).get(Key(KeyType.DIMENSION, 'user1', 'state')) == {
+        'events': 1
+    }
+
+
+def test_finalize_identity_commits_identities_together(sqlite_file: str) -> None:
+    statements = []
+    # A store is created for each identity. The stores share the transaction of the file.
+    for i in range(5):
+        store = get_sqlite_store(sqlite_file, MaxUncommittedIdentities=2)
+        store._connection.set_trace_callback(statements.append)
+        store.save(Key(KeyType.DIMENSION, 'user{}'.format(i), 'state'), {'events': i})
+        store.finalize_identity()
+    assert statements.count('COMMIT') == 2
+    assert len(sqlite3.connect(sqlite_file).execute('SELECT * FROM sqlitestore').fetchall()) == 4
+
+    store.finalize()
+    assert statements.count('COMMIT') == 3
+    assert len(sqlite3.connect(sqlite_file).execute('SELECT * FROM sqlitestore').fetchall()) == 5
+
+
+def test_finalize_identity_commits_old_transaction(sqlite_file: str) -> None:
+    store = get_sqlite_store(sqlite_file, MaxUncommittedSeconds=10)
+    store.save(Key(KeyType.DIMENSION, 'user1', 'state'), {'events': 1})
+    store.finalize_identity()
+    assert sqlite3.connect(sqlite_file).execute('SELECT * FROM sqlitestore').fetchall() == []
+
+    store.save(Key(KeyType.DIMENSION, 'user2', 'state'), {'events': 2})
+    with mock.patch('blurr.store.sqlite_store.time.monotonic', return_value=time.monotonic() + 10):
+        store.finalize_identity()
+    assert len(sqlite3.connect(sqlite_file).execute('SELECT * FROM sqlitestore').fetchall()) == 2